@@ -1,7 +1,6 @@
 import tkinter as tk
 import chessboard, openings, bot
-import time, random
-from PIL import Image, ImageTk
+import time, queue, threading
 
 #########################################
 
@@ -14,6 +13,8 @@ class GUI:
     COLOR2          = "#8B603D"
     HIGHLIGHT_COLOR = "#A87A30"
     THINK           = 2     # in seconds
+    POLL            = 50    # milliseconds between checks for messages of the search
+    PONDER          = True  # whether the bot searches while the human thinks
 
     selected_piece  = None
     focused         = None
@@ -26,14 +27,27 @@ class GUI:
         # initializes the variables
         self.state  = state
         self.parent = parent
+        # hashes of the positions of the game before the current one
+        self.history = []
         self.active_color = self.state.ac
 
         self.initialize_objects()
         self.initialize_graphics(parent)
 
-        # draws board and pieces
+        # the bot searches on a worker thread, so the window stays responsive. Tk may
+        # only be used from the main loop, so the search passes its progress and its
+        # move back through a queue, which the main loop polls
+        self.queue      = queue.Queue()
+        self.stop       = threading.Event()
+        self.thread     = None
+        self.pondering  = False
+        parent.after(self.POLL, self.poll)
+
+        # draws the board, and the pieces once the window is up, as loading
+        # their images is the slowest part of starting
         self.draw_board()
-        self.draw_pieces()
+        parent.after_idle(self.draw_pieces)
+        parent.after_idle(self.ponder)
 
         # adds click listener
         # change function to run_AI_against_AI to see AI in action against itself
@@ -45,14 +59,8 @@ class GUI:
         # initialize the Bot class
         self.bot = bot.Bot()
 
-        # initalize the Openings class
-        self.all_openings = openings.Openings().openings
-        open_index = random.randint(0, len(self.all_openings))
-        self.openings = self.all_openings[open_index]
-        self.open_limit = 2
-
-        # initialize the Kings class
-        self.kings = Kings(self.state, self.active_color)
+        # initalize the opening book
+        self.book = openings.Book()
 
     def initialize_graphics(self, parent) -> None:
         ''' Helper method to initialize the graphics '''
@@ -69,6 +77,8 @@ class GUI:
         self.bottom_frame = tk.Frame(parent, height = self.SQUARE_SIZE)
         self.info = tk.Label(self.bottom_frame, text = "", foreground = "#454440")
         self.info.pack(side = tk.RIGHT, padx = self.BOARD_SIZE, pady = self.BOARD_SIZE)
+        self.move_now_button = tk.Button(self.bottom_frame, text = "Move now", command = self.move_now, state = tk.DISABLED)
+        self.move_now_button.pack(side = tk.LEFT, padx = self.BOARD_SIZE, pady = self.BOARD_SIZE)
         self.bottom_frame.pack(fill = "x", side = tk.BOTTOM)
 
         # initializes canvas
@@ -77,10 +87,33 @@ class GUI:
         self.canvas = tk.Canvas(parent, width = canvas_width, height = canvas_height)
         self.canvas.pack(padx = self.SQUARE_SIZE, pady = self.SQUARE_SIZE)
 
+        # creates the items of the 64 squares and the pieces on them once. Redraws
+        # only change the items of squares that changed, so the number of items
+        # stays the same however long the game goes on
+        self.square_items   = []
+        self.piece_items    = []
+        for row in range(self.BOARD_SIZE):
+            for col in range(self.BOARD_SIZE):
+                x0, y0 = col * self.SQUARE_SIZE, row * self.SQUARE_SIZE
+                self.square_items.append(self.canvas.create_rectangle(
+                    x0, y0, x0 + self.SQUARE_SIZE, y0 + self.SQUARE_SIZE, outline = "", tags = "area"))
+                self.piece_items.append(self.canvas.create_image(
+                    x0 + self.SQUARE_SIZE // 2, y0 + self.SQUARE_SIZE // 2,
+                    anchor = tk.CENTER, state = tk.HIDDEN, tags = "occupied"))
+        # in order that pieces show in front of squares
+        self.canvas.tag_raise("occupied")
+        # what each square shows: its colour, and the image of its piece or None
+        self.square_colors  = [None] * 64
+        self.piece_files    = [None] * 64
+        self.draw_time      = 0     # seconds the last redraw of the pieces took
+
     def click_on_square(self, event) -> None:
         ''' Gets the square clicked and either moves a piece
         or selects the piece, revealing the available moves '''
 
+        # the pieces can't be moved while the bot thinks of its move
+        if self.thread is not None and not self.pondering:
+            return
         # initializes the values
         selected_col = int(event.x / self.SQUARE_SIZE)
         selected_row = 7 - int(event.y / self.SQUARE_SIZE)
@@ -117,209 +150,253 @@ class GUI:
     def step(self, start, end) -> None:
         ''' Moves a piece graphically and sets new state from movement '''
 
-        # find corresponding move in list of available moves
-        for move in self.available_moves:
+        # find corresponding move in list of possible moves
+        for move in self.state.generate_moves():
             if end == move.end and start == move.start:
 
                 # if after move made the king is in check, don't allow
-                if self.in_check_after_move(move):
+                if move not in self.available_moves:
                     raise In_Check
                 
                 def handle_move(move):
+                    # stop pondering, the bot's move is searched from the new position
+                    self.stop_search()
                     # move piece
-                    self.state = self.state.move(move)
-                    # initialize Kings (has to be before active color switch)
-                    self.kings = Kings(self.state, self.active_color)
-                    self.active_color = 0 if self.active_color == 1 else 1
+                    self.make_move(move)
                     self.draw_pieces()
 
-                def handle_bot():
-                    try:
-                        # move bot
-                        self.state = self.state.move(self.AI_move(self.state))
-                        self.active_color = 0 if self.active_color == 1 else 1
-                    except ChessException as error:
-                        self.info["text"] = error.__class__.__name__
-                    self.draw_pieces()
-                
                 # if pawn move is a promotion move
                 if (chessboard.A8 <= end <= chessboard.H8) and self.state.board[start].upper() == "P":
                     handle_move(chessboard.Move(start, end, "Q"))
-                    handle_bot()
-                    self.draw_pieces()
-                    break
-
-                handle_move(move)
-                # does opening move if possible
-                if not self.move_opening():
-                    handle_bot()
+                else:
+                    handle_move(move)
+                if not self.game_over():
+                    self.bot_turn()
                 break
 
     def draw_board(self) -> None:
-        ''' Draws the base chess board. '''
+        ''' Colours the squares of the chess board, highlighting the focused piece and its moves. '''
 
         colors = [self.COLOR1, self.COLOR2] # beige, brown
         for row in range(self.BOARD_SIZE):
             for col in range(self.BOARD_SIZE):
-                # calculate colors
+                # calculate colors, available moves are highlighted
                 color = colors[(row + col) % 2]
-                # calculate the position of each square
-                x0, y0 = col * self.SQUARE_SIZE, row * self.SQUARE_SIZE
-                x1, y1 = x0 + self.SQUARE_SIZE, y0 + self.SQUARE_SIZE
-                # draws available moves if exists
-                # else, draws all rectangles
-                self.canvas.create_rectangle(x0, y0, x1, y1, 
-                                            fill = color, 
-                                            outline = "",
-                                            tags = "area")
                 if (self.focused is not None and (row, col) in self.focused):
-                    self.canvas.create_rectangle(x0, y0, x1 - 1, y1 - 1, 
-                                            fill = self.HIGHLIGHT_COLOR,
-                                            outline = color,
-                                            tags = "area")
-        # in order that pieces show in front of squares
-        self.canvas.tag_raise("occupied")
-        self.canvas.tag_lower("area")
+                    color = self.HIGHLIGHT_COLOR
+                # only squares whose colour changed are updated
+                i = row * self.BOARD_SIZE + col
+                if self.square_colors[i] != color:
+                    self.canvas.itemconfigure(self.square_items[i], fill = color)
+                    self.square_colors[i] = color
 
     def draw_pieces(self) -> None:
-        ''' Draws the pieces onto the chessboard '''
+        ''' Draws the pieces onto the chessboard, updating only the squares whose piece changed '''
 
+        start_time = time.perf_counter()
         # generates the list of available moves everytime the pieces are redrawn
-        if self.active_color == 0: self.available_moves = list(self.state.generate_moves())
+        if self.active_color == 0: self.available_moves = self.state.legal_moves()
         # copy the state of the game board
         chessboard = self.state.board.replace(" ", "")
         chessboard = chessboard[::-1].swapcase() if self.active_color == 1 else chessboard
 
-        # visualize the chesboard 
-        self.canvas.delete("occupied")
+        # visualize the chesboard
         for i, piece in enumerate(chessboard):
-            if piece == ".":
-                continue
             # grab filename
-            if self.turn_start == 0: filename = "./data/chess_piece_icons/%s%s.png" % (piece.lower(), "white" if piece.isupper() else "black")
+            if piece == ".": filename = None
+            elif self.turn_start == 0: filename = "./data/chess_piece_icons/%s%s.png" % (piece.lower(), "white" if piece.isupper() else "black")
             else: filename = "./data/chess_piece_icons/%s%s.png" % (piece.lower(), "black" if piece.isupper() else "white")
-            row = i // 8 # from 0-7
-            col = i % 8 # from 0-7
+            if filename == self.piece_files[i]:
+                continue
+            self.piece_files[i] = filename
+            if filename is None:
+                self.canvas.itemconfigure(self.piece_items[i], state = tk.HIDDEN)
+                continue
             # check if filename is already instantiated
             if filename not in self.images:
+                # PIL is imported with the first image, as it is slow to import
+                from PIL import Image, ImageTk
                 raw_image = Image.open(filename)
                 resize_image = raw_image.resize((self.SQUARE_SIZE, self.SQUARE_SIZE))
                 self.images[filename] = ImageTk.PhotoImage(resize_image)
-            # coords for the image and move it to coords
-            x = (col * self.SQUARE_SIZE) + int(self.SQUARE_SIZE / 2)
-            y = (row * self.SQUARE_SIZE) + int(self.SQUARE_SIZE / 2)
-            self.canvas.create_image(x, y, image = self.images[filename], 
-                                    tags = "occupied", 
-                                    anchor = tk.CENTER)
+            self.canvas.itemconfigure(self.piece_items[i], image = self.images[filename], state = tk.NORMAL)
+        self.draw_time = time.perf_counter() - start_time
 
     ########################################
 
     def move_opening(self) -> bool:
-        ''' Opens with a random opening for variety '''
+        ''' Plays a random move of the opening book for variety, while the position is in the book '''
+
+        move = self.book.choose(self.state)
+        if move is None:
+            return False
+        self.make_move(move)
+        self.draw_pieces()
+        return True
+
+    def make_move(self, move) -> None:
+        ''' Plays the move, remembering the position before it for the repetition rule '''
+
+        self.history.append(self.state.hash)
+        self.state = self.state.move(move)
+        self.active_color = 0 if self.active_color == 1 else 1
+
+    def bot_turn(self) -> None:
+        ''' Plays a move of the opening book if possible, or else starts the bot searching for its move '''
+
+        if self.move_opening():
+            self.ponder()
+        else:
+            self.start_search(self.state)
+
+    def play_bot_move(self, move) -> None:
+        ''' Plays the move the search found, and ponders on the human's time '''
+
+        self.stop_search()
+        if move is None:
+            self.info["text"] = ChessException.__name__
+            return
+        self.make_move(move)
+        self.draw_pieces()
+        if not self.game_over():
+            self.ponder()
+
+    def game_over(self) -> bool:
+        ''' Shows whether the side to move is checkmated or stalemated, or the game is
+        drawn by threefold repetition or the fifty move rule '''
+
+        if not self.state.legal_moves():
+            self.info["text"] = (Checkmate if self.state.in_check() else Stalemate).__name__
+        elif self.state.clock >= 100 or self.history.count(self.state.hash) >= 2:
+            self.info["text"] = Draw.__name__
+        else:
+            return False
+        return True
+
+    def ponder(self) -> None:
+        ''' Searches the human's position until they move, filling the transposition
+        table with the positions the bot's reply will be searched from '''
+
+        if self.PONDER:
+            self.start_search(self.state, ponder = True)
+
+    def move_now(self) -> None:
+        ''' Stops the search, so the bot plays the best move found so far '''
+
+        if self.thread is not None and not self.pondering:
+            self.stop.set()
+
+    def start_search(self, state, ponder = False) -> None:
+        ''' Starts searching the state on the worker thread. A search for the bot's
+        move ends after THINK seconds, pondering only once stopped '''
+
+        self.stop_search()
+        self.stop.clear()
+        self.pondering = ponder
+        self.thread = threading.Thread(target = self.think, args = (state, list(self.history), ponder), daemon = True)
+        self.thread.start()
+        self.move_now_button["state"] = tk.DISABLED if ponder else tk.NORMAL
+
+    def stop_search(self) -> None:
+        ''' Stops the running search and waits for the worker thread to end '''
+
+        if self.thread is not None:
+            self.stop.set()
+            self.thread.join()
+            self.thread = None
+        self.pondering = False
+        self.move_now_button["state"] = tk.DISABLED
+
+    def poll(self) -> None:
+        ''' Handles the messages of the search, then polls again after POLL milliseconds '''
+
+        try:
+            while True:
+                kind, state, value = self.queue.get_nowait()
+                # messages about another position come from a search that was stopped
+                if state is not self.state:
+                    continue
+                if kind == "info":
+                    self.info["text"] = value
+                elif kind == "move":
+                    self.play_bot_move(value)
+        except queue.Empty:
+            pass
+        self.parent.after(self.POLL, self.poll)
+
+    def think(self, state, history, ponder) -> None:
+        ''' Searches the state on the worker thread, passing its progress and, unless
+        pondering, its best move back through the queue '''
 
-        result = False
-        nmove = None
-        if self.open_limit > 0:
-            for move in self.available_moves:
-                if move.end == self.openings[0][1 if self.turn_start == 0 else 0]:
-                    nmove = move
-                    result = True
-            self.open_limit -= 1
-            del self.openings[0]
-        if result:
-            self.state = self.state.move(nmove)
-            self.active_color = 0 if self.active_color == 1 else 1
-            self.draw_pieces()
-        return result
-
-    def AI_move(self, state) -> object:
-        ''' returns best move recommended by the AI '''
-        
-        best_move = None
         init_time = time.time()
-        # search for best move
-        for nodes, depth, gamma, score, move in self.bot.search(state):
-            
-            if score >= gamma:
-                if move is None:
-                    raise ChessException
-                # assign best move
-                best_move = chessboard.Move(move.start, move.end, move.promote)
-
-                self.info["text"] = ("depth:", depth, "positions:", nodes, "time:", round(time.time() - init_time, 2), "score:", score)
-            
-            # controls how long the bot will think for
-            if best_move and time.time() - init_time > self.THINK: break
-        
-        return best_move
-
-    def in_check_after_move(self, move) -> bool:
-        ''' Determines whether a move by you allows for check by opponent '''
-
-        # makes a copy of the state
-        state = self.state
-        # move that copy of the state
-        state = state.move(move)
-        kings = Kings(state, 0 if self.active_color == 1 else 1)
-        # if, after that move, you still are in check, return result
-        return kings.in_check()
+        fallback = None
+        pv, reported = [], None
+        for nodes, qnodes, depth, gamma, score, move in self.bot.search(
+            state, time_limit = None if ponder else self.THINK, stop = self.stop, history = history):
+            if score >= gamma and move is not None:
+                fallback = move
+            # the variation of the last depth searched to the end
+            if self.bot.result is not reported:
+                reported = self.bot.result
+                pv = self.principal_variation(state, reported[0])
+            elapsed = max(time.time() - init_time, 0.001)
+            self.queue.put(("info", state, "%sdepth %d  nodes %d  nps %d  score %d  pv %s" % (
+                "pondering  " if ponder else "", depth, nodes + qnodes, (nodes + qnodes) / elapsed, score, " ".join(pv))))
+        if ponder:
+            return
+
+        # prefer the move of the last depth searched to the end
+        move = self.bot.result[2] if self.bot.result is not None and self.bot.result[2] else fallback
+        if move is None:
+            # stopped before a move was found, or there is none to play
+            move = next(iter(state.legal_moves()), None)
+        self.queue.put(("move", state, move))
+
+    def principal_variation(self, state, depth) -> list:
+        ''' The best moves stored by the search from the state, in standard notation '''
+
+        pv = []
+        for move in self.bot.principal_variation(state, depth):
+            pv.append(chessboard.to_uci(move, state.ac))
+            state = state.move(move)
+        return pv
 
     def new_game_as_white(self) -> None:
         ''' Restarts the game and begins as white. '''
 
-        self.state = chessboard.BoardState(chessboard.INITIAL_STATE.board,
-                                        chessboard.INITIAL_STATE.value,
-                                        0,
-                                        chessboard.INITIAL_STATE.cr,
-                                        chessboard.INITIAL_STATE.ep,
-                                        chessboard.INITIAL_STATE.kp)
+        self.stop_search()
+        self.state = chessboard.BoardState(*chessboard.INITIAL_STATE)
+        self.history = []
         # reset variables
         self.turn_start         = 0
+        self.active_color       = 0
         self.selected_piece     = None
         self.focused            = None
         self.available_moves    = []
-
-        # openings
-        open_index = random.randint(0, len(self.all_openings))
-        self.openings = self.all_openings[open_index]
-        self.open_limit = 2
+        self.info["text"]       = ""
 
         self.draw_board()
         self.draw_pieces()
+        self.ponder()
 
     def new_game_as_black(self) -> None:
         ''' Begins new game as black and has the bot move first. '''
 
-        self.state = chessboard.BoardState(chessboard.INITIAL_STATE.board,
-                                        chessboard.INITIAL_STATE.value,
-                                        1,
-                                        chessboard.INITIAL_STATE.cr,
-                                        chessboard.INITIAL_STATE.ep,
-                                        chessboard.INITIAL_STATE.kp)
-        # reset variables
+        self.stop_search()
+        self.state = chessboard.BoardState(*chessboard.INITIAL_STATE)
+        self.history = []
+        # reset variables, the board is seen from black's side while white moves
         self.turn_start         = 1
+        self.active_color       = 1
         self.selected_piece     = None
         self.focused            = None
         self.available_moves    = []
-
-        # openings
-        open_index = random.randint(0, len(self.all_openings))
-        self.openings = self.all_openings[open_index]
-        self.open_limit = 2
-
-        # bot moves first as white
-        if not self.move_opening():
-            try:
-                # move bot
-                self.state = self.state.move(self.AI_move(self.state))
-            except ChessException as error:
-                self.info["text"] = error.__class__.__name__
-            self.active_color = 0 if self.active_color == 1 else 1 
-        
-        self.active_color = 0 if self.active_color == 1 else 1 
+        self.info["text"]       = ""
 
         self.draw_board()
         self.draw_pieces()
+        # bot moves first as white
+        self.bot_turn()
 
     # def run(self, event) -> None:
     #     ''' Runs the bot against itself. '''
@@ -337,30 +414,12 @@ class GUI:
 
 #########################################
 
-class Kings:
-    ''' Class to keep track of king position and check status '''
-
-    def __init__(self, state, icolor) -> None:
-
-        self.state = state
-        self.icolor = icolor
-        for index, piece in enumerate(state.board):
-            if piece == "K":
-                self.i_king = index
-            if piece == "k": 
-                self.o_king = index
-        # generating moves for UPPERCASE letters
-        self.available_moves = list(state.generate_moves())
-        
-    def in_check(self) -> bool:
-        ''' Check if own king is in check of opponent's pieces '''
-        
-        for x in self.available_moves:
-            if self.o_king == x.end: return True
-        return False
-
 class ChessException(Exception): pass
 
 class In_Check(ChessException): pass
 
-class Checkmate(ChessException): pass
\ No newline at end of file
+class Checkmate(ChessException): pass
+
+class Stalemate(ChessException): pass
+
+class Draw(ChessException): pass
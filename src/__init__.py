@@ -9,10 +9,5 @@ def main(state):
     root.mainloop()
 
 if __name__ == "__main__":
-    state = chessboard.BoardState(chessboard.INITIAL_STATE.board,
-                                chessboard.INITIAL_STATE.value,
-                                chessboard.INITIAL_STATE.ac,
-                                chessboard.INITIAL_STATE.cr,
-                                chessboard.INITIAL_STATE.ep,
-                                chessboard.INITIAL_STATE.kp)
+    state = chessboard.BoardState(*chessboard.INITIAL_STATE)
     main(state)
\ No newline at end of file
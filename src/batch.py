@@ -0,0 +1,198 @@
+''' Evaluation of many positions at once with NumPy, for offline work such as scoring the
+positions of a dataset, where the search's one position at a time costs the most. The
+results are the same as the scalar ones: values() is board_value, adjustments() is
+Evaluator.adjustment and points() is chessboard.points for each move. '''
+import numpy as np
+
+from chessboard import PIECE_SQUARE_TABLES, DIRECTIONS, A1, H1, A8, H8, N, E, S, W
+from evaluation import (PHASE, MAX_PHASE, DOUBLED, ISOLATED, PASSED_MG, PASSED_EG, MOBILITY,
+                        SHIELD, TROPISM, CLOSE, KING_ENDGAME)
+
+# Boards are encoded as (N, 64) int8 arrays from a8 to h1, as seen by the side to move:
+# 0 for an empty square, 1 to 6 for the pieces of the side to move and -1 to -6 for the
+# other side's. Rows count from the side to move's eighth rank, as the indexes of the
+# 120 char board do, so its pawns move to lower rows.
+PIECES      = "PNBRQK"
+PAD         = 7         # off the board, neither empty nor a piece of either side
+
+# SQUARES[square] - the index of the square on the 120 char board
+SQUARES = np.array([21 + 10 * row + column for row in range(8) for column in range(8)])
+ROWS = np.arange(8)
+
+# CODES[ord(char)] - the code of a char of the 120 char board
+CODES = np.full(256, PAD, dtype = np.int8)
+CODES[ord(".")] = 0
+for code, piece in enumerate(PIECES, 1):
+    CODES[ord(piece)] = code
+    CODES[ord(piece.lower())] = -code
+
+# TABLES[code, index] - the piece-square value of the piece of the side to move on the index
+TABLES = np.zeros((len(PIECES) + 1, 120), dtype = np.int64)
+for code, piece in enumerate(PIECES, 1):
+    TABLES[code] = PIECE_SQUARE_TABLES[piece]
+
+# VALUES[code + 6, square] - what a piece on the square adds to the value of the board
+VALUES = np.zeros((2 * len(PIECES) + 1, 64), dtype = np.int64)
+for code in range(1, len(PIECES) + 1):
+    VALUES[6 + code] = TABLES[code][SQUARES]
+    VALUES[6 - code] = -TABLES[code][119 - SQUARES]
+
+# Mobility is counted on boards widened to the 120 char layout, with a margin of PAD on
+# either side, so that the squares reached along a direction are a slice of the board
+MARGIN      = 80        # more than seven steps in any direction
+WIDTH       = 120 + 2 * MARGIN
+# INNER - the part of the widened board from a8 to h1, 78 indexes with the padding between the rows
+INNER       = slice(MARGIN + A8, MARGIN + H1 + 1)
+INNER_INDEXES = np.arange(A8, H1 + 1)
+CHUNK       = 1024      # boards scored at once
+
+# DISTANCE[square, i] - the number of king moves between the square and the index INNER_INDEXES[i]
+DISTANCE = np.maximum(abs(SQUARES[:, None] // 10 - INNER_INDEXES // 10), abs(SQUARES[:, None] % 10 - INNER_INDEXES % 10))
+# KING_ENDGAMES[square] - KING_ENDGAME of the square
+KING_ENDGAMES = np.array(KING_ENDGAME)[SQUARES]
+# passed pawn scores by row, for the pawns of the side to move and of the other side
+PASSED_OWN = np.array([PASSED_MG[8 - row] for row in ROWS]), np.array([PASSED_EG[8 - row] for row in ROWS])
+PASSED_OTHER = np.array([PASSED_MG[row + 1] for row in ROWS]), np.array([PASSED_EG[row + 1] for row in ROWS])
+
+def encode(boards) -> np.ndarray:
+    ''' Encodes 120 char boards, given as strs or lists, into an (N, 64) int8 array. '''
+    data = "".join(board if isinstance(board, str) else "".join(board) for board in boards)
+    chars = np.frombuffer(data.encode("ascii"), dtype = np.uint8).reshape(-1, 120)
+    return CODES[chars[:, SQUARES]]
+
+def values(pieces) -> np.ndarray:
+    ''' The material and piece-square value of each encoded board, as board_value. '''
+    return VALUES[pieces.astype(np.intp) + 6, np.arange(64)].sum(axis = 1)
+
+def pawn_structures(pieces) -> tuple:
+    ''' The doubled, isolated and passed pawn scores of each board, as pawn_structure. '''
+    own, other = pieces.reshape(-1, 8, 8) == 1, pieces.reshape(-1, 8, 8) == -1
+    mg = eg = 0
+    for pawns, sign in ((own, 1), (other, -1)):
+        files = pawns.sum(axis = 1)
+        doubled = np.maximum(files - 1, 0).sum(axis = 1)
+        beside = np.pad(files, ((0, 0), (1, 1)))
+        isolated = (files * ((beside[:, :-2] == 0) & (beside[:, 2:] == 0))).sum(axis = 1)
+        mg = mg + sign * (DOUBLED[0] * doubled + ISOLATED[0] * isolated)
+        eg = eg + sign * (DOUBLED[1] * doubled + ISOLATED[1] * isolated)
+
+    # a pawn of the side to move is passed if no pawn of the other side is on a lower
+    # row of its file or the files beside it, and the other way around
+    front = np.pad(np.where(other, ROWS[:, None], 8).min(axis = 1), ((0, 0), (1, 1)), constant_values = 8)
+    front = np.minimum(np.minimum(front[:, :-2], front[:, 1:-1]), front[:, 2:])
+    passed = own & (front[:, None, :] >= ROWS[:, None])
+    mg = mg + (passed * PASSED_OWN[0][:, None]).sum(axis = (1, 2))
+    eg = eg + (passed * PASSED_OWN[1][:, None]).sum(axis = (1, 2))
+    back = np.pad(np.where(own, ROWS[:, None], -1).max(axis = 1), ((0, 0), (1, 1)), constant_values = -1)
+    back = np.maximum(np.maximum(back[:, :-2], back[:, 1:-1]), back[:, 2:])
+    passed = other & (back[:, None, :] <= ROWS[:, None])
+    mg = mg - (passed * PASSED_OTHER[0][:, None]).sum(axis = (1, 2))
+    eg = eg - (passed * PASSED_OTHER[1][:, None]).sum(axis = (1, 2))
+    return mg, eg
+
+def widen(pieces) -> np.ndarray:
+    ''' Lays the encoded boards out as 120 char boards, with the margin on either side. '''
+    wide = np.full((len(pieces), WIDTH), PAD, dtype = np.int8)
+    wide[:, MARGIN + SQUARES] = pieces
+    return wide
+
+def reaches(wide) -> dict:
+    ''' Returns, for each direction of the sliding pieces and the knight, the number of
+    squares a piece of either side could move to in it from each index of INNER: as
+    (own, other) arrays of shape (N, 78). '''
+    counts = {}
+    for piece, steps in (("Q", 7), ("N", 1)):
+        for d in DIRECTIONS[piece]:
+            own = np.zeros((len(wide), INNER.stop - INNER.start), dtype = np.int8)
+            other = own.copy()
+            clear = None
+            for step in range(1, steps + 1):
+                target = wide[:, INNER.start + step * d : INNER.stop + step * d]
+                # empty or of the other side: <= 0 for the side to move, and as unsigned
+                # bytes, which the negative codes are too large to be, < PAD for the other
+                own_moves, other_moves = target <= 0, target.view(np.uint8) < PAD
+                if clear is not None:
+                    own_moves &= clear
+                    other_moves &= clear
+                own += own_moves
+                other += other_moves
+                clear = target == 0 if clear is None else clear & (target == 0)
+            counts[d] = own, other
+    return counts
+
+def adjustments(pieces) -> np.ndarray:
+    ''' Scores each encoded board on top of its value, as Evaluator.adjustment. '''
+    # in chunks, for the arrays of each to stay in the cache
+    return np.concatenate([_adjustments(pieces[i : i + CHUNK]) for i in range(0, len(pieces), CHUNK)]
+                          or [np.zeros(0, dtype = np.int64)])
+
+def _adjustments(pieces) -> np.ndarray:
+    wide = widen(pieces)
+    inner = wide[:, INNER]
+    own_king, other_king = (pieces == 6).argmax(axis = 1), (pieces == -6).argmax(axis = 1)
+    mg, eg = pawn_structures(pieces)
+
+    counts = reaches(wide)
+    for piece in "BR":
+        counts[piece] = tuple(sum(counts[d][side] for d in DIRECTIONS[piece]) for side in (0, 1))
+    counts["Q"] = tuple(bishop + rook for bishop, rook in zip(counts["B"], counts["R"]))
+    counts["N"] = tuple(sum(counts[d][side] for d in DIRECTIONS["N"]) for side in (0, 1))
+    closeness = (np.maximum(CLOSE - DISTANCE[other_king], 0), np.maximum(CLOSE - DISTANCE[own_king], 0))
+    phase = 0
+    for code, piece in enumerate(PIECES[1 : 5], 2):
+        weight_mg, weight_eg, usual = MOBILITY[piece]
+        for side, sign in ((0, 1), (1, -1)):
+            placed = inner == sign * code
+            number = placed.sum(axis = 1)
+            moves = (placed * counts[piece][side]).sum(axis = 1) - usual * number
+            close = (placed * closeness[side]).sum(axis = 1)
+            phase = phase + PHASE[piece] * number
+            mg = mg + sign * (weight_mg * moves + TROPISM[piece] * close)
+            eg = eg + sign * weight_eg * moves
+
+    # pawn shields, the other side's pawns ahead of its king at higher indexes
+    rows = np.arange(len(pieces))
+    own_index, other_index = MARGIN + SQUARES[own_king], MARGIN + SQUARES[other_king]
+    for d in (N + W, N, N + E):
+        mg = mg + np.where(wide[rows, own_index + d] == 1, SHIELD[0],
+                           np.where(wide[rows, own_index + d + N] == 1, SHIELD[1], 0))
+        mg = mg - np.where(wide[rows, other_index - d] == -1, SHIELD[0],
+                           np.where(wide[rows, other_index - d + S] == -1, SHIELD[1], 0))
+    eg = eg + KING_ENDGAMES[own_king] - KING_ENDGAMES[63 - other_king]
+
+    # rounded towards zero, as int() of the scalar division
+    phase = np.minimum(phase, MAX_PHASE)
+    total = mg * phase + eg * (MAX_PHASE - phase)
+    return np.sign(total) * (np.abs(total) // MAX_PHASE)
+
+def evaluate(boards) -> np.ndarray:
+    ''' Scores the 120 char boards for the side to move, as Evaluator.evaluate. '''
+    pieces = encode(boards)
+    return values(pieces) + adjustments(pieces)
+
+#########################################
+
+def points(board, ep, kp, codes) -> np.ndarray:
+    ''' Scores the moves of a 120 char board, given as packed ints, as chessboard.points
+    does each of them. '''
+    if not isinstance(board, str):
+        board = "".join(board)
+    codes = np.asarray(codes, dtype = np.int64)
+    start, end, promotion = codes >> 10, codes >> 3 & 127, codes & 7
+    board = CODES[np.frombuffer(board.encode("ascii"), dtype = np.uint8)].astype(np.intp)
+    moved, taken = board[start], board[end]
+
+    value = TABLES[moved, end] - TABLES[moved, start]
+    # captures, the codes of the other side being negative
+    value += TABLES[np.clip(-taken, 0, None), 119 - end]
+    # takes the king passant square, after castling
+    value += np.where(abs(end - kp) < 2, TABLES[6, 119 - end], 0)
+    # the rook of a castle
+    castle = (moved == 6) & (abs(start - end) == 2)
+    value += np.where(castle, TABLES[4, (start + end) // 2] - TABLES[4, np.where(end < start, A1, H1)], 0)
+    # promotions, the index of PROMOTIONS being one less than the code
+    pawn = moved == 1
+    promote = pawn & (A8 <= end) & (end <= H8)
+    value += np.where(promote, TABLES[promotion + 1, end] - TABLES[1, end], 0)
+    value += np.where(pawn & (end == ep), TABLES[1, 119 - (end + S)], 0)
+    return value
@@ -0,0 +1,369 @@
+from collections import namedtuple
+from chessboard import (PIECE_SQUARE_TABLES, A1, H1, A8, H8, N, E, S, W,
+                        decode_move, legal_moves, CASTLING_RIGHTS, ZOBRIST_PIECES, ZOBRIST_CASTLING, ZOBRIST_EP,
+                        ZOBRIST_KP, ZOBRIST_SIDE)
+
+# squares are numbered 0 - 63 from a1 to h8, rank by rank:
+#
+# 56 57 58 59 60 61 62 63
+# 48 49 50 51 52 53 54 55
+# ...
+#  0  1  2  3  4  5  6  7
+#
+# pieces are stored as 12 bitboards, indexed by color * 6 + piece type
+
+PIECES = "PNBRQK"
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+
+##############################################
+
+# TO_INDEX[ac][square] - 120 char board index of a square, as seen by the active color
+TO_INDEX = (
+    tuple(A1 + (sq & 7) * E + (sq >> 3) * N for sq in range(64)),
+    tuple(119 - (A1 + (sq & 7) * E + (sq >> 3) * N) for sq in range(64)),
+)
+# FROM_INDEX[ac][index] - square of a 120 char board index, -1 if off the board
+FROM_INDEX = tuple(
+    tuple(to_index.index(i) if i in to_index else -1 for i in range(120))
+    for to_index in TO_INDEX
+)
+
+# the 120 char board without pieces, the same as seen by either color
+EMPTY_BOARD = tuple("." if i in TO_INDEX[0] else " " for i in range(120))
+
+def _step_attacks(steps) -> tuple:
+    ''' Helper method to build the attack table of a non-sliding piece. '''
+
+    table = []
+    for sq in range(64):
+        attacks = 0
+        for df, dr in steps:
+            f, r = (sq & 7) + df, (sq >> 3) + dr
+            if 0 <= f < 8 and 0 <= r < 8:
+                attacks |= 1 << (r * 8 + f)
+        table.append(attacks)
+    return tuple(table)
+
+def _ray(df, dr) -> tuple:
+    ''' Helper method to build the table of rays leaving each square in one direction. '''
+
+    table = []
+    for sq in range(64):
+        ray = 0
+        f, r = (sq & 7) + df, (sq >> 3) + dr
+        while 0 <= f < 8 and 0 <= r < 8:
+            ray |= 1 << (r * 8 + f)
+            f, r = f + df, r + dr
+        table.append(ray)
+    return tuple(table)
+
+KNIGHT_ATTACKS = _step_attacks(((1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)))
+KING_ATTACKS = _step_attacks(((0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1), (-1, 0), (-1, 1)))
+# PAWN_ATTACKS[color][square] - squares a pawn of that color attacks
+PAWN_ATTACKS = (_step_attacks(((-1, 1), (1, 1))), _step_attacks(((-1, -1), (1, -1))))
+
+# rays, paired with whether they run towards higher squares
+# (so that the nearest blocker is the lowest or the highest set bit)
+ROOK_RAYS = ((_ray(0, 1), True), (_ray(1, 0), True), (_ray(0, -1), False), (_ray(-1, 0), False))
+BISHOP_RAYS = ((_ray(1, 1), True), (_ray(-1, 1), True), (_ray(1, -1), False), (_ray(-1, -1), False))
+QUEEN_RAYS = ROOK_RAYS + BISHOP_RAYS
+
+def slide(sq, occupied, rays) -> int:
+    ''' Returns the squares a sliding piece attacks, stopping at the first blocker on each ray. '''
+
+    attacks = 0
+    for table, positive in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            # cut the ray off behind the nearest blocker
+            first = (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+            ray ^= table[first]
+        attacks |= ray
+    return attacks
+
+def squares(bitboard):
+    ''' Yields the squares set in a bitboard. '''
+
+    while bitboard:
+        low = bitboard & -bitboard
+        yield low.bit_length() - 1
+        bitboard ^= low
+
+##############################################
+
+# initializes data structure for a bitboard state
+BitState = namedtuple("BitState", "pieces occupied value ac cr ep kp hash clock fullmove", defaults = (0, 1))
+# pieces - tuple of 12 bitboards, WHITE pieces first
+# occupied - tuple of the white and black occupancy bitboards
+# value, ac, cr, ep, kp, hash, clock, fullmove - as in chessboard.State, with ep and kp
+#                               as 120 char board indexes of the active color
+
+class BitBoardState(BitState):
+    ''' Bitboard backed position, interchangeable with chessboard.BoardState.
+    Moves use the same 120 char board indexes as BoardState, as seen by the active color. '''
+
+    @classmethod
+    def from_state(cls, state):
+        ''' Converts a state of any backend into a bitboard state. '''
+        if isinstance(state, cls):
+            return state
+        pieces = [0] * 12
+        from_index = FROM_INDEX[state.ac]
+        for index, piece in enumerate(state.board):
+            if piece.isalpha():
+                color = state.ac if piece.isupper() else 1 - state.ac
+                pieces[color * 6 + PIECES.index(piece.upper())] |= 1 << from_index[index]
+        return cls(tuple(pieces), _occupancy(pieces), state.value, state.ac, state.cr, state.ep, state.kp, state.hash, state.clock, state.fullmove)
+
+    @property
+    def board(self) -> str:
+        ''' The 120 char board as seen by the active color. '''
+        board = list(EMPTY_BOARD)
+        to_index = TO_INDEX[self.ac]
+        for i, bitboard in enumerate(self.pieces):
+            piece = PIECES[i % 6] if i // 6 == self.ac else PIECES[i % 6].lower()
+            for sq in squares(bitboard):
+                board[to_index[sq]] = piece
+        return "".join(board)
+
+    def piece_at(self, sq, color) -> str:
+        ''' Returns the piece type of a color on a square, or "" if there is none. '''
+        bit = 1 << sq
+        if self.occupied[color] & bit:
+            pieces = self.pieces
+            for t in range(color * 6, color * 6 + 6):
+                if pieces[t] & bit:
+                    return PIECES[t % 6]
+        return ""
+
+    def generate_moves(self, captures = False):
+        ''' Returns list of available moves for the active color. With captures, only
+        the moves chessboard.is_capture accepts. '''
+        codes = []
+        self.generate_codes(codes, captures)
+        return [decode_move(code) for code in codes]
+
+    def generate_codes(self, out, captures = False) -> None:
+        ''' Appends the moves of generate_moves to out, packed as chessboard.encode_move. '''
+        append = out.append
+        ac = self.ac
+        pieces = self.pieces
+        own, opp = self.occupied[ac], self.occupied[1 - ac]
+        occupied = own | opp
+        to_index = TO_INDEX[ac]
+        base = ac * 6
+
+        # pawns
+        forward = 8 if ac == 0 else -8
+        double_rank, promotion_rank = (0x000000000000FF00, 0xFF00000000000000) if ac == 0 \
+                                      else (0x00FF000000000000, 0x00000000000000FF)
+        # pawns may also take on the en passant and king passant squares
+        targets, passant = opp, 0
+        if self.ep or self.kp:
+            from_index = FROM_INDEX[ac]
+            for index in (self.kp, self.kp - 1, self.kp + 1):
+                if self.kp and from_index[index] >= 0:
+                    passant |= 1 << from_index[index]
+            if self.ep:
+                targets |= 1 << from_index[self.ep]
+            targets = (targets | passant) & ~own
+        for sq in squares(pieces[base + PAWN]):
+            ends = PAWN_ATTACKS[ac][sq] & targets
+            push = sq + forward
+            if captures:
+                # only pushes that promote
+                if not (occupied >> push) & 1 and (promotion_rank >> push) & 1:
+                    ends |= 1 << push
+            elif not (occupied >> push) & 1:
+                ends |= 1 << push
+                if (double_rank >> sq) & 1 and not (occupied >> (push + forward)) & 1:
+                    ends |= 1 << (push + forward)
+            start = to_index[sq] << 10
+            for end in squares(ends):
+                if (promotion_rank >> end) & 1:
+                    for promotion in (1, 2, 3, 4):
+                        append(start | to_index[end] << 3 | promotion)
+                else:
+                    append(start | to_index[end] << 3)
+
+        # pieces
+        allowed = (opp | passant) & ~own if captures else ~own
+        for t in (KNIGHT, BISHOP, ROOK, QUEEN, KING):
+            for sq in squares(pieces[base + t]):
+                if t == KNIGHT: ends = KNIGHT_ATTACKS[sq]
+                elif t == BISHOP: ends = slide(sq, occupied, BISHOP_RAYS)
+                elif t == ROOK: ends = slide(sq, occupied, ROOK_RAYS)
+                elif t == QUEEN: ends = slide(sq, occupied, QUEEN_RAYS)
+                else: ends = KING_ATTACKS[sq]
+                start = to_index[sq] << 10
+                for end in squares(ends & allowed):
+                    append(start | to_index[end] << 3)
+
+        if captures:
+            return
+
+        # castling, with the rook's path to the king clear
+        rights = CASTLING_RIGHTS[ac]
+        for corner, step, right in ((A1, E, rights[0]), (H1, W, rights[1])):
+            if right not in self.cr or self.board_piece(corner) != "R":
+                continue
+            index = corner + step
+            while self.board_piece(index) == ".":
+                if self.board_piece(index + step) == "K":
+                    append((index + step) << 10 | (index - step) << 3)
+                    break
+                index += step
+
+    def generate_captures(self):
+        ''' Returns the captures and promotions among the available moves. '''
+        return self.generate_moves(captures = True)
+
+    def generate_capture_codes(self, out) -> None:
+        ''' Appends the captures and promotions to out as packed ints. '''
+        self.generate_codes(out, captures = True)
+
+    def legal_moves(self) -> list:
+        ''' Returns the available moves that don't leave the king in check. '''
+        return legal_moves(self)
+
+    def board_piece(self, index) -> str:
+        ''' Returns the char at a 120 char board index, as in BoardState.board. '''
+        sq = FROM_INDEX[self.ac][index]
+        if sq < 0:
+            return " "
+        piece = self.piece_at(sq, self.ac)
+        if piece:
+            return piece
+        return self.piece_at(sq, 1 - self.ac).lower() or "."
+
+    def move(self, move):
+        ''' Performs the move of a piece from one index to another '''
+        # initialize values
+        start, end, promotion = move
+        ac, op = self.ac, 1 - self.ac
+        from_index = FROM_INDEX[ac]
+        s, e = from_index[start], from_index[end]
+        pieces = list(self.pieces)
+        piece_start = self.piece_at(s, ac)
+        piece_end = self.piece_at(e, op)
+        score = self.value + self.points(move)
+
+        # reset all the values
+        en_passant, king_passant = 0, 0
+
+        # move the piece, updating the hash with the pieces that move
+        keys = ZOBRIST_PIECES[ac]
+        h = self.hash ^ keys[piece_start][start] ^ keys[piece_start][end]
+        pieces[ac * 6 + PIECES.index(piece_start)] ^= (1 << s) | (1 << e)
+        if piece_end:
+            pieces[op * 6 + PIECES.index(piece_end)] ^= 1 << e
+            h ^= keys[piece_end.lower()][end]
+
+        # castling -
+        castling_rights = self.cr
+        own_a1, own_h1, opp_a8, opp_h8 = CASTLING_RIGHTS[ac]
+        # if we move our rook
+        if start == A1: castling_rights = castling_rights.replace(own_a1, "")
+        if start == H1: castling_rights = castling_rights.replace(own_h1, "")
+        # if we capture opponent's rook
+        if end == A8: castling_rights = castling_rights.replace(opp_a8, "")
+        if end == H8: castling_rights = castling_rights.replace(opp_h8, "")
+        # if king moves
+        if piece_start == "K":
+            castling_rights = castling_rights.replace(own_a1, "").replace(own_h1, "")
+            # sets king passant square
+            if abs(end - start) == 2:
+                king_passant = (start + end) // 2
+                rook = A1 if end < start else H1
+                pieces[ac * 6 + ROOK] ^= (1 << from_index[rook]) | (1 << from_index[king_passant])
+                h ^= keys["R"][rook] ^ keys["R"][king_passant]
+
+        # pawn movement, promotion and en passant
+        if piece_start == "P":
+            if A8 <= end <= H8:
+                pieces[ac * 6 + PAWN] ^= 1 << e
+                pieces[ac * 6 + PIECES.index(promotion)] |= 1 << e
+                h ^= keys["P"][end] ^ keys[promotion][end]
+            if (end + S) == (start + N):
+                en_passant = start + N
+            if end == self.ep:
+                # takes en passant square
+                pieces[op * 6 + PAWN] ^= 1 << from_index[self.ep + S]
+                h ^= keys["p"][self.ep + S]
+
+        # update the hash with the castling rights, passant squares and side to move
+        if castling_rights != self.cr:
+            for c in set(castling_rights).symmetric_difference(self.cr):
+                h ^= ZOBRIST_CASTLING.get(c, 0)
+        h ^= ZOBRIST_EP[ac][self.ep] ^ ZOBRIST_EP[ac][en_passant]
+        h ^= ZOBRIST_KP[ac][self.kp] ^ ZOBRIST_KP[ac][king_passant]
+        h ^= ZOBRIST_SIDE
+
+        # captures and pawn moves reset the halfmove clock
+        clock = 0 if piece_start == "P" or piece_end else self.clock + 1
+
+        # the board is absolute, so passing the turn only changes the point of view
+        ep = 119 - en_passant if en_passant else 0
+        kp = 119 - king_passant if king_passant else 0
+        return BitBoardState(tuple(pieces), _occupancy(pieces), -score, op, castling_rights, ep, kp, h, clock, self.fullmove + ac)
+
+    def rotate(self, nullmove = False):
+        ''' Rotates the board, negates the score, keeps the castling rights, and
+        preserves en passant and king passant, as BoardState.rotate. Only a null move
+        passes the turn, otherwise the pieces are turned around and change colors so
+        that the same color is to move on the board seen by the other side '''
+        ep = 119 - self.ep if self.ep and not nullmove else 0
+        kp = 119 - self.kp if self.kp and not nullmove else 0
+        if nullmove:
+            # the board is absolute, so passing the turn only changes the point of view
+            h = self.hash ^ ZOBRIST_EP[self.ac][self.ep] ^ ZOBRIST_KP[self.ac][self.kp] ^ ZOBRIST_SIDE
+            return BitBoardState(self.pieces, self.occupied, -self.value, 1 - self.ac, self.cr, ep, kp, h,
+                                 0, self.fullmove + self.ac)
+        pieces = tuple(_turn(bitboard) for bitboard in self.pieces[6:] + self.pieces[:6])
+        return BitBoardState(pieces, _occupancy(pieces), -self.value, self.ac, self.cr, ep, kp, self.hash,
+                             self.clock, self.fullmove)
+
+    def points(self, move) -> int:
+        ''' Score the value of the move '''
+        start, end, promotion = move
+        from_index = FROM_INDEX[self.ac]
+        p_start = self.piece_at(from_index[start], self.ac)
+        p_end = self.piece_at(from_index[end], 1 - self.ac)
+
+        # finds move in the pst boards
+        value = PIECE_SQUARE_TABLES[p_start][end] - PIECE_SQUARE_TABLES[p_start][start]
+
+        # captures a piece
+        if p_end:
+            value += PIECE_SQUARE_TABLES[p_end][119 - end]
+
+        # checks if castled
+        if abs(end - self.kp) < 2:
+            value += PIECE_SQUARE_TABLES["K"][119 - end]
+
+        # castle
+        if p_start == "K" and abs(start - end) == 2:
+            value += PIECE_SQUARE_TABLES["R"][(start + end) // 2]
+            value -= PIECE_SQUARE_TABLES["R"][A1 if end < start else H1]
+
+        # pawn promotion and enpassant
+        if p_start == "P":
+            if A8 <= end <= H8:
+                value += PIECE_SQUARE_TABLES[promotion][end] - PIECE_SQUARE_TABLES["P"][end]
+            if end == self.ep:
+                value += PIECE_SQUARE_TABLES["P"][119 - (end + S)]
+
+        return value
+
+def _turn(bitboard) -> int:
+    ''' Helper method to turn a bitboard around, moving each square to 63 - square. '''
+
+    return int(format(bitboard, "064b")[::-1], 2)
+
+def _occupancy(pieces) -> tuple:
+    ''' Helper method to combine the piece bitboards into white and black occupancy. '''
+
+    white = pieces[0] | pieces[1] | pieces[2] | pieces[3] | pieces[4] | pieces[5]
+    black = pieces[6] | pieces[7] | pieces[8] | pieces[9] | pieces[10] | pieces[11]
+    return (white, black)
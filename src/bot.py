@@ -1,96 +1,613 @@
-from chessboard import PIECE
+import time
+from array import array
+from chessboard import (PIECE, MOVE_BITS, MOVE_MASK, BoardState, SearchPosition, StateStack,
+                        see, is_capture, in_check, legal_moves, encode_move, decode_move, to_uci)
+from evaluation import Evaluator
+from transposition import TranspositionTable, SharedTranspositionTable, LOWER, UPPER
 
 MATE_LOWER_BOUND = PIECE["K"] - 10 * PIECE["Q"]
 MATE_UPPER_BOUND = PIECE["K"] + 10 * PIECE["Q"]
+# added to exchange values to pack them above a move as a sort key
+SEE_OFFSET = 1 << 20
+
+class SearchStopped(Exception):
+    ''' Raised inside the search once its time, node limit or stop signal is reached. '''
+
+def allocate_time(time_left, increment = 0, moves_to_go = None) -> float:
+    ''' Time policy for clock games: seconds to think about the next move, given the
+    seconds left on the clock, the increment per move and the moves until the next
+    time control (or None if the rest of the game must be played on this clock). '''
+    # assume a sudden death game still has about 30 moves to go
+    moves = min(moves_to_go, 30) if moves_to_go else 30
+    budget = time_left / (moves + 1) + increment * 0.8
+    # always keep a reserve for the rest of the game and for move overhead
+    return max(0.01, min(budget, time_left * 0.5 - 0.05))
+
+def victim_value(board, ep, kp, move) -> int:
+    ''' Material a capture or promotion wins, before any recapture. '''
+    start, end, promotion = move
+    # taking the king passant square takes the king
+    if kp and abs(end - kp) < 2:
+        return PIECE["K"]
+    target = board[end]
+    value = PIECE[target.upper()] if target.islower() else (PIECE["P"] if end == ep else 0)
+    if promotion:
+        value += PIECE[promotion] - PIECE["P"]
+    return value
+
+def processes():
+    ''' Returns the multiprocessing context that starts the helpers of a parallel search.
+    They are started by a server process, as forking the thread a search may run on
+    could copy locks held by other threads. multiprocessing is imported here, as it is
+    slow to import and only parallel searches need it '''
+    import multiprocessing
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["bot"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+def bitboard_position(state):
+    ''' Builds a bitboard position, importing its tables on first use. '''
+    from bitboard import BitBoardState
+    return StateStack(BitBoardState.from_state(state))
+
+# board representations the search can run on, each turned into a position
+# the search changes in place with make_move / unmake_move
+BACKENDS = {
+    "mailbox":  SearchPosition,
+    "string":   lambda state: StateStack(BoardState.from_state(state)),
+    "bitboard": bitboard_position,
+}
+
+class SearchStats:
+    ''' Counters of one iteration of the search, to the depth. Times are in seconds, and
+    the time spent generating moves and evaluating is only measured by a bot made with
+    time_phases = True '''
+
+    COUNTERS = ("nodes", "qnodes", "tt_probes", "tt_hits", "tt_cutoffs", "cutoffs", "first_cutoffs",
+                "researches", "max_ply", "time", "movegen_time", "eval_time")
+    __slots__ = COUNTERS + ("depth", "score", "move", "branching_factor")
+
+    def __init__(self, depth = 0) -> None:
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        self.depth = depth
+        self.score = None
+        self.move = None
+        # nodes of the iteration over the nodes of the one before it
+        self.branching_factor = None
+
+    def to_dict(self) -> dict:
+        ''' Returns the counters, and the rates derived from them, as a dict for JSON '''
+        nodes = self.nodes + self.qnodes
+        return {
+            "depth":                    self.depth,
+            "score":                    self.score,
+            "move":                     self.move,
+            "nodes":                    self.nodes,
+            "qnodes":                   self.qnodes,
+            "nps":                      round(nodes / max(self.time, 1e-6)),
+            "time":                     round(self.time, 4),
+            "tt_probes":                self.tt_probes,
+            "tt_hit_rate":              round(self.tt_hits / max(self.tt_probes, 1), 4),
+            "tt_cutoff_rate":           round(self.tt_cutoffs / max(self.tt_probes, 1), 4),
+            "cutoffs":                  self.cutoffs,
+            "first_move_cutoff_rate":   round(self.first_cutoffs / max(self.cutoffs, 1), 4),
+            "branching_factor":         None if self.branching_factor is None else round(self.branching_factor, 3),
+            "researches":               self.researches,
+            "max_ply":                  self.max_ply,
+            "movegen_time":             round(self.movegen_time, 4),
+            "eval_time":                round(self.eval_time, 4),
+            "search_time":              round(self.time - self.movegen_time - self.eval_time, 4),
+        }
 
 class Bot:
 
-    def __init__(self) -> None:
+    QS_DELTA        = 200   # margin over a capture's exchange value before it is skipped
+    LAZY_MARGIN     = 200   # how far the incremental value may be from gamma before it stands for the evaluation
+    MAX_PLY         = 128   # deepest ply that keeps killer moves
+    NULL_REDUCTION  = 2     # extra depth taken off the search after a null move
+    LMR_MOVES       = 3     # moves searched at full depth before late moves are reduced
+    LMR_REDUCTION   = 1     # extra depth taken off a late quiet move
+    FUTILITY_MARGIN = (0, 0, 240)   # by depth, how far short of gamma a move may be before it is pruned
+    CHECK_EVERY     = 256   # nodes between checks of the time, node limit and stop signal
+
+    def __init__(self, hash_size = 16, backend = "mailbox", workers = 1,
+                null_move = True, late_move_reductions = True, futility = True, evaluation = True,
+                time_phases = False) -> None:
         self.nodes          = 0
+        self.qnodes         = 0
         self.state          = None
-        self.variated_moves = {}
+        # processes searching in parallel, which share the transposition table
+        self.workers        = workers
+        # transposition table, hash_size in MB
+        self.tt             = SharedTranspositionTable(hash_size) if workers > 1 else TranspositionTable(hash_size)
+        # board representation used while searching
+        self.backend        = backend
+        # move ordering: two killer moves per ply, and history scores by piece and end index
+        self.killers        = [[None, None] for _ in range(self.MAX_PLY)]
+        self.history        = {piece: [0] * 120 for piece in "PNBRQK"}
+        # the moves of a position are generated into this buffer, and copied out
+        # before the search goes deeper, so one buffer serves every ply
+        self.buffer         = array("i")
+        # pruning, each can be switched off to measure its effect
+        self.null_move              = null_move
+        self.late_move_reductions   = late_move_reductions
+        self.futility               = futility
+        # the tapered evaluation at the horizon, or only the incremental value if off
+        self.evaluation             = evaluation
+        self.evaluator              = Evaluator()
+        # limits of the running search
+        self.depth_limit    = None
+        self.deadline       = None
+        self.node_limit     = None
+        self.stop           = None
+        # (depth, score, move) of the last iteration the search completed
+        self.result         = None
+        # counters of the running iteration, and those of the iterations completed
+        self.stats          = SearchStats()
+        self.iterations     = []
+        # whether to time the move generation and evaluation, which slows the search
+        self.time_phases    = time_phases
+        # (start, stop) pairs of functions, called when the search starts or resumes
+        # and when it stops or hands a result back, to profile the search alone
+        self.hooks          = []
+        # the legal moves of the position searched, packed
+        self.root_moves     = set()
+        # hashes of the positions before the one searched, and how many of them the game played
+        self.hashes         = []
+        self.root_ply       = 0
         
-    def alphabeta(self, state, g, depth):
+    def alphabeta(self, pos, g, depth, can_null = True):
         ''' an alphabeta function designed for recursively going through every possible
-         chess move and finding the best move '''
+         chess move and finding the best move. pos is changed in place while searching
+         and restored before returning '''
         
         # to make sure we still have a king
-        if -MATE_LOWER_BOUND > state.value:
+        if -MATE_LOWER_BOUND > pos.value:
             # the other side has won
             return -MATE_UPPER_BOUND
+
+        # a repetition or the fifty move rule ends the game in a draw
+        if self.is_draw(pos):
+            return 0
+
+        # at the horizon, only resolve captures
+        if depth <= 0:
+            return self.quiesce(pos, g)
         
         self.nodes += 1
+        if self.nodes % self.CHECK_EVERY == 0: self.check_limits()
         v_low = 40 - depth * 140
-        
-        def strongest_move():
 
-            # look for strongest move from the last move
-            strongest_move = self.variated_moves.get(state)
-
-            if not strongest_move and depth > 2:
-                self.alphabeta(state, g, depth - 3)
-                strongest_move = self.variated_moves.get(state)
+        # cut off if an earlier search of this position already decides the bound
+        stats = self.stats
+        stats.tt_probes += 1
+        entry = self.tt.probe(pos.hash)
+        if entry is not None:
+            stats.tt_hits += 1
+            if entry.depth >= depth and (entry.bound != UPPER and entry.score >= g
+                                         or entry.bound != LOWER and entry.score < g):
+                stats.tt_cutoffs += 1
+                return entry.score
+        
+        ply = len(pos.history)
 
-            if strongest_move and state.points(strongest_move) >= v_low:
-                # recursively iterates through, with one less depth
-                # negative bound because it switches turns
-                print("6yes")
-                yield strongest_move, -self.alphabeta(state.move(strongest_move), 1 - g, depth - 1)
+        # null move pruning: if passing the turn still reaches gamma, so will a move.
+        # not at the root, not twice in a row, and not with only pawns left, where
+        # having to move can be a disadvantage
+        if (self.null_move and can_null and ply > 0 and depth > 2
+            and any(piece in pos.board for piece in "NBRQ")):
+            self.hashes.append(pos.hash)
+            pos.make_null()
+            score = -self.alphabeta(pos, 1 - g, depth - 1 - self.NULL_REDUCTION, can_null = False)
+            pos.unmake_null()
+            self.hashes.pop()
+            if score >= g:
+                self.tt.store(pos.hash, depth, score, LOWER, None)
+                return score
+        
+        # look for strongest move from the last search of this position
+        strongest_move = entry.move if entry is not None else None
+        if not strongest_move and depth > 2:
+            self.alphabeta(pos, g, depth - 3)
+            entry = self.tt.probe(pos.hash)
+            strongest_move = entry.move if entry is not None else None
+        killers = self.killers[min(ply, self.MAX_PLY - 1)]
+        # moves passed over as too weak to search
+        pruned = []
         
         def make_moves():
 
-            # if depth is 0, then return the value
-            if depth == 0:
-                yield None, state.value
-            
-            # find the strongest move
-            strongest_move()
-
-            for v, move in sorted(
-                ((state.points(move), move) for move in state.generate_moves()), 
-                reverse = True
-                ):
-                if v < v_low: break
-                if depth <= 1 and state.value + v < g:
-                    yield move, state.value + v if v < MATE_LOWER_BOUND else MATE_UPPER_BOUND
-                    break
+            # moves are packed ints, unpacked into the Move the position takes
+            for i, code in enumerate(self.ordered_moves(pos, strongest_move)):
+                # the move played must be legal, even when the search is too shallow to see the king taken
+                if ply == 0 and code not in self.root_moves: continue
+                move = decode_move(code)
+                v = pos.points(move)
+                if v < v_low:
+                    pruned.append(move)
+                    continue
+                quiet = not is_capture(pos.board, pos.ep, pos.kp, move)
+                # futility pruning: the score after the move, with a margin for what the
+                # search below could gain, can't reach gamma. With no margin at depth 1
+                # this is exact, as the quiescence search can stand pat
+                if (self.futility and depth < len(self.FUTILITY_MARGIN)
+                    and (quiet or depth == 1)
+                    and pos.value + v + self.FUTILITY_MARGIN[depth] < g):
+                    yield code, quiet, pos.value + v if v < MATE_LOWER_BOUND else MATE_UPPER_BOUND
+                    continue
+                # late move reductions: quiet moves ordered late are searched less deep,
+                # and again at full depth only if they reach gamma
+                if (self.late_move_reductions and depth > 2 and i >= self.LMR_MOVES
+                    and quiet and code not in killers):
+                    score = -self.search_move(pos, move, 1 - g, depth - 1 - self.LMR_REDUCTION)
+                    if score < g:
+                        yield code, quiet, score
+                        continue
                 # recursively iterates through, with one less depth
                 # negative bound because it switches turns
-                yield move, -self.alphabeta(state.move(move), 1 - g, depth - 1)
+                yield code, quiet, -self.search_move(pos, move, 1 - g, depth - 1)
 
         # sets best as an extremely low value and adjust best as a better score is found
         best = -MATE_UPPER_BOUND
-        for move, score in make_moves():
+        best_move = None
+        for searched, (code, quiet, score) in enumerate(make_moves()):
             best = max(best, score)
             if best >= g:
+                stats.cutoffs += 1
+                if searched == 0:
+                    stats.first_cutoffs += 1
                 # save the move if is better than gamma
-                if move is not None:
-                    self.variated_moves[state] = move
+                best_move = code
+                # remember quiet moves that cut off, to try them early elsewhere
+                if quiet:
+                    self.update_quiet_heuristics(pos, code, depth)
                 break
 
-        # handle draws
-        if depth > 2 and best == -MATE_UPPER_BOUND:
-            flipped_state = state.rotate(nullmove = True)
-            is_in_check = self.alphabeta(flipped_state, MATE_UPPER_BOUND, 0) == MATE_UPPER_BOUND
-            best = -MATE_LOWER_BOUND if is_in_check else 0
+        # every move searched loses the king, so the moves passed over as too weak are
+        # all that is left, and they decide whether the position is mate or stalemate
+        if best == -MATE_UPPER_BOUND:
+            for move in pruned:
+                best = max(best, -self.search_move(pos, move, 1 - g, depth - 1))
+                if best >= g:
+                    best_move = encode_move(move)
+                    break
+        # every move loses the king: checkmate if in check, else stalemate
+        if best == -MATE_UPPER_BOUND:
+            best = -MATE_LOWER_BOUND if in_check(pos.board) else 0
+
+        # a score of at least gamma is a lower bound, anything less an upper bound
+        self.tt.store(pos.hash, depth, best, LOWER if best >= g else UPPER, best_move)
+        return best
+
+    def ordered_moves(self, pos, strongest_move):
+        ''' yields the packed moves in the order they are likely to cut off, in stages so
+        that the later stages aren't generated after a cut off: the strongest move, captures
+        by most valuable victim and least valuable attacker, killer moves, quiet moves
+        by history score, and last the captures that lose material. Each stage is
+        sorted as ints, with its sort key packed above the move '''
+
+        board, ep, kp = pos.board, pos.ep, pos.kp
+        buffer = self.buffer
+
+        # the strongest move of an earlier search, unless a hash collision gave a move
+        # for another position
+        if strongest_move is not None and board[strongest_move >> 10].isupper():
+            yield strongest_move
+
+        # captures
+        del buffer[:]
+        pos.generate_capture_codes(buffer)
+        captures, losing = [], []
+        for code in buffer:
+            if code == strongest_move: continue
+            move = decode_move(code)
+            victim, attacker = victim_value(board, ep, kp, move), PIECE[board[move.start]]
+            # only a capture by a more valuable piece can lose material
+            if attacker > victim and see(board, ep, move) < 0:
+                losing.append(code)
+            else:
+                # by victim, then the least valuable attacker first
+                captures.append((victim << 16 | 0xFFFF - attacker) << MOVE_BITS | code)
+        capture_codes = set(buffer)
+        captures.sort(reverse = True)
+        for key in captures:
+            yield key & MOVE_MASK
 
+        # killer moves, then quiet moves
+        del buffer[:]
+        pos.generate_codes(buffer)
+        quiets = [code for code in buffer if code != strongest_move and code not in capture_codes]
+        killers = self.killers[min(len(pos.history), self.MAX_PLY - 1)]
+        for killer in killers:
+            if killer in quiets:
+                yield killer
+        history = self.history
+        # ties are broken by the move itself, so every backend searches in the same order
+        quiets = [history[board[code >> 10]][code >> 3 & 127] << MOVE_BITS | code for code in quiets]
+        quiets.sort(reverse = True)
+        for key in quiets:
+            code = key & MOVE_MASK
+            if code not in killers:
+                yield code
+
+        yield from sorted(losing, reverse = True)
+
+    def update_quiet_heuristics(self, pos, code, depth) -> None:
+        ''' records a packed quiet move that caused a cut off as a killer move for its
+        ply and in the history table '''
+        killers = self.killers[min(len(pos.history), self.MAX_PLY - 1)]
+        if killers[0] != code:
+            killers[1], killers[0] = killers[0], code
+        self.history[pos.board[code >> 10]][code >> 3 & 127] += depth * depth
+
+    def quiesce(self, pos, g) -> int:
+        ''' a capture only search, so that the score at the horizon doesn't miss pieces
+        left hanging. Captures are tried in order of static exchange value, and those
+        that lose material are not tried at all '''
+
+        # to make sure we still have a king
+        if -MATE_LOWER_BOUND > pos.value:
+            return -MATE_UPPER_BOUND
+
+        self.qnodes += 1
+        if self.qnodes % self.CHECK_EVERY == 0: self.check_limits()
+        stats = self.stats
+        if len(pos.history) > stats.max_ply:
+            stats.max_ply = len(pos.history)
+
+        # cut off on any stored bound, every search is at least as deep as this one
+        stats.tt_probes += 1
+        entry = self.tt.probe(pos.hash)
+        if entry is not None:
+            stats.tt_hits += 1
+            if entry.bound != UPPER and entry.score >= g or entry.bound != LOWER and entry.score < g:
+                stats.tt_cutoffs += 1
+                return entry.score
+
+        # stand pat: the side to move doesn't have to capture. The evaluation seldom
+        # moves the incremental value by much, so it is only needed close to gamma.
+        # Far from gamma the score depends on which gamma was probed, and isn't stored
+        best = pos.value
+        lazy = self.evaluation and abs(best - g) >= self.LAZY_MARGIN
+        if self.evaluation and not lazy:
+            best = self.evaluator.evaluate(pos)
+        if best >= g:
+            return best
+
+        board, ep, buffer = pos.board, pos.ep, self.buffer
+        del buffer[:]
+        pos.generate_capture_codes(buffer)
+        # by exchange value, packed above the move
+        captures = [see(board, ep, decode_move(code)) + SEE_OFFSET << MOVE_BITS | code for code in buffer]
+        captures.sort(reverse = True)
+        for key in captures:
+            v, code = (key >> MOVE_BITS) - SEE_OFFSET, key & MOVE_MASK
+            # the remaining captures lose material, or can't reach gamma. Taking
+            # the king always can, as it ends the game
+            if v < 0 or (v < MATE_LOWER_BOUND and best + v + self.QS_DELTA < g):
+                break
+            best = max(best, -self.quiesce_move(pos, decode_move(code), 1 - g))
+            if best >= g:
+                if not lazy:
+                    self.tt.store(pos.hash, 0, best, LOWER, code)
+                return best
+        if not lazy:
+            self.tt.store(pos.hash, 0, best, UPPER, None)
         return best
+
+    def search_move(self, pos, move, g, depth) -> int:
+        ''' makes the move, searches the position after it and takes the move back '''
+        self.hashes.append(pos.hash)
+        pos.make_move(move)
+        score = self.alphabeta(pos, g, depth)
+        pos.unmake_move()
+        self.hashes.pop()
+        return score
+
+    def quiesce_move(self, pos, move, g) -> int:
+        ''' as search_move, for the quiescence search '''
+        pos.make_move(move)
+        score = self.quiesce(pos, g)
+        pos.unmake_move()
+        return score
+
+    def is_draw(self, pos) -> bool:
+        ''' whether the position is drawn by the fifty move rule, or repeats a position of
+        the game or of the search. The root isn't, so that the search still finds a move '''
+        if len(self.hashes) == self.root_ply:
+            return False
+        if pos.clock >= 100:
+            return True
+        # a position can only repeat an even number of plies back, with the same side
+        # to move, and not from before the last capture or pawn move
+        hashes = self.hashes
+        for back in range(4, min(pos.clock, len(hashes)) + 1, 2):
+            if hashes[-back] == pos.hash:
+                return True
+        return False
+
+    def check_limits(self) -> None:
+        ''' stops the search by raising SearchStopped, if it is out of time or nodes,
+        or if it has been told to stop '''
+        if ((self.stop is not None and self.stop.is_set())
+            or (self.deadline is not None and time.time() > self.deadline)
+            or (self.node_limit is not None and self.nodes + self.qnodes >= self.node_limit)):
+            raise SearchStopped
+
+    def best_move(self, state) -> object:
+        ''' returns the best move found for the state, or None '''
+        entry = self.tt.probe(state.hash)
+        return decode_move(entry.move) if entry is not None and entry.move is not None else None
+
+    def principal_variation(self, state, depth) -> list:
+        ''' follows the best moves stored in the transposition table from the state,
+        returning up to depth moves '''
+        pv, seen = [], set()
+        while len(pv) < depth and state.hash not in seen:
+            seen.add(state.hash)
+            move = self.best_move(state)
+            # a hash collision can give a move of another position
+            if move is None or move not in legal_moves(state):
+                break
+            pv.append(move)
+            state = state.move(move)
+        return pv
         
-    def search(self, state):
-        ''' iterative deepening search '''
+    def search(self, state, time_limit = None, node_limit = None, stop = None, history = (), depth_limit = None):
+        ''' iterative deepening search. It ends after time_limit seconds, after about
+        node_limit nodes, once stop (a threading or multiprocessing Event) is set, or
+        after the iteration of depth_limit,
+        leaving the result of the last completed iteration in self.result. history holds
+        the hashes of the positions of the game before the state, oldest first, so that
+        repetitions of them are scored as draws. With more than one worker, helper
+        processes search the same position alongside it '''
+        self.start_time = time.time()
+        self.depth_limit = depth_limit
+        self.deadline = self.start_time + time_limit if time_limit is not None else None
+        self.node_limit = node_limit
+        self.stop = stop
+        self.result = None
+        self.root_moves = {encode_move(move) for move in legal_moves(state)}
+        # hashes of the positions before the one searched, in the game and then in the search
+        self.hashes = list(history)
+        self.root_ply = len(self.hashes)
         self.nodes = 0
+        self.qnodes = 0
+        self.killers = [[None, None] for _ in range(self.MAX_PLY)]
+        # keep the history of earlier searches, but let the new search outweigh it
+        for scores in self.history.values():
+            scores[:] = [score // 2 for score in scores]
+        self.stats = SearchStats()
+        self.iterations = []
+        self.tt.new_search()
+        self.evaluator.new_search()
+        if self.workers == 1:
+            yield from self.hooked(self.deepen(state))
+            return
+
+        # lazy SMP: the helpers search the same position, and through the shared
+        # transposition table cut short the searches of each other. They report
+        # their results as (depth, score, packed move) in results
+        context = processes()
+        helper_stop = context.Event()
+        results = context.Array("l", 3 * (self.workers - 1))
+        helpers = [context.Process(target = self.help, args = (state, i, helper_stop, results), daemon = True)
+                   for i in range(1, self.workers)]
+        try:
+            for helper in helpers:
+                helper.start()
+            yield from self.hooked(self.deepen(state))
+        finally:
+            helper_stop.set()
+            for helper in helpers:
+                helper.join()
+            # take the deepest result of any process
+            for i in range(self.workers - 1):
+                depth, score, code = results[i * 3 : i * 3 + 3]
+                if depth > (self.result[0] if self.result is not None else 0):
+                    self.result = (depth, score, decode_move(code))
+
+    def help(self, state, index, stop, results) -> None:
+        ''' searches the state in a helper process until stop is set, writing the result
+        of each completed iteration to its slot of results '''
+        self.stop = stop
+        reported = None
+        # half of the helpers start a depth ahead, so they aren't all searching the
+        # same iteration as the main process
+        for _ in self.deepen(state, 1 + index % 2):
+            if self.result is not reported and self.result[2] is not None:
+                reported = self.result
+                depth, score, move = self.result
+                results[index * 3 - 3 : index * 3] = [depth, score, encode_move(move)]
+
+    def __getstate__(self) -> dict:
+        # the stop signal and the hooks of the caller may not be shared with other processes
+        return dict(self.__dict__, stop = None, hooks = [])
+
+    def hooked(self, results):
+        ''' yields the results of the search, calling the start hooks whenever the search
+        runs and the stop hooks whenever it hands a result back or ends '''
+        running = False
+        try:
+            for start, _ in self.hooks:
+                start()
+            running = True
+            for result in results:
+                for _, stop in self.hooks:
+                    stop()
+                running = False
+                yield result
+                for start, _ in self.hooks:
+                    start()
+                running = True
+        finally:
+            if running:
+                for _, stop in self.hooks:
+                    stop()
+
+    def timed(self, function, name):
+        ''' wraps the function to add the seconds each call takes to a counter of the
+        stats of the running iteration '''
+        def run(*args):
+            start_time = time.perf_counter()
+            try:
+                return function(*args)
+            finally:
+                stats = self.stats
+                setattr(stats, name, getattr(stats, name) + time.perf_counter() - start_time)
+        return run
+
+    def deepen(self, state, first_depth = 1):
+        ''' the iterative deepening loop of search, from first_depth. The counters of each
+        completed iteration are added to self.iterations '''
+        pos = BACKENDS[self.backend](state)
+        if self.time_phases:
+            # the timed functions are set on the instances, in place of their methods
+            pos.generate_codes = self.timed(pos.generate_codes, "movegen_time")
+            pos.generate_capture_codes = self.timed(pos.generate_capture_codes, "movegen_time")
+            self.evaluator.evaluate = self.timed(self.evaluator.evaluate, "eval_time")
         g = 0
-        # we cap the depth range at 100 so that we don't head off into infinity
-        for depth in range(1, 100):
-            # sets upper and lower bounds
-            lower = -MATE_LOWER_BOUND
-            upper = MATE_LOWER_BOUND
-            while lower < upper - 15:
-                # grabs the score
-                score = self.alphabeta(state, g, depth)
-                # sets score if higer or lower than gamma
-                if score >= g: lower = score
-                if score < g: upper = score
-                # results of search returned
-                yield self.nodes, depth, g, score, self.variated_moves.get(state)
-                g = (lower + upper + 1) // 2
+        try:
+            # we cap the depth range at 100 so that we don't head off into infinity
+            for depth in range(first_depth, min(self.depth_limit or 99, 99) + 1):
+                self.stats = stats = SearchStats(depth)
+                nodes, qnodes = self.nodes, self.qnodes
+                # sets upper and lower bounds
+                lower = -MATE_LOWER_BOUND
+                upper = MATE_LOWER_BOUND
+                while lower < upper - 15:
+                    stats.researches += 1
+                    # grabs the score, unless the search is stopped part way
+                    start_time = time.perf_counter()
+                    try:
+                        score = self.alphabeta(pos, g, depth)
+                    except SearchStopped:
+                        return
+                    finally:
+                        stats.time += time.perf_counter() - start_time
+                    # sets score if higer or lower than gamma
+                    if score >= g: lower = score
+                    if score < g: upper = score
+                    # results of search returned
+                    yield self.nodes, self.qnodes, depth, g, score, self.best_move(state)
+                    g = (lower + upper + 1) // 2
+                self.result = (depth, score, self.best_move(state))
+
+                stats.nodes, stats.qnodes = self.nodes - nodes, self.qnodes - qnodes
+                stats.score = score
+                stats.move = to_uci(self.result[2], state.ac) if self.result[2] is not None else None
+                if self.iterations:
+                    last = self.iterations[-1]
+                    stats.branching_factor = (stats.nodes + stats.qnodes) / max(last.nodes + last.qnodes, 1)
+                self.iterations.append(stats)
+
+                # the next iteration takes longer than all the ones before it, so don't
+                # start one that can't finish in the time left
+                if self.deadline is not None and time.time() - self.start_time > (self.deadline - self.start_time) / 2:
+                    return
+        finally:
+            # back to the method of the class
+            self.evaluator.__dict__.pop("evaluate", None)
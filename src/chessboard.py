@@ -1,4 +1,7 @@
-import string
+import os
+import zlib
+import marshal
+from array import array
 from itertools import count
 from collections import namedtuple
 
@@ -69,10 +72,65 @@ PIECE_SQUARE_TABLES = {
             17,  30,  -3, -14,   6,  -1,  40,  18),
 }
 
+# seed of the Zobrist keys, fixed so that hashes are stable between runs
+ZOBRIST_SEED = 20220
+
+# the tables derived from the values above are cached in a file, so importing the
+# module doesn't build them, and doesn't import random to draw the Zobrist keys
+TABLES_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__", "chessboard.tables")
+
+def build_tables() -> dict:
+    ''' Builds the padded piece-square tables and the Zobrist keys. '''
+    import random
+
+    tables = {}
+    # here, we take both the piece values and the piece-square tables and combine them
+    # we also pad the table with two 0s on all sides for easier illegal-move catches
+    tables["pst"] = {}
+    for k, table in PIECE_SQUARE_TABLES.items():
+        padrow = lambda row: (0,) + tuple(x + PIECE[k] for x in row) + (0,)
+        tables["pst"][k] = (0,) * 20 + sum((padrow(table[i * 8 : i * 8 + 8]) for i in range(8)), ()) + (0,) * 20
+
+    # Zobrist keys, packed as 64 bit words, which load much faster than Python ints:
+    # 120 for each piece, 119 for en passant squares, 119 for king passant squares,
+    # 4 for castling rights and 1 for black to move
+    _random = random.Random(ZOBRIST_SEED)
+    tables["keys"] = array("Q", (_random.getrandbits(64) for _ in range(12 * 120 + 119 + 119 + 4 + 1))).tobytes()
+    return tables
+
+def load_tables() -> dict:
+    ''' Reads the derived tables from the cache, or builds them and writes the cache
+    if it is missing or was built from other values. '''
+    digest = zlib.crc32(repr((PIECE, PIECE_SQUARE_TABLES, ZOBRIST_SEED)).encode())
+    try:
+        with open(TABLES_CACHE, "rb") as file:
+            tables = marshal.load(file)
+        if tables["digest"] == digest:
+            return tables
+    except (OSError, EOFError, ValueError, TypeError, KeyError):
+        pass
+    tables = build_tables()
+    tables["digest"] = digest
+    # write a whole file and then move it into place, as other processes may be reading the cache
+    try:
+        os.makedirs(os.path.dirname(TABLES_CACHE), exist_ok = True)
+        path = "%s.%d" % (TABLES_CACHE, os.getpid())
+        with open(path, "wb") as file:
+            marshal.dump(tables, file)
+        os.replace(path, TABLES_CACHE)
+    except OSError:
+        pass
+    return tables
+
+_TABLES = load_tables()
+PIECE_SQUARE_TABLES = _TABLES["pst"]
+_KEYS = array("Q", _TABLES["keys"])
+
 #################################################
 
 # Lists of possible moves for each piece type.
 A1, H1, A8, H8  = 91, 98, 21, 28
+FILES           = "abcdefgh"
 N, E, S, W      = -10, 1, 10, -1
 DIRECTIONS = {
     "P": (N, N+N, N+W, N+E),
@@ -83,18 +141,58 @@ DIRECTIONS = {
     "K": (N, E, S, W, N+E, S+E, S+W, N+W)
 }
 
+# castling rights tied to the corners of the board, as seen by each active color:
+# CASTLING_RIGHTS[ac] - (own A1 rook, own H1 rook, opponent's A8 rook, opponent's H8 rook)
+CASTLING_RIGHTS = (("Q", "K", "q", "k"), ("k", "q", "K", "Q"))
+
+##############################################
+
+# Zobrist keys, drawn from a fixed seed so that hashes are stable between runs.
+# Keys are defined on the absolute board (UPPERCASE is white) and then mapped
+# onto the board as seen by each active color, so rotating the board leaves
+# the hash unchanged.
+_PIECE_KEYS = {p: tuple(_KEYS[i * 120 : i * 120 + 120]) for i, p in enumerate("PNBRQKpnbrqk")}
+_SQUARE_KEYS = (0,) + tuple(_KEYS[1440 : 1559])
+_KP_KEYS = (0,) + tuple(_KEYS[1559 : 1678])
+# ZOBRIST_PIECES[ac][piece][index] - key of a piece as it appears on the board of the active color
+ZOBRIST_PIECES = (
+    {p: keys for p, keys in _PIECE_KEYS.items()},
+    {p.swapcase(): keys[::-1] for p, keys in _PIECE_KEYS.items()},
+)
+# ZOBRIST_EP[ac][index] / ZOBRIST_KP[ac][index] - keys of the en passant and king passant squares
+ZOBRIST_EP = (_SQUARE_KEYS, (0,) + _SQUARE_KEYS[118::-1])
+ZOBRIST_KP = (_KP_KEYS, (0,) + _KP_KEYS[118::-1])
+ZOBRIST_CASTLING = dict(zip("KQkq", _KEYS[1678 : 1682]))
+ZOBRIST_SIDE = _KEYS[1682]
+
+def zobrist(board, ac, cr, ep, kp) -> int:
+    ''' Computes the Zobrist hash of a position from scratch. '''
+
+    pieces = ZOBRIST_PIECES[ac]
+    h = ZOBRIST_SIDE if ac == 1 else 0
+    for index, piece in enumerate(board):
+        if piece in pieces:
+            h ^= pieces[piece][index]
+    for c in cr:
+        if c in ZOBRIST_CASTLING:
+            h ^= ZOBRIST_CASTLING[c]
+    return h ^ ZOBRIST_EP[ac][ep] ^ ZOBRIST_KP[ac][kp]
+
 ##############################################
 
-STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 0"
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
 
 # initializes data structure for initial state
-State = namedtuple("State", "board value ac cr ep kp")
+State = namedtuple("State", "board value ac cr ep kp hash clock fullmove", defaults = (0, 1))
 # board - 120 char representation of the board
 # value - value evaluation of the board
 # ac - active color (0 is white, 1 is black)
 # cr - castling rights, UPPERCASE for white, lowercase for black
 # ep - en passant square
 # kp - the king passant square
+# hash - Zobrist hash of the position
+# clock - halfmove clock, the plies since the last capture or pawn move
+# fullmove - fullmove number, which goes up after every move of black
 
 # initializes data structure for initial state
 Move = namedtuple("Move", "start end promote")
@@ -102,127 +200,449 @@ Move = namedtuple("Move", "start end promote")
 # end - end index
 # promote - if there is a promotion event
 
+# inside the search, moves are packed into ints as start << 10 | end << 3 | promotion,
+# with the promotion as an index of PROMOTIONS, so that move generation and ordering
+# don't build a tuple for every move. Packed moves sort by start, then end
+PROMOTIONS  = ("", "N", "B", "R", "Q")
+MOVE_BITS   = 17
+MOVE_MASK   = (1 << MOVE_BITS) - 1
+
+def encode_move(move) -> int:
+    ''' Packs a move into an int. '''
+    return move.start << 10 | move.end << 3 | PROMOTIONS.index(move.promote)
+
+# every move unpacked so far, so each Move is only built once
+_DECODED = {}
+
+def decode_move(code) -> Move:
+    ''' Unpacks an int into a move. '''
+    move = _DECODED.get(code)
+    if move is None:
+        move = _DECODED[code] = Move(code >> 10, code >> 3 & 127, PROMOTIONS[code & 7])
+    return move
+
+def to_index(square, ac = 0) -> int:
+    ''' Converts a square in standard notation into an index of the board as seen by the side to move. '''
+    index = A1 + FILES.index(square[0]) + (int(square[1]) - 1) * N
+    return index if ac == 0 else 119 - index
+
+def to_square(index, ac = 0) -> str:
+    ''' Converts an index of the board as seen by the side to move into standard notation. '''
+    index = index if ac == 0 else 119 - index
+    rank, file = divmod(index - A1, 10)
+    return FILES[file] + str(1 - rank)
+
+def to_uci(move, ac = 0) -> str:
+    ''' Converts a move of the board as seen by the side to move into long algebraic notation. '''
+    return to_square(move.start, ac) + to_square(move.end, ac) + move.promote.lower()
+
 def insert(board, index, piece):
     ''' Helper method to insert piece into the board. '''
 
     return board[:index] + piece + board[index + 1 :]
 
-def load_from_fen():
+def board_value(board) -> int:
+    ''' Computes the value of a board from scratch, for the side to move. '''
+
+    value = 0
+    for index, piece in enumerate(board):
+        if piece.isupper():
+            value += PIECE_SQUARE_TABLES[piece][index]
+        elif piece.islower():
+            value -= PIECE_SQUARE_TABLES[piece.upper()][119 - index]
+    return value
+
+def load_from_fen(fen = STARTING_FEN) -> State:
     '''
-    Takes the tuple of initial state and assigns FEN values to it.
+    Parses a FEN string into a state, with the board as seen by the side to move.
+    The halfmove clock and fullmove number are optional.
     '''
     # all the data from the FEN string
-    fen_split = STARTING_FEN.split(' ')
+    fen_split = fen.split()
+    if len(fen_split) < 4:
+        raise ValueError("FEN needs at least 4 fields: " + fen)
+    placement, color, cr, ep = fen_split[:4]
 
     # active color
-    ac = 0 if fen_split[1] == "w" else 1
+    if color not in ("w", "b"):
+        raise ValueError("invalid active color in FEN: " + color)
+    ac = 0 if color == "w" else 1
+
+    # fill the board with values from the FEN, padding each row with an " " on
+    # each side and the board with two empty rows above and below
+    rows = []
+    for fen_row in placement.split("/"):
+        row = "".join("." * int(x) if x.isdigit() else x for x in fen_row)
+        if len(row) != 8 or any(x != "." and x not in "PNBRQKpnbrqk" for x in row):
+            raise ValueError("invalid row in FEN: " + fen_row)
+        rows.append(" " + row + " ")
+    if len(rows) != 8:
+        raise ValueError("FEN needs 8 rows: " + placement)
+    board = " " * 20 + "".join(rows) + " " * 20
+
+    # castling rights
+    cr = "" if cr == "-" else cr
+    if any(c not in "KQkq" for c in cr):
+        raise ValueError("invalid castling rights in FEN: " + cr)
 
     # convert enpassant square from standard notation into index
-    ep = fen_split[3]
-    if ep != "-":
-        ep = A1 + string.ascii_lowercase.index(ep[0]) + (int(ep[1]) * 10)
-    else: ep = 0
-
-    # initialize board with 64 empty characters
-    raw_board = "." * 64
-
-    # fill board with values from the FEN
-    fen_board = [x for x in fen_split[0]]
-    board_index = 0
-    for x in fen_board:
-        if x != '/':
-            if x.isnumeric():
-                board_index += int(x)
-            else:
-                raw_board = insert(raw_board, board_index, x)
-                board_index += 1
+    if ep != "-" and (len(ep) != 2 or ep[0] not in FILES or ep[1] not in "36"):
+        raise ValueError("invalid en passant square in FEN: " + ep)
+    ep = to_index(ep, ac) if ep != "-" else 0
 
-    # initialize padded rows board
-    padded_rows_board = ""
-    # pad the board with two 0s deep on each side
-    padrow = lambda row: " " + row + " "
-    for i in range(8):
-        padded_rows_board += padrow(raw_board[i * 8 : i * 8 + 8])
-    # pad the rows with an " " on each side
-    raw_board = " " * 20 + padded_rows_board + " " * 20
-    board = raw_board
+    # halfmove clock
+    clock = fen_split[4] if len(fen_split) > 4 else "0"
+    if not clock.isdigit():
+        raise ValueError("invalid halfmove clock in FEN: " + clock)
 
-    # here, we take both the piece values and the piece-square tables and combine them
-    # we also pad the table with two 0s on all sides for easier illegal-move catches
-    for k, table in PIECE_SQUARE_TABLES.items():
-        padrow = lambda row: (0,) + tuple(x + PIECE[k] for x in row) + (0,)
-        PIECE_SQUARE_TABLES[k] = sum((padrow(table[i * 8 : i * 8 + 8]) for i in range(8)), ())
-        PIECE_SQUARE_TABLES[k] = (0,) * 20 + PIECE_SQUARE_TABLES[k] + (0,) * 20
+    # fullmove number
+    fullmove = fen_split[5] if len(fen_split) > 5 else "1"
+    if not fullmove.isdigit():
+        raise ValueError("invalid fullmove number in FEN: " + fullmove)
+
+    # the board is always seen from the side to move
+    if ac == 1:
+        board = board[::-1].swapcase()
 
-    return State(board, 0, ac, fen_split[2], ep, 0)
+    return State(board, board_value(board), ac, cr, ep, 0, zobrist(board, ac, cr, ep, 0), int(clock), int(fullmove))
+
+def to_fen(state) -> str:
+    ''' Serializes a state of any backend into a FEN string. '''
+
+    board = state.board if state.ac == 0 else state.board[::-1].swapcase()
+    rows = []
+    for i in range(8):
+        row = board[A8 + i * 10 : A8 + i * 10 + 8]
+        # replace each run of empty squares by its length, longest first
+        for n in range(8, 0, -1):
+            row = row.replace("." * n, str(n))
+        rows.append(row)
+    cr = "".join(c for c in "KQkq" if c in state.cr) or "-"
+    ep = to_square(state.ep, state.ac) if state.ep else "-"
+    return "%s %s %s %s %d %d" % ("/".join(rows), "wb"[state.ac], cr, ep, state.clock, state.fullmove)
 
 INITIAL_STATE = load_from_fen()
 
 ############################################
 
+def generate_codes(board, ac, cr, ep, kp, out) -> None:
+    ''' Appends the available moves for all active indexes of a 120 char board, given
+    as a str or a list, to out as packed ints. '''
+    append = out.append
+    for index, piece in enumerate(board):
+        # only consider the UPPERCASE pieces
+        if not piece.isupper():
+            continue
+        start = index << 10
+        # iterate through the piece's direction list
+        for direction in DIRECTIONS[piece]:
+            # for each direction, extend it until index is occupied or off the board
+            for possible_move in count(index + direction, direction):
+                # str at index
+                pos = board[possible_move]
+                # if str is " " or UPPERCASE, stop.
+                if pos.isspace() or pos.isupper():
+                    break
+                # pawn movement (cause pawns are so annoying to code)
+                if piece == "P":
+                    # forward movement
+                    # if any space is occupied, stop.
+                    if direction in (N, N + N) and pos != ".":
+                        break
+                    # if pawn is not where double move is possible, stop.
+                    if (
+                        direction == (N + N) 
+                        and (index < (A1 + N) 
+                            or board[index + N] != ".")
+                        ):
+                        break
+                    # pawn diagonal take conditions.
+                    if (
+                        direction in (N+W, N+E)
+                        and pos == "."
+                        and possible_move not in (ep, kp, kp - 1, kp + 1)
+                        ):
+                        break
+                    # promote to all iterations once pawn gets to the back rank
+                    if A8 <= possible_move <= H8:
+                        for promotion in (1, 2, 3, 4):
+                            append(start | possible_move << 3 | promotion)
+                        break
+                # if all the tests pass, then move the piece.
+                append(start | possible_move << 3)
+                # stop sliding
+                if piece in "PNK" or pos.islower():
+                    break
+                # castling
+                if index == A1 and direction == E and board[possible_move + E] == "K" and (CASTLING_RIGHTS[ac][0] in cr):
+                    append((possible_move + E) << 10 | (possible_move + W) << 3)
+                if index == H1 and direction == W and board[possible_move + W] == "K" and (CASTLING_RIGHTS[ac][1] in cr):
+                    append((possible_move + W) << 10 | (possible_move + E) << 3)
+
+def generate_capture_codes(board, ep, kp, out) -> None:
+    ''' Appends the moves of generate_codes that is_capture accepts to out, without
+    walking the quiet ones, for the quiescence search. '''
+    append = out.append
+    for index, piece in enumerate(board):
+        # only consider the UPPERCASE pieces
+        if not piece.isupper():
+            continue
+        start = index << 10
+        if piece == "P":
+            # diagonal takes, and promotions
+            ends = [end for end in (index + N + W, index + N + E)
+                    if board[end].islower() or (board[end] == "." and end in (ep, kp, kp - 1, kp + 1))]
+            if board[index + N] == ".":
+                ends.append(index + N)
+            for end in ends:
+                if A8 <= end <= H8:
+                    for promotion in (1, 2, 3, 4):
+                        append(start | end << 3 | promotion)
+                elif end != index + N:
+                    append(start | end << 3)
+            continue
+        for direction in DIRECTIONS[piece]:
+            for possible_move in count(index + direction, direction):
+                pos = board[possible_move]
+                if pos.isspace() or pos.isupper():
+                    break
+                # takes a piece, or the king passant square
+                if pos.islower() or (kp and abs(possible_move - kp) < 2):
+                    append(start | possible_move << 3)
+                if piece in "NK" or pos.islower():
+                    break
+
+def generate_moves(board, ac, cr, ep, kp) -> list:
+    ''' Returns list of available moves for all active indexes of a 120 char board,
+    given as a str or a list. '''
+    codes = []
+    generate_codes(board, ac, cr, ep, kp, codes)
+    return [decode_move(code) for code in codes]
+
+def generate_captures(board, ep, kp) -> list:
+    ''' Returns the moves of generate_moves that is_capture accepts. '''
+    codes = []
+    generate_capture_codes(board, ep, kp, codes)
+    return [decode_move(code) for code in codes]
+
+def points(board, ep, kp, move) -> int:
+    ''' Score the value of the move on a 120 char board, given as a str or a list. '''
+    start, end, promotion = move
+    p_start, p_end = board[start], board[end]
+
+    # finds move in the pst boards
+    value = PIECE_SQUARE_TABLES[p_start][end] - PIECE_SQUARE_TABLES[p_start][start]
+
+    # captures a piece
+    if p_end.islower():
+        value += PIECE_SQUARE_TABLES[p_end.upper()][119 - end]
+    
+    # checks if castled
+    if abs(end - kp) < 2:
+        value += PIECE_SQUARE_TABLES["K"][119 - end]
+
+    # castle
+    if p_start == "K" and abs(start - end) == 2:
+        value += PIECE_SQUARE_TABLES["R"][(start + end) // 2]
+        value -= PIECE_SQUARE_TABLES["R"][A1 if end < start else H1]
+
+    # pawn promotion and enpassant
+    if p_start == "P":
+        if A8 <= end <= H8:
+            value += PIECE_SQUARE_TABLES[promotion][end] - PIECE_SQUARE_TABLES["P"][end]
+        if end == ep:
+            value += PIECE_SQUARE_TABLES["P"][119 - (end + S)]
+
+    return value
+
+def is_capture(board, ep, kp, move) -> bool:
+    ''' Whether the move takes a piece, takes en passant, promotes or takes the king passant square. '''
+    start, end, promotion = move
+    return (board[end].islower() or promotion != ""
+            or (board[start] == "P" and end == ep)
+            or (kp != 0 and abs(end - kp) < 2))
+
+def least_valuable_attacker(board, square, upper, removed):
+    ''' Returns the index of the cheapest piece of one side attacking the square,
+    treating the removed indexes as empty, or None if there is none. '''
+    # pawns attack forwards, which is N for UPPERCASE and S for lowercase
+    pawn = "P" if upper else "p"
+    for direction in ((S + W, S + E) if upper else (N + W, N + E)):
+        if board[square + direction] == pawn and square + direction not in removed:
+            return square + direction
+    knight = "N" if upper else "n"
+    for direction in DIRECTIONS["N"]:
+        index = square + direction
+        if board[index] == knight and index not in removed:
+            return index
+    best, best_index = None, None
+    for direction in DIRECTIONS["Q"]:
+        # slide until the first piece, looking through removed attackers
+        index = square + direction
+        while board[index] == "." or index in removed:
+            index += direction
+        piece = board[index]
+        if piece.isspace() or piece.isupper() != upper:
+            continue
+        piece = piece.upper()
+        if piece == "K" and index - direction != square:
+            continue
+        if (piece in "BRQK"
+            and (piece != "B" or direction in DIRECTIONS["B"])
+            and (piece != "R" or direction in DIRECTIONS["R"])
+            and (best is None or PIECE[piece] < PIECE[best])):
+            best, best_index = piece, index
+    return best_index
+
+def see(board, ep, move) -> int:
+    ''' Static exchange evaluation: the material the moving side wins on the end square
+    if both sides keep recapturing with their least valuable attacker. '''
+    start, end, promotion = move
+    piece, target = board[start], board[end]
+    removed = {start}
+    # gain[d] - material won by the side capturing at step d
+    if target.islower():
+        gain = [PIECE[target.upper()]]
+    elif piece == "P" and end == ep:
+        gain = [PIECE["P"]]
+        removed.add(end + S)
+    else:
+        gain = [0]
+    on_square = PIECE[piece]
+    if promotion:
+        gain[0] += PIECE[promotion] - PIECE["P"]
+        on_square = PIECE[promotion]
+
+    # alternate recaptures, opponent first
+    upper = False
+    while True:
+        index = least_valuable_attacker(board, end, upper, removed)
+        if index is None:
+            break
+        gain.append(on_square - gain[-1])
+        # neither side can come out ahead by continuing, so the recapture isn't made
+        if max(-gain[-2], gain[-1]) < 0:
+            gain.pop()
+            break
+        on_square = PIECE[board[index].upper()]
+        removed.add(index)
+        upper = not upper
+
+    # each side may stop recapturing when it would lose material
+    for d in range(len(gain) - 1, 0, -1):
+        gain[d - 1] = -max(-gain[d - 1], gain[d])
+    return gain[0]
+
+def is_attacked(board, square) -> bool:
+    ''' Whether a lowercase piece attacks the square of a 120 char board, probing
+    outwards from the square along the moves of each piece. '''
+    # lowercase pawns take southwards, so they attack from the north
+    if board[square + N + W] == "p" or board[square + N + E] == "p":
+        return True
+    for direction in DIRECTIONS["N"]:
+        if board[square + direction] == "n":
+            return True
+    for direction in DIRECTIONS["Q"]:
+        index = square + direction
+        if board[index] == "k":
+            return True
+        # slide until the first piece
+        while board[index] == ".":
+            index += direction
+        piece = board[index]
+        if piece == "q" or (piece == "r" and direction in DIRECTIONS["R"]) or (piece == "b" and direction in DIRECTIONS["B"]):
+            return True
+    return False
+
+def in_check(board) -> bool:
+    ''' Whether the UPPERCASE king of a 120 char board is attacked. '''
+    return is_attacked(board, board.index("K"))
+
+def pins(board, king) -> dict:
+    ''' Returns the UPPERCASE pieces pinned to the king of a 120 char board, each with
+    the indexes it may still move to: the line to the pinning piece, and the pinning piece. '''
+    pinned = {}
+    for direction in DIRECTIONS["Q"]:
+        slider = "r" if direction in DIRECTIONS["R"] else "b"
+        line, own = [], None
+        index = king + direction
+        while True:
+            piece = board[index]
+            if piece == ".":
+                line.append(index)
+            elif piece.isupper() and own is None:
+                own = index
+            else:
+                # a lowercase slider of the line pins the own piece in front of it
+                if own is not None and piece in (slider, "q"):
+                    line.append(index)
+                    pinned[own] = set(line)
+                break
+            index += direction
+    return pinned
+
+############################################
+
 class BoardState(State):
 
+    @classmethod
+    def from_state(cls, state):
+        ''' Converts a state of any backend into a string board state. '''
+        if isinstance(state, cls):
+            return state
+        return cls(state.board, state.value, state.ac, state.cr, state.ep, state.kp, state.hash, state.clock, state.fullmove)
+
+    @classmethod
+    def from_fen(cls, fen):
+        ''' Parses a FEN string into a board state. '''
+        return cls(*load_from_fen(fen))
+
+    @classmethod
+    def from_epd(cls, epd):
+        ''' Parses an EPD line into a board state and its operations. '''
+        state, operations = load_from_epd(epd)
+        return cls(*state), operations
+
+    def to_fen(self) -> str:
+        ''' Serializes the board state into a FEN string. '''
+        return to_fen(self)
+
     def generate_moves(self):
         ''' Returns list of available moves for all active indexes. '''
-        for index, piece in enumerate(self.board):
-            # only consider the UPPERCASE pieces
-            if not piece.isupper():
-                continue
-            # iterate through the piece's direction list
-            for direction in DIRECTIONS[piece]:
-                # for each direction, extend it until index is occupied or off the board
-                for possible_move in count(index + direction, direction):
-                    # str at index
-                    pos = self.board[possible_move]
-                    # if str is " " or UPPERCASE, stop.
-                    if pos.isspace() or pos.isupper():
-                        break
-                    # pawn movement (cause pawns are so annoying to code)
-                    if piece == "P":
-                        # forward movement
-                        # if any space is occupied, stop.
-                        if direction in (N, N + N) and pos != ".":
-                            break
-                        # if pawn is not where double move is possible, stop.
-                        if (
-                            direction == (N + N) 
-                            and (index < (A1 + N) 
-                                or self.board[index + N] != ".")
-                            ):
-                            break
-                        # pawn diagonal take conditions.
-                        if (
-                            direction in (N+W, N+E)
-                            and pos == "."
-                            and possible_move not in (self.ep, self.kp, self.kp - 1, self.kp + 1)
-                            ):
-                            break
-                        # promote to all iterations once pawn gets to the back rank
-                        if A8 <= possible_move <= H8:
-                            for promotion in "NBRQ":
-                                yield Move(index, possible_move, promotion)
-                            break
-                    # if all the tests pass, then move the piece.
-                    yield Move(index, possible_move, "")
-                    # stop sliding
-                    if piece in "PNK" or pos.islower():
-                        break
-                    # castling
-                    if index == A1 and self.board[possible_move + E] == "K" and ("Q" in self.cr):
-                        yield Move(possible_move + E, possible_move + W, "")
-                    if index == H1 and self.board[possible_move + W] == "K" and ("K" in self.cr):
-                        yield Move(possible_move + W, possible_move + E, "")
+        return generate_moves(self.board, self.ac, self.cr, self.ep, self.kp)
+
+    def generate_codes(self, out) -> None:
+        ''' Appends the available moves to out as packed ints. '''
+        generate_codes(self.board, self.ac, self.cr, self.ep, self.kp, out)
+
+    def generate_capture_codes(self, out) -> None:
+        ''' Appends the captures and promotions to out as packed ints. '''
+        generate_capture_codes(self.board, self.ep, self.kp, out)
+
+    def legal_moves(self) -> list:
+        ''' Returns the available moves that don't leave the king in check. '''
+        return legal_moves(self)
+
+    def in_check(self) -> bool:
+        ''' Whether the king of the active color is attacked. '''
+        return in_check(self.board)
 
     def move(self, move):
         ''' Performs the move of a piece from one index to another '''
         # initialize values
         start, end, promotion = move
         piece_start = self.board[start]
+        piece_end = self.board[end]
         board = self.board # copies value
         score = self.value + self.points(move)
         
         # reset all the values
         en_passant, king_passant = 0, 0
+
+        # update the hash with the pieces that move
+        keys = ZOBRIST_PIECES[self.ac]
+        h = self.hash ^ keys[piece_start][start] ^ keys[piece_start][end]
+        if piece_end != ".": h ^= keys[piece_end][end]
         
         # move the piece
         board = insert(board, end, piece_start)
@@ -230,71 +650,403 @@ class BoardState(State):
         
         # castling -
         castling_rights = self.cr
+        own_a1, own_h1, opp_a8, opp_h8 = CASTLING_RIGHTS[self.ac]
         # if we move our rook
-        if start == A1: castling_rights = self.cr.replace("Q", "")
-        if start == H1: castling_rights = self.cr.replace("K", "")
+        if start == A1: castling_rights = castling_rights.replace(own_a1, "")
+        if start == H1: castling_rights = castling_rights.replace(own_h1, "")
         # if we capture opponent's rook
-        if end == A8: castling_rights = self.cr.replace("k", "")
-        if end == H8: castling_rights = self.cr.replace("q", "")
+        if end == A8: castling_rights = castling_rights.replace(opp_a8, "")
+        if end == H8: castling_rights = castling_rights.replace(opp_h8, "")
         # if king moves
         if piece_start == "K":
-            if self.ac == 0: castling_rights = self.cr.replace("Q", "").replace("K", "")
-            else: castling_rights = self.cr.replace("q", "").replace("k", "")
+            castling_rights = castling_rights.replace(own_a1, "").replace(own_h1, "")
             # sets king passant square
             if abs(end - start) == 2:
-                kp = (start + end) // 2
-                board = insert(board, A1 if end < start else H1, ".")
-                board = insert(board, kp, "R")
+                king_passant = (start + end) // 2
+                rook = A1 if end < start else H1
+                board = insert(board, rook, ".")
+                board = insert(board, king_passant, "R")
+                h ^= keys["R"][rook] ^ keys["R"][king_passant]
         
         # pawn movement, promotion and en passant
         if piece_start == "P":
             if A8 <= end <= H8:
                 board = insert(board, end, promotion)
+                h ^= keys["P"][end] ^ keys[promotion][end]
             if (end + S) == (start + N):
                 en_passant = start + N
             if end == self.ep:
                 # takes en passant square
                 board = insert(board, self.ep + S, ".")
+                h ^= keys["p"][self.ep + S]
+
+        # update the hash with the castling rights, passant squares and side to move
+        if castling_rights != self.cr:
+            for c in set(castling_rights).symmetric_difference(self.cr):
+                h ^= ZOBRIST_CASTLING.get(c, 0)
+        h ^= ZOBRIST_EP[self.ac][self.ep] ^ ZOBRIST_EP[self.ac][en_passant]
+        h ^= ZOBRIST_KP[self.ac][self.kp] ^ ZOBRIST_KP[self.ac][king_passant]
+        h ^= ZOBRIST_SIDE
+
+        # captures and pawn moves reset the halfmove clock
+        clock = 0 if piece_start == "P" or piece_end != "." else self.clock + 1
+        fullmove = self.fullmove + self.ac
 
         # revert active color
         ac = 0 if self.ac == 1 else 1
         
         # returns rotated board
-        return BoardState(board, score, ac, castling_rights, en_passant, king_passant).rotate()
+        return BoardState(board, score, ac, castling_rights, en_passant, king_passant, h, clock, fullmove).rotate()
 
     def rotate(self, nullmove = False):
         ''' Rotates the board, negates the score, keeps the castling rights,
         and preserves en passant and king passant '''
         ep = 119 - self.ep if self.ep and not nullmove else 0
         kp = 119 - self.kp if self.kp and not nullmove else 0
-        return BoardState(self.board[::-1].swapcase(), -self.value, self.ac, self.cr, ep, kp)
+        ac, h, clock, fullmove = self.ac, self.hash, self.clock, self.fullmove
+        # a null move passes the turn, so the side to move and passant squares change.
+        # No position before it can repeat, so the halfmove clock starts again
+        if nullmove:
+            ac = 0 if self.ac == 1 else 1
+            h ^= ZOBRIST_EP[self.ac][self.ep] ^ ZOBRIST_KP[self.ac][self.kp] ^ ZOBRIST_SIDE
+            clock = 0
+            fullmove += self.ac
+        return BoardState(self.board[::-1].swapcase(), -self.value, ac, self.cr, ep, kp, h, clock, fullmove)
+
+    def generate_captures(self):
+        ''' Returns the captures and promotions among the available moves. '''
+        return generate_captures(self.board, self.ep, self.kp)
 
     def points(self, move) -> int:
         ''' Score the value of the move '''
+        return points(self.board, self.ep, self.kp, move)
+
+############################################
+
+def legal_moves(state) -> list:
+    ''' Returns the moves of a board state of any backend that don't leave the king in
+    check. Moves of pinned pieces are checked against the line of the pin, so only king
+    moves, en passant and replies to check need an attack probe after the move. '''
+    board, ep = state.board, state.ep
+    king = board.index("K")
+    check = is_attacked(board, king)
+    pinned = pins(board, king)
+    moves = []
+    for move in state.generate_moves():
+        start, end, _ = move
+        piece = board[start]
+        if piece == "P" and (end - start) in (N + W, N + E) and board[end] == "." and end != ep:
+            # takes the king passant square, which only the search needs
+            continue
+        if start == king:
+            # castling out of or through check
+            if abs(end - start) == 2 and (check or is_attacked(board, (start + end) // 2)):
+                continue
+            if is_attacked(insert(insert(board, end, "K"), start, "."), end):
+                continue
+        elif check or (piece == "P" and end == ep):
+            # en passant takes two pieces off a line to the king
+            after = insert(insert(board, end, piece), start, ".")
+            if piece == "P" and end == ep:
+                after = insert(after, end + S, ".")
+            if is_attacked(after, king):
+                continue
+        elif start in pinned and end not in pinned[start]:
+            continue
+        moves.append(move)
+    return moves
+
+def is_legal(state, move) -> bool:
+    ''' Checks that a move of a board state doesn't leave the king to be captured. '''
+    return move in legal_moves(state)
+
+def parse_san(state, san) -> Move:
+    ''' Converts a move in standard algebraic notation into a move of a board state. '''
+    import re
+
+    text = san.rstrip("+#!?")
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        # the king moves two squares towards the rook
+        king = state.board.index("K")
+        end = king + (2 if len(text) == 3 else -2) * (1 if state.ac == 0 else -1)
+        candidates = [m for m in state.generate_moves() if m.start == king and m.end == end]
+    else:
+        match = re.fullmatch("([NBRQK]?)([a-h]?)([1-8]?)x?([a-h][1-8])(?:=?([NBRQ]))?", text)
+        if match is None:
+            raise ValueError("invalid move: " + san)
+        piece, file, rank, square, promotion = match.groups()
+        piece, end = piece or "P", to_index(square, state.ac)
+        candidates = []
+        for m in state.generate_moves():
+            if m.end != end or state.board[m.start] != piece or m.promote != (promotion or ""):
+                continue
+            start = to_square(m.start, state.ac)
+            if (file and start[0] != file) or (rank and start[1] != rank):
+                continue
+            candidates.append(m)
+    candidates = [m for m in candidates if is_legal(state, m)]
+    if len(candidates) != 1:
+        raise ValueError(("ambiguous move: " if candidates else "illegal move: ") + san)
+    return candidates[0]
+
+def load_from_epd(epd) -> tuple:
+    '''
+    Parses an EPD line into a state and a dictionary of its operations. The moves of
+    bm (best move) and am (avoid move) are parsed into lists of moves, the operands
+    of other operations are kept as strings without quotes. The hmvc (halfmove clock)
+    and fmvn (fullmove number) operations set those of the state.
+    '''
+    import re
+    fields = epd.strip().split(None, 4)
+    state = BoardState(*load_from_fen(" ".join(fields[:4])))
+    operations = {}
+    for operation in re.findall(r'((?:[^;"]|"[^"]*")+);', fields[4] if len(fields) > 4 else ""):
+        opcode, _, operand = operation.strip().partition(" ")
+        if opcode in ("bm", "am"):
+            operations[opcode] = [parse_san(state, san) for san in operand.split()]
+        else:
+            operations[opcode] = operand.strip().strip('"')
+    if "hmvc" in operations:
+        if not operations["hmvc"].isdigit():
+            raise ValueError("invalid halfmove clock in EPD: " + operations["hmvc"])
+        state = state._replace(clock = int(operations["hmvc"]))
+    if "fmvn" in operations:
+        if not operations["fmvn"].isdigit():
+            raise ValueError("invalid fullmove number in EPD: " + operations["fmvn"])
+        state = state._replace(fullmove = int(operations["fmvn"]))
+    return State(*state), operations
+
+############################################
+
+class SearchPosition:
+    ''' Mutable position for searching, changed in place by make_move and restored
+    by unmake_move instead of building a new BoardState for every node.
+
+    The board is kept as two lists of 120 chars: the board as seen by white and as
+    seen by black, so the active color's view is always the rotated board that
+    BoardState would hold, and moves use the same indexes. '''
+
+    def __init__(self, state) -> None:
+        board = list(state.board)
+        rotated = [piece.swapcase() for piece in reversed(board)]
+        self.boards = (board, rotated) if state.ac == 0 else (rotated, board)
+        self.value  = state.value
+        self.ac     = state.ac
+        self.cr     = state.cr
+        self.ep     = state.ep
+        self.kp     = state.kp
+        self.hash   = state.hash
+        self.clock  = state.clock
+        self.fullmove = state.fullmove
+        # undo stack of (move, captured piece, value, cr, ep, kp, hash, clock)
+        self.history = []
+
+    @property
+    def board(self) -> list:
+        ''' The 120 char board as seen by the active color. '''
+        return self.boards[self.ac]
+
+    def state(self) -> BoardState:
+        ''' Returns an immutable copy of the position. '''
+        return BoardState("".join(self.board), self.value, self.ac, self.cr, self.ep, self.kp, self.hash, self.clock, self.fullmove)
+
+    def generate_moves(self):
+        ''' Returns list of available moves for all active indexes. '''
+        return generate_moves(self.boards[self.ac], self.ac, self.cr, self.ep, self.kp)
+
+    def generate_captures(self):
+        ''' Returns the captures and promotions among the available moves. '''
+        return generate_captures(self.boards[self.ac], self.ep, self.kp)
+
+    def generate_codes(self, out) -> None:
+        ''' Appends the available moves to out as packed ints. '''
+        generate_codes(self.boards[self.ac], self.ac, self.cr, self.ep, self.kp, out)
+
+    def generate_capture_codes(self, out) -> None:
+        ''' Appends the captures and promotions to out as packed ints. '''
+        generate_capture_codes(self.boards[self.ac], self.ep, self.kp, out)
+
+    def points(self, move) -> int:
+        ''' Score the value of the move '''
+        return points(self.boards[self.ac], self.ep, self.kp, move)
+
+    def make_move(self, move) -> None:
+        ''' Performs the move in place, saving what is needed to take it back '''
+        # initialize values
         start, end, promotion = move
-        p_start, p_end = self.board[start], self.board[end]
+        ac = self.ac
+        board, rotated = self.boards[ac], self.boards[1 - ac]
+        piece_start, piece_end = board[start], board[end]
+        self.history.append((move, piece_end, self.value, self.cr, self.ep, self.kp, self.hash, self.clock))
+        score = self.value + points(board, self.ep, self.kp, move)
 
-        # finds move in the pst boards
-        value = PIECE_SQUARE_TABLES[p_start][end] - PIECE_SQUARE_TABLES[p_start][start]
+        # reset all the values
+        en_passant, king_passant = 0, 0
 
-        # captures a piece
-        if p_end.islower():
-            value += PIECE[p_end.upper()]
-        
-        # checks if castled
-        if abs(end - self.kp) < 2:
-            value += PIECE_SQUARE_TABLES["K"][119 - end]
-    
-        # castle
-        if p_start == "K" and abs(start - end) == 2:
-            value += PIECE_SQUARE_TABLES["R"][(start + end) // 2]
-            value -= PIECE_SQUARE_TABLES["R"][A1 if end < start else H1]
+        # move the piece, on both views of the board
+        keys = ZOBRIST_PIECES[ac]
+        h = self.hash ^ keys[piece_start][start] ^ keys[piece_start][end]
+        if piece_end != ".": h ^= keys[piece_end][end]
+        board[end], rotated[119 - end] = piece_start, piece_start.lower()
+        board[start], rotated[119 - start] = ".", "."
 
-        # pawn promotion and enpassant
-        if p_start == "P":
+        # castling -
+        castling_rights = self.cr
+        own_a1, own_h1, opp_a8, opp_h8 = CASTLING_RIGHTS[ac]
+        # if we move our rook
+        if start == A1: castling_rights = castling_rights.replace(own_a1, "")
+        if start == H1: castling_rights = castling_rights.replace(own_h1, "")
+        # if we capture opponent's rook
+        if end == A8: castling_rights = castling_rights.replace(opp_a8, "")
+        if end == H8: castling_rights = castling_rights.replace(opp_h8, "")
+        # if king moves
+        if piece_start == "K":
+            castling_rights = castling_rights.replace(own_a1, "").replace(own_h1, "")
+            # sets king passant square
+            if abs(end - start) == 2:
+                king_passant = (start + end) // 2
+                rook = A1 if end < start else H1
+                board[rook], rotated[119 - rook] = ".", "."
+                board[king_passant], rotated[119 - king_passant] = "R", "r"
+                h ^= keys["R"][rook] ^ keys["R"][king_passant]
+
+        # pawn movement, promotion and en passant
+        if piece_start == "P":
             if A8 <= end <= H8:
-                value += PIECE_SQUARE_TABLES[promotion][end] - PIECE_SQUARE_TABLES["P"][end]
+                board[end], rotated[119 - end] = promotion, promotion.lower()
+                h ^= keys["P"][end] ^ keys[promotion][end]
+            if (end + S) == (start + N):
+                en_passant = start + N
             if end == self.ep:
-                value += PIECE_SQUARE_TABLES["P"][119 - (end + S)]
+                # takes en passant square
+                board[self.ep + S], rotated[119 - (self.ep + S)] = ".", "."
+                h ^= keys["p"][self.ep + S]
+
+        # update the hash with the castling rights, passant squares and side to move
+        if castling_rights != self.cr:
+            for c in set(castling_rights).symmetric_difference(self.cr):
+                h ^= ZOBRIST_CASTLING.get(c, 0)
+        h ^= ZOBRIST_EP[ac][self.ep] ^ ZOBRIST_EP[ac][en_passant]
+        h ^= ZOBRIST_KP[ac][self.kp] ^ ZOBRIST_KP[ac][king_passant]
+        h ^= ZOBRIST_SIDE
+
+        # pass the turn, as rotate does for BoardState
+        self.ac     = 1 - ac
+        self.value  = -score
+        self.cr     = castling_rights
+        self.ep     = 119 - en_passant if en_passant else 0
+        self.kp     = 119 - king_passant if king_passant else 0
+        self.hash   = h
+        # captures and pawn moves reset the halfmove clock
+        self.clock  = 0 if piece_start == "P" or piece_end != "." else self.clock + 1
+        self.fullmove += ac
+
+    def unmake_move(self) -> None:
+        ''' Takes back the last move made by make_move '''
+        move, piece_end, self.value, self.cr, self.ep, self.kp, self.hash, self.clock = self.history.pop()
+        start, end, promotion = move
+        ac = self.ac = 1 - self.ac
+        self.fullmove -= ac
+        board, rotated = self.boards[ac], self.boards[1 - ac]
+
+        # put the piece back, undoing a promotion
+        piece_start = "P" if promotion else board[end]
+        board[start], rotated[119 - start] = piece_start, piece_start.lower()
+        board[end], rotated[119 - end] = piece_end, piece_end.swapcase()
+
+        # put the rook back after castling
+        if piece_start == "K" and abs(end - start) == 2:
+            king_passant = (start + end) // 2
+            rook = A1 if end < start else H1
+            board[king_passant], rotated[119 - king_passant] = ".", "."
+            board[rook], rotated[119 - rook] = "R", "r"
+
+        # put back a pawn taken en passant
+        if piece_start == "P" and end == self.ep:
+            board[self.ep + S], rotated[119 - (self.ep + S)] = "p", "P"
+
+    def make_null(self) -> None:
+        ''' Passes the turn without moving, as BoardState.rotate(nullmove = True) '''
+        self.history.append((None, None, self.value, self.cr, self.ep, self.kp, self.hash, self.clock))
+        self.hash  ^= ZOBRIST_EP[self.ac][self.ep] ^ ZOBRIST_KP[self.ac][self.kp] ^ ZOBRIST_SIDE
+        self.fullmove += self.ac
+        self.ac     = 1 - self.ac
+        self.value  = -self.value
+        self.ep     = 0
+        self.kp     = 0
+        self.clock  = 0
+
+    def unmake_null(self) -> None:
+        ''' Takes back the last null move '''
+        _, _, self.value, self.cr, self.ep, self.kp, self.hash, self.clock = self.history.pop()
+        self.ac = 1 - self.ac
+        self.fullmove -= self.ac
+
+class StateStack:
+    ''' Adapts an immutable state (BoardState or bitboard.BitBoardState) to the
+    make_move / unmake_move interface of SearchPosition. '''
+
+    def __init__(self, state) -> None:
+        self.current = state
+        # the board of the current state, kept once read, as the search reads it many
+        # times a node and a bitboard state builds it from its bitboards on every read
+        self.cached = None
+        # undo stack of (state, cached board)
+        self.history = []
+
+    # fields of the current state read by the search
+    value = property(lambda self: self.current.value)
+    hash  = property(lambda self: self.current.hash)
+    ac    = property(lambda self: self.current.ac)
+    ep    = property(lambda self: self.current.ep)
+    kp    = property(lambda self: self.current.kp)
+    clock = property(lambda self: self.current.clock)
+
+    @property
+    def board(self) -> str:
+        ''' The 120 char board as seen by the active color. '''
+        if self.cached is None:
+            self.cached = self.current.board
+        return self.cached
+
+    def state(self):
+        ''' Returns the current immutable state. '''
+        return self.current
+
+    def generate_moves(self):
+        ''' Returns list of available moves for all active indexes. '''
+        return self.current.generate_moves()
+
+    def generate_captures(self):
+        ''' Returns the captures and promotions among the available moves. '''
+        return self.current.generate_captures()
+
+    def generate_codes(self, out) -> None:
+        ''' Appends the available moves to out as packed ints. '''
+        self.current.generate_codes(out)
+
+    def generate_capture_codes(self, out) -> None:
+        ''' Appends the captures and promotions to out as packed ints. '''
+        self.current.generate_capture_codes(out)
+
+    def points(self, move) -> int:
+        ''' Score the value of the move '''
+        return self.current.points(move)
+
+    def make_move(self, move) -> None:
+        ''' Moves to the state after the move '''
+        self.history.append((self.current, self.cached))
+        self.current = self.current.move(move)
+        self.cached = None
+
+    def unmake_move(self) -> None:
+        ''' Returns to the state before the last move '''
+        self.current, self.cached = self.history.pop()
+
+    def make_null(self) -> None:
+        ''' Passes the turn without moving '''
+        self.history.append((self.current, self.cached))
+        self.current = self.current.rotate(nullmove = True)
+        self.cached = None
 
-        return value
\ No newline at end of file
+    unmake_null = unmake_move
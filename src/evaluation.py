@@ -0,0 +1,220 @@
+from chessboard import PIECE, PIECE_SQUARE_TABLES, ZOBRIST_PIECES, DIRECTIONS, N, E, S, W
+
+# The incremental value of a position is the material and middlegame piece-square sum.
+# The evaluator adds to it the terms below, each with a middlegame and an endgame weight,
+# blended by the phase of the game: the non-pawn material left on the board.
+
+# phase each piece counts for, 24 with all of them on the board
+PHASE       = {"N": 1, "B": 1, "R": 2, "Q": 4}
+MAX_PHASE   = 24
+
+# pawn structure, as (middlegame, endgame)
+DOUBLED     = (-10, -20)    # for each pawn on a file after the first
+ISOLATED    = (-10, -15)    # for a pawn without pawns of its color on the files beside it
+# for a pawn with no opposing pawn ahead of it on its file or the files beside it, by rank
+PASSED_MG   = (0, 0, 0, 5, 10, 20, 35, 50, 0)
+PASSED_EG   = (0, 0, 10, 15, 25, 45, 75, 110, 0)
+
+# mobility: (middlegame, endgame) for each square a piece can move to, over the usual count
+MOBILITY    = {"N": (4, 4, 4), "B": (5, 5, 6), "R": (2, 4, 6), "Q": (1, 2, 12)}
+
+# king safety, in the middlegame only: for pawns in front of the king, one and two ranks
+# ahead, and for each of the other color's pieces close to the king, by piece and distance
+SHIELD      = (10, 5)
+TROPISM     = {"N": 3, "B": 2, "R": 2, "Q": 5}
+CLOSE       = 4             # pieces count by how many squares nearer than this they are
+
+def _on_board(index) -> bool:
+    return 0 < index % 10 < 9 and 1 < index // 10 < 10
+
+# the king's middlegame table keeps it behind its pawns, in the endgame it belongs in the centre
+def _king_endgame(index) -> int:
+    row, column = divmod(index, 10)
+    return 20 - 10 * ((abs(2 * column - 9) + abs(2 * row - 11)) // 2)
+
+# KING_ENDGAME[index] - the endgame value of a king on the index, over its middlegame value
+KING_ENDGAME = tuple(_king_endgame(i) - (PIECE_SQUARE_TABLES["K"][i] - PIECE["K"]) if _on_board(i) else 0 for i in range(120))
+
+# ROW[index], COLUMN[index] - where the index is on the padded board
+ROW = tuple(i // 10 for i in range(120))
+COLUMN = tuple(i % 10 for i in range(120))
+
+def _rays(index, piece) -> tuple:
+    rays = []
+    for d in DIRECTIONS[piece]:
+        ray, j = [], index + d
+        while _on_board(j):
+            ray.append(j)
+            if piece == "N":
+                break
+            j += d
+        rays.append(tuple(ray))
+    return tuple(rays)
+
+# RAYS[piece][index] - the squares a piece on the index moves along, in each of its
+# directions, up to the edge of the board. A knight's rays are a square long
+RAYS = {piece: tuple(_rays(i, piece) if _on_board(i) else () for i in range(120)) for piece in MOBILITY}
+
+def find_all(board, piece) -> list:
+    ''' Returns the indexes of the piece on the board. '''
+    indexes = []
+    index = board.find(piece)
+    while index != -1:
+        indexes.append(index)
+        index = board.find(piece, index + 1)
+    return indexes
+
+def pawn_structure(own, other) -> tuple:
+    ''' Scores the doubled, isolated and passed pawns of the active color, on the indexes
+    own, against those of the other color on the indexes other, as (middlegame, endgame). '''
+    own_files, other_files = [0] * 10, [0] * 10
+    for index in own:
+        own_files[index % 10] += 1
+    for index in other:
+        other_files[index % 10] += 1
+
+    mg = eg = 0
+    for files, sign in ((own_files, 1), (other_files, -1)):
+        for file in range(1, 9):
+            if files[file] > 1:
+                mg += sign * DOUBLED[0] * (files[file] - 1)
+                eg += sign * DOUBLED[1] * (files[file] - 1)
+            if files[file] and not files[file - 1] and not files[file + 1]:
+                mg += sign * ISOLATED[0] * files[file]
+                eg += sign * ISOLATED[1] * files[file]
+    # the pawns of the active color move up the board, to lower indexes
+    for index in own:
+        row, file = divmod(index, 10)
+        if not any(j // 10 < row and abs(j % 10 - file) < 2 for j in other):
+            mg += PASSED_MG[10 - row]
+            eg += PASSED_EG[10 - row]
+    for index in other:
+        row, file = divmod(index, 10)
+        if not any(j // 10 > row and abs(j % 10 - file) < 2 for j in own):
+            mg -= PASSED_MG[row - 1]
+            eg -= PASSED_EG[row - 1]
+    return mg, eg
+
+class Evaluator:
+    ''' Tapered evaluation of positions, for the side to move. Pawn structures are cached
+    by a Zobrist key of the pawns alone, and whole evaluations by the position's hash,
+    each in a fixed size table indexed by the key. '''
+
+    def __init__(self, size = 1 << 16, pawn_size = 1 << 12) -> None:
+        # sizes are rounded down to a power of two so that the index is a mask of the key
+        self.mask = (1 << (size.bit_length() - 1)) - 1
+        self.keys = [None] * (self.mask + 1)
+        self.scores = [0] * (self.mask + 1)
+        self.pawn_mask = (1 << (pawn_size.bit_length() - 1)) - 1
+        self.pawn_keys = [None] * (self.pawn_mask + 1)
+        self.pawn_scores = [None] * (self.pawn_mask + 1)
+        self.new_search()
+
+    def new_search(self) -> None:
+        ''' Resets the counts of probes and hits, which are kept for each search. '''
+        self.probes = self.hits = 0
+        self.pawn_probes = self.pawn_hits = 0
+
+    def hit_rates(self) -> tuple:
+        ''' Returns the share of evaluations and of pawn structures found in the caches. '''
+        return self.hits / max(self.probes, 1), self.pawn_hits / max(self.pawn_probes, 1)
+
+    def evaluate(self, pos) -> int:
+        ''' Returns the score of the position for the side to move: its incremental value
+        and the terms of the tapered evaluation. '''
+        h = pos.hash
+        slot = h & self.mask
+        self.probes += 1
+        if self.keys[slot] == h:
+            self.hits += 1
+            return pos.value + self.scores[slot]
+        board = pos.board
+        if not isinstance(board, str):
+            board = "".join(board)
+        score = self.adjustment(board, pos.ac)
+        self.keys[slot] = h
+        self.scores[slot] = score
+        return pos.value + score
+
+    def pawns(self, board, ac) -> tuple:
+        ''' Returns the pawn structure score of the board, from the pawn table if it
+        has been scored before. '''
+        own, other = find_all(board, "P"), find_all(board, "p")
+        # the keys are those of the absolute board, so the key and the stored
+        # score, which is white's, don't depend on the side to move
+        keys = ZOBRIST_PIECES[ac]
+        own_keys, other_keys = keys["P"], keys["p"]
+        key = 0
+        for index in own:
+            key ^= own_keys[index]
+        for index in other:
+            key ^= other_keys[index]
+
+        slot = key & self.pawn_mask
+        self.pawn_probes += 1
+        if self.pawn_keys[slot] == key:
+            self.pawn_hits += 1
+            mg, eg = self.pawn_scores[slot]
+        else:
+            mg, eg = pawn_structure(own, other)
+            if ac == 1:
+                mg, eg = -mg, -eg
+            self.pawn_keys[slot] = key
+            self.pawn_scores[slot] = (mg, eg)
+        return (-mg, -eg) if ac == 1 else (mg, eg)
+
+    def adjustment(self, board, ac) -> int:
+        ''' Scores the board on top of its incremental value, for the active color. '''
+        mg, eg = self.pawns(board, ac)
+
+        own_king, other_king = board.find("K"), board.find("k")
+        phase = 0
+        for piece in "NBRQnbrq":
+            indexes = find_all(board, piece)
+            if not indexes:
+                continue
+            upper = piece.upper()
+            own = piece == upper
+            weight_mg, weight_eg, usual = MOBILITY[upper]
+            # squares the pieces can move to, empty or of the other color, over the usual count
+            rays, captures = RAYS[upper], "pnbrqk" if own else "PNBRQK"
+            moves = -usual * len(indexes)
+            # and how close they are to the other king
+            king = other_king if own else own_king
+            row, column, close = ROW[king], COLUMN[king], 0
+            for index in indexes:
+                for ray in rays[index]:
+                    for j in ray:
+                        target = board[j]
+                        if target == ".":
+                            moves += 1
+                            continue
+                        if target in captures:
+                            moves += 1
+                        break
+                close += max(0, CLOSE - max(abs(ROW[index] - row), abs(COLUMN[index] - column)))
+            phase += PHASE[upper] * len(indexes)
+            if own:
+                mg += weight_mg * moves + TROPISM[upper] * close
+                eg += weight_eg * moves
+            else:
+                mg -= weight_mg * moves + TROPISM[upper] * close
+                eg -= weight_eg * moves
+
+        # pawn shields: the active color's pawns are ahead of its king at lower indexes
+        shield = 0
+        for d in (N + W, N, N + E):
+            if board[own_king + d] == "P":
+                shield += SHIELD[0]
+            elif board[own_king + d + N] == "P":
+                shield += SHIELD[1]
+            if board[other_king - d] == "p":
+                shield -= SHIELD[0]
+            elif board[other_king - d + S] == "p":
+                shield -= SHIELD[1]
+        mg += shield
+        eg += KING_ENDGAME[own_king] - KING_ENDGAME[119 - other_king]
+
+        # rounded towards zero, so that the score of either side is minus the other's
+        phase = min(phase, MAX_PHASE)
+        return int((mg * phase + eg * (MAX_PHASE - phase)) / MAX_PHASE)
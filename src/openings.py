@@ -1,51 +1,96 @@
-import pandas as pd
-import re
-import string
+import os
+import mmap
+import struct
 import chessboard
 
-class Openings:
-
-    NUM_OF_OPENINGS = 2
-
-    def __init__(self) -> None:
-        self.openings = self.read()
-
-    def read(self) -> list:
-        ''' Reads all 5 opening files and converts into a list of list of end moves. '''
-        li = []
-        paths = ['./data/chess_openings/a.tsv', './data/chess_openings/b.tsv', './data/chess_openings/c.tsv', './data/chess_openings/d.tsv', './data/chess_openings/e.tsv']
-        for path in paths:
-            database = pd.read_csv(path, index_col = None, header = 0, sep = "\t")
-            li.append(database)
-        openings = pd.concat(li, axis = 0, ignore_index = True)
-        all_pgn = pd.Series(openings['pgn'], dtype = pd.StringDtype())
-        result = []
-        for pgn in all_pgn:
-            insert = self.convert_pgn(pgn)
-            if len(insert) != 0 and len(insert) == self.NUM_OF_OPENINGS:
-                result.append(insert)
-        return result
-
-    def convert_pgn(self,pgn) -> list:
-        ''' Converts the given pgn into a list of end moves. '''
-        list_pgn = re.split(".\\.", pgn)[1:]
-        end_moves = []
+# the book is a sorted array of entries after a header, so a position's moves are
+# found by binary search of the file mapped into memory, without reading it all
+BOOK_PATH   = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "book.bin")
+TSV_PATHS   = [os.path.join(os.path.dirname(BOOK_PATH), "chess_openings", c + ".tsv") for c in "abcde"]
+MAGIC       = b"BOOK0001"
+HEADER      = struct.Struct("<8sI")     # magic, number of entries
+ENTRY       = struct.Struct("<QBBBxH")  # Zobrist hash, move start, end, promotion, weight
+KEY         = struct.Struct("<Q")
+PROMOTIONS  = ("", "N", "B", "R", "Q")
+
+class Book:
+    ''' An opening book of moves by position, read from a file built by build(). '''
+
+    def __init__(self, path = BOOK_PATH) -> None:
+        self.size = 0
+        self.data = None
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, self.size = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise ValueError("not an opening book: " + path)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def key(self, i) -> int:
+        return KEY.unpack_from(self.data, HEADER.size + i * ENTRY.size)[0]
+
+    def probe(self, key) -> list:
+        ''' Returns the (move, weight) entries of the position with the Zobrist hash. '''
+        # binary search for the first entry of the key
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
         entries = []
-        for x in list_pgn:
-            x = x.strip()
-            x = x.split(" ")
-            if len(x) < 2:
-                return []
-            entries.append((x[0][-2:], x[1][-2:]))
-
-        def convert_to_index(entry) -> int:
-            try: return chessboard.A1 + (string.ascii_lowercase.find(entry[0]) * chessboard.E) + ((int(entry[1]) - 1) * chessboard.N)
-            except Exception: raise Exception
-
-        for entry in entries:
-            try:
-                entry = (convert_to_index(entry[0]), 119 - convert_to_index(entry[1]))
-            except Exception:
-                continue
-            end_moves.append(entry)
-        return end_moves
+        for i in range(low, self.size):
+            entry_key, start, end, promotion, weight = ENTRY.unpack_from(self.data, HEADER.size + i * ENTRY.size)
+            if entry_key != key:
+                break
+            entries.append((chessboard.Move(start, end, PROMOTIONS[promotion]), weight))
+        return entries
+
+    def choose(self, state, rng = None) -> object:
+        ''' Picks a book move of the state at random, more often the more games reached
+        it, or returns None if the position isn't in the book. '''
+        if rng is None:
+            import random as rng
+        # a hash collision can give moves of another position
+        moves = set(state.legal_moves())
+        entries = [(move, weight) for move, weight in self.probe(state.hash) if move in moves]
+        if not entries:
+            return None
+        return rng.choices([move for move, _ in entries], [weight for _, weight in entries])[0]
+
+def read_pgns(paths = TSV_PATHS):
+    ''' Yields the move lists of the openings in the tab separated files. '''
+    import re, csv
+    for path in paths:
+        with open(path, newline = "") as file:
+            for row in csv.DictReader(file, delimiter = "\t"):
+                # drop the move numbers
+                yield re.sub(r"\d+\.(\.\.)?", " ", row["pgn"]).split()
+
+def build(paths = TSV_PATHS, book_path = BOOK_PATH) -> int:
+    ''' Plays every opening through the board and writes each (position, move) it
+    passes through to the book, weighted by the number of openings that play it.
+    Returns the number of entries. '''
+    weights = {}
+    initial = chessboard.BoardState(*chessboard.INITIAL_STATE)
+    for pgn in read_pgns(paths):
+        state = initial
+        for san in pgn:
+            move = chessboard.parse_san(state, san)
+            weights[state.hash, move] = weights.get((state.hash, move), 0) + 1
+            state = state.move(move)
+
+    entries = sorted(weights.items(), key = lambda item: (item[0][0], -item[1], item[0][1]))
+    with open(book_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(entries)))
+        for (key, move), weight in entries:
+            file.write(ENTRY.pack(key, move.start, move.end, PROMOTIONS.index(move.promote), min(weight, 0xFFFF)))
+    return len(entries)
+
+if __name__ == "__main__":
+    print("entries", build())
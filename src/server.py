@@ -0,0 +1,489 @@
+''' A local analysis server, so that tools share a few warm engines instead of each
+starting its own interpreter and reading the opening book. Requests and replies are
+JSON objects, one per line, over TCP or a Unix socket:
+
+    {"id": 1, "type": "analyse", "fen": "...", "moves": ["e2e4"], "time": 2, "nodes": 100000, "depth": 8}
+    {"id": 2, "type": "bestmove", "fen": "startpos", "book": false}
+    {"id": 1, "type": "cancel"}
+    {"id": 3, "type": "metrics"}
+
+An analysis is answered by an info reply for each completed depth, then a result; a
+best move by a result alone. A cancelled search replies with the result it had found,
+marked cancelled. Requests are queued for a pool of worker processes, each keeping a
+bot and its transposition table between requests, and are refused with a busy error
+while the queue is full.
+
+    python src/server.py --port 8765 --workers 4
+    python src/server.py --unix /tmp/chess-engine.sock --queue 64
+'''
+import json, time, signal, asyncio, argparse, itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import chessboard, bot, openings
+from chessboard import BoardState, to_uci
+
+HOST        = "127.0.0.1"
+PORT        = 8765
+REQUESTS    = ("analyse", "bestmove")
+
+def position(fen, moves) -> tuple:
+    ''' Returns the state after the moves, in long algebraic notation, from the FEN or
+    the starting position, and the hashes of the positions before it. Raises ValueError
+    for a FEN or move that can't be read. '''
+    state = BoardState(*chessboard.INITIAL_STATE) if fen in (None, "startpos") else BoardState.from_fen(fen)
+    history = []
+    for uci_move in moves:
+        move = {to_uci(move, state.ac): move for move in state.legal_moves()}.get(uci_move)
+        if move is None:
+            raise ValueError("illegal move " + str(uci_move))
+        history.append(state.hash)
+        state = state.move(move)
+    return state, history
+
+#########################################
+
+def work(connection, stop, hash_size) -> None:
+    ''' Runs in a worker process: searches the jobs read from the connection, until it
+    reads None, with the same bot throughout so its tables stay warm. '''
+    # an interrupt reaches the whole process group, and the server stops the workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    engine = bot.Bot(hash_size)
+    book = openings.Book()
+    connection.send(("ready", None))
+    while True:
+        job = connection.recv()
+        if job is None:
+            break
+        connection.send(("result", search(engine, book, job, stop, connection)))
+
+def search(engine, book, job, stop, connection) -> dict:
+    ''' Searches the state of the job, sending an info message for every completed depth
+    of an analysis, and returns the result. '''
+    state = job["state"]
+    if job["type"] == "bestmove" and job["book"]:
+        move = book.choose(state)
+        if move is not None:
+            return {"move": to_uci(move, state.ac), "book": True}
+
+    start_time = time.time()
+    reported = None
+    fallback = None
+    for _, _, _, gamma, score, move in engine.search(
+        state, time_limit = job["time"], node_limit = job["nodes"], stop = stop, history = job["history"],
+        depth_limit = job["depth"]):
+        if score >= gamma and move is not None:
+            fallback = move
+        if engine.result is not reported:
+            reported = engine.result
+            if job["type"] == "analyse":
+                connection.send(("info", report(engine, state, start_time)))
+    if job["type"] == "analyse" and engine.result is not reported:
+        connection.send(("info", report(engine, state, start_time)))
+
+    move = engine.result[2] if engine.result is not None and engine.result[2] else fallback
+    if move is None:
+        # no move was found in time, or there is none to play
+        move = next(iter(state.legal_moves()), None)
+    result = report(engine, state, start_time)
+    result.update(move = to_uci(move, state.ac) if move is not None else None, book = False)
+    return result
+
+def report(engine, state, start_time) -> dict:
+    ''' The depth, score, nodes, time and principal variation of the last completed
+    iteration, with the score as mate in a number of moves when it is one. '''
+    depth, score, _ = engine.result or (0, None, None)
+    pv, position = [], state
+    for move in engine.principal_variation(state, depth):
+        pv.append(to_uci(move, position.ac))
+        position = position.move(move)
+    mate = None
+    if score is not None and abs(score) >= bot.MATE_LOWER_BOUND:
+        # the variation ends in the capture of the king, one ply after mate
+        mate = (len(pv) + 1) // 2 * (1 if score > 0 else -1)
+    return {
+        "depth":    depth,
+        "score":    score,
+        "mate":     mate,
+        "nodes":    engine.nodes + engine.qnodes,
+        "time":     round(time.time() - start_time, 3),
+        "pv":       pv,
+    }
+
+#########################################
+
+class Worker:
+    ''' A worker process, the end of the pipe to it and the signal that stops its search. '''
+
+    def __init__(self, context, hash_size) -> None:
+        self.connection, child = context.Pipe()
+        self.stop = context.Event()
+        self.process = context.Process(target = work, args = (child, self.stop, hash_size), daemon = True)
+        self.process.start()
+        child.close()
+        # the job being searched
+        self.job = None
+
+class Job:
+    ''' A request waiting for or being searched by a worker. '''
+
+    def __init__(self, client, id, search) -> None:
+        self.client     = client
+        self.id         = id
+        self.search     = search
+        self.submitted  = time.time()
+        self.worker     = None
+        self.cancelled  = False
+
+class Metrics:
+    ''' Counts of the requests over the life of the server, and the times the last
+    WINDOW of them waited in the queue and were searched for. '''
+
+    WINDOW = 1000
+
+    def __init__(self) -> None:
+        self.start_time = time.time()
+        self.submitted = self.completed = self.rejected = self.cancelled = self.failed = 0
+        # nodes searched and seconds spent searching, by all the workers
+        self.nodes = 0
+        self.search_time = 0.0
+        self.waits = deque(maxlen = self.WINDOW)
+        self.runs = deque(maxlen = self.WINDOW)
+
+    @staticmethod
+    def summary(times) -> dict:
+        ''' The mean, median, 95th percentile and most of the times, in milliseconds. '''
+        if not times:
+            return {"mean": None, "p50": None, "p95": None, "max": None}
+        ordered = sorted(times)
+        return {
+            "mean":     round(sum(ordered) / len(ordered) * 1000, 2),
+            "p50":      round(ordered[len(ordered) // 2] * 1000, 2),
+            "p95":      round(ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)] * 1000, 2),
+            "max":      round(ordered[-1] * 1000, 2),
+        }
+
+    def to_dict(self, queued, busy, workers) -> dict:
+        uptime = max(time.time() - self.start_time, 1e-6)
+        return {
+            "uptime":           round(uptime, 3),
+            "workers":          workers,
+            "busy":             busy,
+            "queued":           queued,
+            "submitted":        self.submitted,
+            "completed":        self.completed,
+            "rejected":         self.rejected,
+            "cancelled":        self.cancelled,
+            "failed":           self.failed,
+            "throughput":       round(self.completed / uptime, 3),
+            "nps":              round(self.nodes / max(self.search_time, 1e-6)),
+            "queue_latency":    self.summary(self.waits),
+            "search_time":      self.summary(self.runs),
+        }
+
+class Server:
+    ''' Serves requests from any number of clients on a pool of worker processes, taking
+    them in the order they came through a queue of at most queue_size requests. Searches
+    run for at most max_time seconds, and for default_time when a request gives no limit. '''
+
+    def __init__(self, workers = 2, hash_size = 16, queue_size = 16, default_time = 1.0, max_time = 60.0) -> None:
+        self.size           = workers
+        self.hash_size      = hash_size
+        self.default_time   = default_time
+        self.max_time       = max_time
+        self.queue          = asyncio.Queue(queue_size)
+        self.metrics        = Metrics()
+        self.workers        = []
+        self.tasks          = []
+        # the jobs queued or being searched, by client and id
+        self.jobs           = {}
+        # threads that wait for the messages of the workers, one for each
+        self.executor       = ThreadPoolExecutor(workers)
+        self.servers        = []
+
+    async def start(self) -> None:
+        ''' Starts the workers, returning once they are ready. '''
+        for _ in range(self.size):
+            worker = await self.spawn()
+            self.workers.append(worker)
+            self.tasks.append(asyncio.create_task(self.dispatch(worker)))
+
+    async def spawn(self) -> Worker:
+        worker = Worker(bot.processes(), self.hash_size)
+        await self.receive(worker)
+        return worker
+
+    async def receive(self, worker) -> tuple:
+        return await asyncio.get_running_loop().run_in_executor(self.executor, worker.connection.recv)
+
+    async def listen(self, host = HOST, port = PORT, path = None) -> None:
+        ''' Accepts clients on the Unix socket at the path, or on the host and port. '''
+        if path is not None:
+            self.servers.append(await asyncio.start_unix_server(self.serve, path))
+        else:
+            self.servers.append(await asyncio.start_server(self.serve, host, port))
+
+    async def close(self) -> None:
+        ''' Stops listening and searching, and ends the worker processes. '''
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+        for task in self.tasks:
+            task.cancel()
+        loop = asyncio.get_running_loop()
+        for worker in self.workers:
+            worker.stop.set()
+            try:
+                worker.connection.send(None)
+            except OSError:
+                pass
+        for worker in self.workers:
+            await loop.run_in_executor(None, worker.process.join, 5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self.executor.shutdown(wait = False)
+
+    #########################################
+
+    async def serve(self, reader, writer) -> None:
+        ''' Reads the requests of a client until it disconnects, then stops its searches. '''
+        client = Client(reader, writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("a request is a JSON object")
+                except ValueError as error:
+                    await self.reply(client, {"type": "error", "error": str(error)})
+                    continue
+                await self.handle(client, request)
+        except ConnectionError:
+            pass
+        finally:
+            # nobody is left to read the results of its searches
+            for job in list(self.jobs.values()):
+                if job.client is client:
+                    await self.cancel(job, reply = False)
+            writer.close()
+
+    async def handle(self, client, request) -> None:
+        ''' Queues, cancels or answers a request. '''
+        id, kind = request.get("id"), request.get("type")
+        if kind == "metrics":
+            busy = sum(worker.job is not None for worker in self.workers)
+            await self.reply(client, dict(self.metrics.to_dict(self.queue.qsize(), busy, self.size), id = id, type = "metrics"))
+        elif kind == "cancel":
+            job = self.jobs.get((client, id))
+            if job is None:
+                await self.reply(client, {"id": id, "type": "error", "error": "no request to cancel"})
+            else:
+                await self.cancel(job)
+        elif kind in REQUESTS:
+            await self.submit(client, id, request)
+        else:
+            await self.reply(client, {"id": id, "type": "error", "error": "unknown request type " + str(kind)})
+
+    async def reply(self, client, message) -> None:
+        ''' Sends the message to the client, unless it has gone. '''
+        if client.writer.is_closing():
+            return
+        try:
+            await client.send(message)
+        except ConnectionError:
+            pass
+
+    async def submit(self, client, id, request) -> None:
+        ''' Queues the search a request asks for, or refuses it if the queue is full. '''
+        if (client, id) in self.jobs:
+            await self.reply(client, {"id": id, "type": "error", "error": "a request with the id is running"})
+            return
+        try:
+            state, history = position(request.get("fen"), request.get("moves", []))
+            time_limit = None if request.get("time") is None else float(request["time"])
+            node_limit = None if request.get("nodes") is None else int(request["nodes"])
+            depth_limit = None if request.get("depth") is None else int(request["depth"])
+        except (ValueError, TypeError) as error:
+            await self.reply(client, {"id": id, "type": "error", "error": str(error)})
+            return
+        if time_limit is None and node_limit is None and depth_limit is None:
+            time_limit = self.default_time
+        search = {
+            "type":     request["type"],
+            "state":    state,
+            "history":  history,
+            "time":     self.max_time if time_limit is None else min(time_limit, self.max_time),
+            "nodes":    node_limit,
+            "depth":    depth_limit,
+            "book":     bool(request.get("book", True)),
+        }
+        job = Job(client, id, search)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.metrics.rejected += 1
+            await self.reply(client, {"id": id, "type": "error", "error": "busy", "queued": self.queue.qsize()})
+            return
+        self.metrics.submitted += 1
+        self.jobs[client, id] = job
+
+    async def cancel(self, job, reply = True) -> None:
+        ''' Stops the job's search, which still replies with its result, or drops it
+        from the queue if no worker has taken it. '''
+        if job.cancelled:
+            return
+        job.cancelled = True
+        self.metrics.cancelled += 1
+        if job.worker is not None:
+            job.worker.stop.set()
+            return
+        # left in the queue, the worker that takes it passes over it
+        del self.jobs[job.client, job.id]
+        if reply:
+            await self.reply(job.client, {"id": job.id, "type": "error", "error": "cancelled"})
+
+    async def dispatch(self, worker) -> None:
+        ''' Feeds jobs from the queue to the worker, replying to the clients as it searches. '''
+        while True:
+            job = await self.queue.get()
+            if job.cancelled:
+                continue
+            started = time.time()
+            self.metrics.waits.append(started - job.submitted)
+            worker.stop.clear()
+            worker.job, job.worker = job, worker
+            try:
+                message = await self.run(worker, job)
+            except (EOFError, OSError):
+                message = None
+            worker.job = None
+            del self.jobs[job.client, job.id]
+
+            if message is None:
+                # the worker died, and another takes its place
+                self.metrics.failed += 1
+                await self.reply(job.client, {"id": job.id, "type": "error", "error": "the worker stopped"})
+                index = self.workers.index(worker)
+                worker = self.workers[index] = await self.spawn()
+                continue
+            self.metrics.runs.append(time.time() - started)
+            self.metrics.search_time += time.time() - started
+            self.metrics.completed += 1
+            self.metrics.nodes += message.get("nodes", 0)
+            await self.reply(job.client, dict(message, id = job.id, type = "result", cancelled = job.cancelled,
+                                              queue_time = round(started - job.submitted, 4)))
+
+    async def run(self, worker, job) -> dict:
+        ''' Has the worker search the job, passing on its info messages, and returns its result. '''
+        worker.connection.send(job.search)
+        while True:
+            kind, message = await self.receive(worker)
+            if kind != "info":
+                return message
+            await self.reply(job.client, dict(message, id = job.id, type = "info"))
+
+#########################################
+
+class Client:
+    ''' One end of a connection: the server's end of a client, or a client of the server
+    for tools and tests. Replies are routed by id to the requests waiting for them, so
+    that requests can run concurrently. '''
+
+    def __init__(self, reader, writer) -> None:
+        self.reader     = reader
+        self.writer     = writer
+        self.lock       = asyncio.Lock()
+        self.ids        = itertools.count(1)
+        self.replies    = {}
+        self.task       = None
+
+    @classmethod
+    async def connect(cls, host = HOST, port = PORT, path = None):
+        ''' Connects to the server on the Unix socket at the path, or on the host and port. '''
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        client = cls(reader, writer)
+        client.task = asyncio.create_task(client.read())
+        return client
+
+    async def send(self, message) -> None:
+        ''' Writes the message as a line, waiting while the other end is slow to read it. '''
+        async with self.lock:
+            self.writer.write(json.dumps(message).encode() + b"\n")
+            await self.writer.drain()
+
+    async def read(self) -> None:
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            queue = self.replies.get(message.get("id"))
+            if queue is not None:
+                queue.put_nowait(message)
+        # the server went away
+        for queue in self.replies.values():
+            queue.put_nowait(None)
+
+    async def request(self, type, info = None, **fields) -> dict:
+        ''' Sends a request and returns its result or error, passing the info replies
+        of an analysis to the info function. The id is chosen unless one is given. '''
+        id = fields.setdefault("id", next(self.ids))
+        queue = self.replies[id] = asyncio.Queue()
+        try:
+            await self.send(dict(fields, type = type))
+            while True:
+                reply = await queue.get()
+                if reply is None:
+                    raise ConnectionError("the server closed the connection")
+                if reply["type"] != "info":
+                    return reply
+                if info is not None:
+                    info(reply)
+        finally:
+            del self.replies[id]
+
+    async def cancel(self, id) -> None:
+        ''' Cancels the request with the id, which then returns. '''
+        await self.send({"id": id, "type": "cancel"})
+
+    async def close(self) -> None:
+        self.writer.close()
+        await self.writer.wait_closed()
+        if self.task is not None:
+            await self.task
+
+#########################################
+
+async def serve(args) -> None:
+    server = Server(args.workers, args.hash, args.queue, args.time, args.max_time)
+    await server.start()
+    await server.listen(args.host, args.port, args.unix)
+    print("listening on %s with %d workers" % (args.unix or "%s:%d" % (args.host, args.port), args.workers), flush = True)
+    try:
+        await asyncio.gather(*(listener.serve_forever() for listener in server.servers))
+    finally:
+        await server.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "Serves analyses of positions over a local socket.")
+    parser.add_argument("--host", default = HOST)
+    parser.add_argument("--port", type = int, default = PORT)
+    parser.add_argument("--unix", metavar = "PATH", help = "listen on a Unix socket instead")
+    parser.add_argument("--workers", type = int, default = 2, help = "number of search processes")
+    parser.add_argument("--hash", type = int, default = 16, help = "size of the hash table of each worker in MB")
+    parser.add_argument("--queue", type = int, default = 16, help = "requests that may wait for a worker")
+    parser.add_argument("--time", type = float, default = 1.0, help = "seconds to search when a request gives no limit")
+    parser.add_argument("--max-time", type = float, default = 60.0, help = "most seconds to search any request")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
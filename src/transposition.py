@@ -0,0 +1,155 @@
+import os, weakref
+from collections import namedtuple
+from chessboard import MOVE_BITS, MOVE_MASK
+
+# bound types of a stored score
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# initializes data structure for a table entry
+Entry = namedtuple("Entry", "key depth score bound move age")
+# key - full Zobrist hash, to tell apart positions sharing a slot
+# depth - depth the position was searched to
+# score - score found by the search
+# bound - whether the score is EXACT, a LOWER bound or an UPPER bound
+# move - best move found, packed by chessboard.encode_move, or None
+# age - search generation the entry was written in
+
+class TranspositionTable:
+    ''' A fixed size hash table of searched positions, indexed by Zobrist hash '''
+
+    ENTRY_SIZE = 160    # approximate bytes held by one entry
+
+    def __init__(self, size = 16) -> None:
+        self.resize(size)
+
+    def resize(self, size) -> None:
+        ''' Reallocates the table to hold about size MB of entries, dropping its contents '''
+
+        slots = max(1, size * 1024 * 1024 // self.ENTRY_SIZE)
+        # round down to a power of two so that the index is a mask of the key
+        self.mask = (1 << (slots.bit_length() - 1)) - 1
+        self.entries = [None] * (self.mask + 1)
+        self.age = 0
+
+    def clear(self) -> None:
+        ''' Empties the table '''
+
+        self.entries = [None] * (self.mask + 1)
+        self.age = 0
+
+    def new_search(self) -> None:
+        ''' Ages the table, so entries of earlier searches are replaced first '''
+
+        self.age += 1
+
+    def probe(self, key) -> Entry:
+        ''' Returns the entry stored for the key, or None '''
+
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry.key == key:
+            return entry
+        return None
+
+    def store(self, key, depth, score, bound, move) -> None:
+        ''' Stores a search result, keeping deeper entries of the current search '''
+
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is not None:
+            # a shallower result of the current search doesn't replace a deeper one,
+            # even for the same position, as quiescence stores at depth 0
+            if entry.age == self.age and entry.depth > depth:
+                return
+            # keep the known best move if this search didn't find one
+            if entry.key == key and move is None:
+                move = entry.move
+        self.entries[index] = Entry(key, depth, score, bound, move, self.age)
+
+############################################
+
+# a packed entry of the shared table is two 64 bit words: the data, and the key
+# xored with the data, so that an entry torn by two processes writing it at once
+# doesn't match its key. The data is laid out as
+#   bits 0-19 score + SCORE_OFFSET, 20-27 depth, 28-29 bound,
+#   30-46 packed move, or 0 for none, 47-54 age
+SCORE_OFFSET = 1 << 19
+MOVE_SHIFT = 30
+AGE_SHIFT = MOVE_SHIFT + MOVE_BITS
+
+def _release(shm, words, owner) -> None:
+    ''' Frees the shared memory of a table, once the process that made it is done with it. '''
+    words.release()
+    shm.close()
+    if os.getpid() == owner:
+        shm.unlink()
+
+class SharedTranspositionTable(TranspositionTable):
+    ''' A transposition table in shared memory, so the processes of a parallel search
+    read and write the same entries. It is passed to worker processes like any other
+    object, and replaces entries as the TranspositionTable does. '''
+
+    ENTRY_SIZE = 16     # bytes of a packed entry
+
+    def resize(self, size) -> None:
+        ''' Reallocates the table to hold about size MB of entries, dropping its contents '''
+
+        if getattr(self, "finalizer", None) is not None:
+            self.finalizer()
+        slots = max(1, size * 1024 * 1024 // self.ENTRY_SIZE)
+        self.mask = (1 << (slots.bit_length() - 1)) - 1
+        # multiprocessing is only imported by parallel searches, as it is slow to import
+        from multiprocessing import shared_memory
+        shm = shared_memory.SharedMemory(create = True, size = (self.mask + 1) * self.ENTRY_SIZE)
+        self.attach(shm, os.getpid())
+        self.age = 0
+
+    def attach(self, shm, owner = None) -> None:
+        ''' Maps the table onto a block of shared memory, which is freed with the
+        table in the owner process. '''
+        self.shm = shm
+        self.words = shm.buf.cast("Q")
+        self.finalizer = weakref.finalize(self, _release, shm, self.words, owner)
+
+    def __getstate__(self) -> dict:
+        # a new process finds the same block of shared memory by its name
+        return {"name": self.shm.name, "mask": self.mask, "age": self.age}
+
+    def __setstate__(self, state) -> None:
+        self.mask, self.age = state["mask"], state["age"]
+        from multiprocessing import shared_memory
+        self.attach(shared_memory.SharedMemory(name = state["name"]))
+
+    def clear(self) -> None:
+        ''' Empties the table '''
+
+        self.shm.buf[:] = bytes(len(self.shm.buf))
+        self.age = 0
+
+    def probe(self, key) -> Entry:
+        ''' Returns the entry stored for the key, or None '''
+
+        index = (key & self.mask) << 1
+        data = self.words[index]
+        if self.words[index + 1] ^ data != key:
+            return None
+        return Entry(key, (data >> 20) & 0xFF, (data & 0xFFFFF) - SCORE_OFFSET,
+                     (data >> 28) & 0x3, (data >> MOVE_SHIFT) & MOVE_MASK or None, data >> AGE_SHIFT)
+
+    def store(self, key, depth, score, bound, move) -> None:
+        ''' Stores a search result, keeping deeper entries of the current search '''
+
+        index = (key & self.mask) << 1
+        data = self.words[index]
+        entry_key = self.words[index + 1] ^ data
+        if data:
+            if data >> AGE_SHIFT == self.age & 0xFF and (data >> 20) & 0xFF > depth:
+                return
+            # keep the known best move if this search didn't find one
+            if entry_key == key and move is None:
+                move = (data >> MOVE_SHIFT) & MOVE_MASK or None
+        data = ((score + SCORE_OFFSET) | min(max(depth, 0), 0xFF) << 20 | bound << 28
+                | (self.age & 0xFF) << AGE_SHIFT)
+        if move is not None:
+            data |= move << MOVE_SHIFT
+        self.words[index] = data
+        self.words[index + 1] = key ^ data
@@ -0,0 +1,247 @@
+import sys, time, threading
+import chessboard, bot, openings
+from chessboard import BoardState, Move, to_index, to_uci
+
+#########################################
+
+class UCI:
+    ''' A headless front-end speaking the Universal Chess Interface, so the engine can
+    be run by chess GUIs and match runners. The search runs on a worker thread, so
+    that commands like stop and isready are answered while it is thinking. '''
+
+    NAME        = "chess-engine"
+    AUTHOR      = "dymackenzie"
+    HASH        = (16, 1, 1024)     # default, min and max size of the hash table, in MB
+    THREADS     = (1, 1, 64)        # default, min and max number of search processes
+
+    def __init__(self, output = sys.stdout) -> None:
+        self.output = output
+        self.lock   = threading.Lock()
+        self.hash_size  = self.HASH[0]
+        self.threads    = self.THREADS[0]
+        self.bot    = bot.Bot(self.hash_size, workers = self.threads)
+        self.state  = BoardState(*chessboard.INITIAL_STATE)
+        # hashes of the positions of the game before the current one
+        self.history = []
+        self.book   = openings.Book()
+        self.own_book = True
+        # the running search and the signal that stops it
+        self.thread = None
+        self.stop   = threading.Event()
+
+    def send(self, line) -> None:
+        ''' Writes a line to the GUI, from either thread. '''
+        with self.lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def run(self, input = sys.stdin) -> None:
+        ''' Reads commands until quit or the end of the input. '''
+        for line in input:
+            if not self.command(line):
+                break
+        self.stop_search()
+
+    def command(self, line) -> bool:
+        ''' Handles a single command, returning False once the engine should quit. '''
+        tokens = line.split()
+        if not tokens:
+            return True
+        name, args = tokens[0], tokens[1:]
+
+        if name == "uci":
+            self.send("id name " + self.NAME)
+            self.send("id author " + self.AUTHOR)
+            self.send("option name Hash type spin default %d min %d max %d" % self.HASH)
+            self.send("option name Threads type spin default %d min %d max %d" % self.THREADS)
+            self.send("option name OwnBook type check default true")
+            self.send("uciok")
+        elif name == "isready":
+            self.send("readyok")
+        elif name == "setoption":
+            self.stop_search()
+            self.set_option(args)
+        elif name == "ucinewgame":
+            self.stop_search()
+            # forget the hash table, killers and history of the last game
+            self.bot = bot.Bot(self.hash_size, workers = self.threads)
+        elif name == "position":
+            self.stop_search()
+            self.set_position(args)
+        elif name == "go":
+            self.stop_search()
+            self.go(args)
+        elif name == "stop":
+            self.stop_search()
+        elif name == "quit":
+            return False
+        else:
+            self.send("info string unknown command " + name)
+        return True
+
+    #########################################
+
+    def set_option(self, args) -> None:
+        ''' setoption name <name> value <value> '''
+        if "name" not in args or "value" not in args:
+            return
+        name = " ".join(args[args.index("name") + 1 : args.index("value")]).lower()
+        value = " ".join(args[args.index("value") + 1 :])
+        try:
+            if name == "hash":
+                self.hash_size = min(max(int(value), self.HASH[1]), self.HASH[2])
+                self.bot.tt.resize(self.hash_size)
+            elif name == "threads":
+                self.threads = min(max(int(value), self.THREADS[1]), self.THREADS[2])
+                self.bot = bot.Bot(self.hash_size, workers = self.threads)
+            elif name == "ownbook":
+                self.own_book = value.lower() == "true"
+            else:
+                self.send("info string unknown option " + name)
+        except ValueError:
+            self.send("info string invalid value " + value)
+
+    def set_position(self, args) -> None:
+        ''' position [startpos | fen <fen>] [moves <move> ...] '''
+        moves = args[args.index("moves") + 1 :] if "moves" in args else []
+        if args[:1] == ["startpos"]:
+            state = BoardState(*chessboard.INITIAL_STATE)
+        elif args[:1] == ["fen"]:
+            fen = args[1 : args.index("moves")] if "moves" in args else args[1:]
+            try:
+                state = BoardState.from_fen(" ".join(fen))
+            except ValueError as error:
+                self.send("info string " + str(error))
+                return
+        else:
+            self.send("info string unknown position " + " ".join(args))
+            return
+        history = []
+        for uci_move in moves:
+            move = self.parse_move(state, uci_move)
+            if move is None:
+                self.send("info string illegal move " + uci_move)
+                break
+            history.append(state.hash)
+            state = state.move(move)
+        self.state = state
+        self.history = history
+
+    def parse_move(self, state, uci_move) -> Move:
+        ''' Converts a move in long algebraic notation into a move of the state, or None if the move isn't available. '''
+        try:
+            move = Move(to_index(uci_move[0:2], state.ac), to_index(uci_move[2:4], state.ac), uci_move[4:].upper())
+        except (ValueError, IndexError):
+            return None
+        return move if move in state.legal_moves() else None
+
+    def render_move(self, state, move) -> str:
+        ''' Converts a move of the state into long algebraic notation. '''
+        return to_uci(move, state.ac)
+
+    #########################################
+
+    def go(self, args) -> None:
+        ''' go [wtime <ms>] [btime <ms>] [winc <ms>] [binc <ms>] [movestogo <n>]
+        [movetime <ms>] [depth <n>] [nodes <n>] [infinite], starting the search on the worker thread '''
+        limits = {}
+        for i, token in enumerate(args[:-1]):
+            if token in ("wtime", "btime", "winc", "binc", "movestogo", "movetime", "depth", "nodes"):
+                try:
+                    limits[token] = int(args[i + 1])
+                except ValueError:
+                    pass
+        infinite = "infinite" in args
+
+        time_limit = None
+        if "movetime" in limits:
+            time_limit = limits["movetime"] / 1000
+        else:
+            clock, increment = ("wtime", "winc") if self.state.ac == 0 else ("btime", "binc")
+            if clock in limits:
+                time_limit = bot.allocate_time(
+                    limits[clock] / 1000, limits.get(increment, 0) / 1000, limits.get("movestogo"))
+        if infinite:
+            time_limit = None
+
+        # play from the opening book without searching, unless told to search until stopped
+        if self.own_book and not infinite:
+            move = self.book.choose(self.state)
+            if move is not None:
+                self.send("info string book move")
+                self.send("bestmove " + self.render_move(self.state, move))
+                return
+
+        self.stop.clear()
+        self.thread = threading.Thread(
+            target = self.think,
+            args = (self.state, self.history, time_limit, limits.get("nodes"), limits.get("depth"), infinite),
+            daemon = True
+            )
+        self.thread.start()
+
+    def stop_search(self) -> None:
+        ''' Stops the running search and waits for it to send its best move. '''
+        if self.thread is not None:
+            self.stop.set()
+            self.thread.join()
+            self.thread = None
+
+    def think(self, state, history, time_limit, node_limit, depth_limit, infinite) -> None:
+        ''' Searches the state on the worker thread, sending an info line for every
+        completed depth and the best move once the search ends. '''
+        start_time = time.time()
+        reported = None
+        fallback = None
+        for nodes, qnodes, depth, gamma, score, move in self.bot.search(
+            state, time_limit = time_limit, node_limit = node_limit, stop = self.stop, history = history,
+            depth_limit = depth_limit):
+            if score >= gamma and move is not None:
+                fallback = move
+            if self.bot.result is not reported:
+                reported = self.bot.result
+                self.info(state, start_time)
+        if self.bot.result is not reported:
+            self.info(state, start_time)
+        self.send("info string evaluation cache hits %.0f%% pawn table hits %.0f%%" % tuple(
+            rate * 100 for rate in self.bot.evaluator.hit_rates()))
+
+        # an infinite search waits to be told to stop before sending its move
+        if infinite:
+            self.stop.wait()
+
+        move = self.bot.result[2] if self.bot.result is not None and self.bot.result[2] else fallback
+        if move is None:
+            # no move was found in time, or there is none to play
+            move = next(iter(state.legal_moves()), None)
+        self.send("bestmove " + (self.render_move(state, move) if move is not None else "0000"))
+
+    def info(self, state, start_time) -> None:
+        ''' Sends the depth, score, nodes, speed and principal variation of the last completed iteration. '''
+        if self.bot.result is None:
+            return
+        depth, score, _ = self.bot.result
+        nodes = self.bot.nodes + self.bot.qnodes
+        elapsed = max(time.time() - start_time, 0.001)
+        pv = self.principal_variation(state, depth)
+        if abs(score) >= bot.MATE_LOWER_BOUND:
+            # the variation ends in the capture of the king, one ply after mate
+            moves = (len(pv) + 1) // 2
+            score_text = "mate %d" % (moves if score > 0 else -moves)
+        else:
+            score_text = "cp %d" % score
+        # the deepest ply of the quiescence search in the iteration
+        seldepth = max(self.bot.iterations[-1].max_ply, depth) if self.bot.iterations else depth
+        self.send("info depth %d seldepth %d score %s nodes %d nps %d time %d pv %s" % (
+            depth, seldepth, score_text, nodes, nodes / elapsed, elapsed * 1000, " ".join(pv)))
+
+    def principal_variation(self, state, depth) -> list:
+        ''' Renders the best moves stored in the transposition table from the state. '''
+        pv = []
+        for move in self.bot.principal_variation(state, depth):
+            pv.append(self.render_move(state, move))
+            state = state.move(move)
+        return pv
+
+if __name__ == "__main__":
+    UCI().run()
@@ -0,0 +1,177 @@
+''' Analyses every position of an EPD or FEN file, one per line, on a pool of worker
+processes, writing the best move, score, depth, nodes and time of each as JSON lines
+or CSV while it runs. An interrupted run continues where it stopped when run again.
+
+    python tools/analyse.py positions.epd results.jsonl --depth 6 --workers 4
+    python tools/analyse.py positions.fen results.csv --time 1 --nodes 20000
+'''
+import os, sys, csv, json, time, argparse
+from collections import deque
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from chessboard import BoardState, to_uci
+from bot import Bot
+
+FIELDS = ("index", "id", "fen", "move", "score", "depth", "nodes", "time", "solved", "error")
+IN_FLIGHT = 4       # positions queued per worker, so that workers never wait for input
+
+def read_positions(path, skip = 0):
+    ''' Yields (index, line) for each position of the file after the first skip, without
+    reading the file into memory. Blank lines and lines starting with # are not positions. '''
+    index = 0
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if index >= skip:
+                yield index, line
+            index += 1
+
+#########################################
+
+# size of the hash table of a worker process
+_hash_size = 16
+
+def _start_worker(hash_size) -> None:
+    global _hash_size
+    _hash_size = hash_size
+
+def analyse(job) -> dict:
+    ''' Searches one position to the limits, returning its row of results. '''
+    (index, line), depth_limit, node_limit, time_limit = job
+    row = dict.fromkeys(FIELDS)
+    row["index"] = index
+    try:
+        if ";" in line:
+            state, operations = BoardState.from_epd(line)
+        else:
+            state, operations = BoardState.from_fen(line), {}
+    except ValueError as error:
+        row["fen"], row["error"] = line, str(error)
+        return row
+    row["id"], row["fen"] = operations.get("id"), state.to_fen()
+
+    # every position is searched by a new bot, so results don't depend on the
+    # positions a worker searched before
+    bot = Bot(_hash_size)
+    start_time = time.time()
+    for _ in bot.search(state, time_limit = time_limit, node_limit = node_limit, depth_limit = depth_limit):
+        pass
+    row["time"] = round(time.time() - start_time, 3)
+    row["nodes"] = bot.nodes + bot.qnodes
+    if bot.result is None or bot.result[2] is None:
+        row["error"] = "no move found"
+        return row
+    depth, score, move = bot.result
+    row["move"], row["score"], row["depth"] = to_uci(move, state.ac), score, depth
+    # a test suite position is solved by one of its best moves, and by none of the moves to avoid
+    if "bm" in operations or "am" in operations:
+        row["solved"] = move in operations.get("bm", [move]) and move not in operations.get("am", [])
+    return row
+
+def analyse_all(positions, workers, limits, hash_size):
+    ''' Yields the results of the positions in order, keeping no more than IN_FLIGHT
+    positions per worker in memory. '''
+    jobs = ((position,) + limits for position in positions)
+    if workers == 1:
+        _start_worker(hash_size)
+        yield from map(analyse, jobs)
+        return
+    with Pool(workers, initializer = _start_worker, initargs = (hash_size,)) as pool:
+        pending = deque()
+        for job in jobs:
+            pending.append(pool.apply_async(analyse, (job,)))
+            if len(pending) >= workers * IN_FLIGHT:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+#########################################
+
+class Writer:
+    ''' Appends rows to a JSON lines or CSV file, and records in a checkpoint file how
+    many positions are done and how long the output was at that point. '''
+
+    def __init__(self, path, checkpoint) -> None:
+        self.path = path
+        self.checkpoint = checkpoint
+        self.csv = path.endswith(".csv")
+        self.done = 0
+        # resume: drop anything written after the last checkpoint
+        if os.path.exists(checkpoint) and os.path.exists(path):
+            with open(checkpoint) as file:
+                saved = json.load(file)
+            self.done = saved["done"]
+            self.file = open(path, "r+", newline = "")
+            self.file.truncate(saved["offset"])
+            self.file.seek(saved["offset"])
+        else:
+            self.file = open(path, "w", newline = "")
+        if self.csv:
+            self.writer = csv.DictWriter(self.file, FIELDS)
+            if self.file.tell() == 0:
+                self.writer.writeheader()
+
+    def write(self, row) -> None:
+        if self.csv:
+            self.writer.writerow(row)
+        else:
+            self.file.write(json.dumps(row) + "\n")
+        self.done += 1
+
+    def save(self) -> None:
+        ''' Flushes the output and writes the checkpoint, replacing the old one at once. '''
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        with open(self.checkpoint + ".tmp", "w") as file:
+            json.dump({"done": self.done, "offset": self.file.tell()}, file)
+        os.replace(self.checkpoint + ".tmp", self.checkpoint)
+
+    def close(self) -> None:
+        self.save()
+        self.file.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "Analyses the positions of an EPD or FEN file.")
+    parser.add_argument("positions", help = "EPD or FEN file, one position per line")
+    parser.add_argument("output", help = "results file, CSV if it ends in .csv, JSON lines otherwise")
+    parser.add_argument("--depth", type = int, help = "depth to search each position to")
+    parser.add_argument("--nodes", type = int, help = "nodes to search each position for")
+    parser.add_argument("--time", type = float, help = "seconds to search each position for")
+    parser.add_argument("--workers", type = int, default = os.cpu_count())
+    parser.add_argument("--hash", type = int, default = 16, help = "size of the hash table of each worker in MB")
+    parser.add_argument("--checkpoint", help = "checkpoint file, the output file with .checkpoint by default")
+    parser.add_argument("--save-every", type = int, default = 10, help = "positions between checkpoints")
+    args = parser.parse_args()
+    if args.depth is None and args.nodes is None and args.time is None:
+        parser.error("give at least one of --depth, --nodes and --time")
+
+    writer = Writer(args.output, args.checkpoint or args.output + ".checkpoint")
+    skipped = writer.done
+    if skipped:
+        print("resuming after %d positions" % skipped, file = sys.stderr)
+
+    start_time = time.time()
+    solved = tried = 0
+    try:
+        for row in analyse_all(read_positions(args.positions, skipped), args.workers,
+                               (args.depth, args.nodes, args.time), args.hash):
+            writer.write(row)
+            if row["solved"] is not None:
+                tried += 1
+                solved += row["solved"]
+            if (writer.done - skipped) % args.save_every == 0:
+                writer.save()
+    finally:
+        writer.close()
+
+    done, elapsed = writer.done - skipped, max(time.time() - start_time, 1e-6)
+    print("positions %d time %.1f positions/s %.2f" % (done, elapsed, done / elapsed), file = sys.stderr)
+    if tried:
+        print("solved %d of %d" % (solved, tried), file = sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+''' Measures what the tapered evaluation costs: the speed of searches to a node limit with
+it and with the incremental value alone, the time to score a position the caches miss,
+and how often the evaluation cache and the pawn table are hit.
+
+    python tools/evaluation.py --nodes 40000
+'''
+import os, sys, time, argparse, timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from chessboard import BoardState
+from evaluation import Evaluator
+from bot import Bot
+from perft import SUITE
+
+POSITIONS = ("start", "kiwipete", "en passant", "middlegame")
+
+def search(state, nodes, evaluation) -> tuple:
+    ''' Searches the state with a fresh bot, returning (nodes, seconds, cache hit rates). '''
+    bot = Bot(evaluation = evaluation)
+    start_time = time.perf_counter()
+    for _ in bot.search(state, node_limit = nodes):
+        pass
+    elapsed = time.perf_counter() - start_time
+    return bot.nodes + bot.qnodes, elapsed, bot.evaluator.hit_rates()
+
+def miss_time(state, runs = 1000) -> float:
+    ''' Microseconds to score the state with empty caches, the pawn table aside. '''
+    evaluator = Evaluator()
+    return min(timeit.repeat(lambda: evaluator.adjustment(state.board, state.ac), number = runs, repeat = 5)) / runs * 1e6
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "Reports the cost and cache hit rates of the evaluation.")
+    parser.add_argument("--nodes", type = int, default = 40000, help = "nodes to search each position for")
+    args = parser.parse_args()
+
+    print("%-12s %9s %9s %9s %10s %10s" % ("position", "nps off", "nps on", "miss us", "eval hits", "pawn hits"))
+    totals = {False: [0, 0.0], True: [0, 0.0]}
+    for name in POSITIONS:
+        state = BoardState.from_fen(SUITE[name][0])
+        speeds = []
+        for evaluation in (False, True):
+            nodes, elapsed, rates = search(state, args.nodes, evaluation)
+            totals[evaluation][0] += nodes
+            totals[evaluation][1] += elapsed
+            speeds.append(nodes / elapsed)
+        print("%-12s %9d %9d %9.1f %9.0f%% %9.0f%%" % (
+            name, speeds[0], speeds[1], miss_time(state), rates[0] * 100, rates[1] * 100))
+    off, on = (nodes / elapsed for nodes, elapsed in (totals[False], totals[True]))
+    print("nps %d without the evaluation, %d with it, %.1f%% slower" % (off, on, (1 - on / off) * 100))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+''' Plays configurations of the bot against each other without the GUI, to measure
+whether a change gains or loses strength. Games start from the lines of the opening
+files, each played twice with the colors reversed, and run on a pool of worker
+processes. The match stops once a sequential probability ratio test (SPRT) accepts
+one of its hypotheses, that the first engine is elo0 or elo1 stronger than the second.
+
+    python tools/match.py "evaluation=1" "evaluation=0" --nodes 20000 --games 400 --workers 4
+    python tools/match.py "" "backend=bitboard" --time 0.2 --elo0 -10 --elo1 0
+'''
+import os, sys, math, random, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from multiprocessing import Pool
+from chessboard import BoardState, INITIAL_STATE, parse_san
+from openings import read_pgns
+from bot import Bot
+
+MAX_PLIES = 400     # plies after which a game still going is adjudicated a draw
+
+def parse_engine(spec) -> dict:
+    ''' Parses an engine of the form "option=value,option=value" into keyword arguments
+    of Bot. Values are ints where they can be, so 0 and 1 switch options off and on. '''
+    options = {}
+    for item in filter(None, spec.split(",")):
+        name, _, value = item.partition("=")
+        try:
+            options[name.strip()] = int(value)
+        except ValueError:
+            options[name.strip()] = value.strip()
+    return options
+
+def read_openings(plies, seed) -> list:
+    ''' Returns the distinct opening lines cut to the plies, as lists of moves, in an
+    order shuffled by the seed. '''
+    lines = set()
+    initial = BoardState(*INITIAL_STATE)
+    for pgn in read_pgns():
+        state, moves = initial, []
+        for san in pgn[: plies]:
+            move = parse_san(state, san)
+            moves.append(move)
+            state = state.move(move)
+        lines.add(tuple(moves))
+    lines = sorted(lines)
+    random.Random(seed).shuffle(lines)
+    return lines
+
+#########################################
+
+def adjudicate(state, hashes) -> tuple:
+    ''' Returns the result of a game that is over, from white's side, and why it is over,
+    or None if it goes on. hashes are those of the positions before the state. '''
+    if not state.legal_moves():
+        if not state.in_check():
+            return "1/2-1/2", "stalemate"
+        # the side to move is mated
+        return ("0-1" if state.ac == 0 else "1-0"), "checkmate"
+    if state.clock >= 100:
+        return "1/2-1/2", "fifty moves"
+    if hashes.count(state.hash) >= 2:
+        return "1/2-1/2", "repetition"
+    pieces = [piece for piece in state.board.upper() if piece in "PNBRQ"]
+    if not pieces or pieces in (["N"], ["B"]):
+        return "1/2-1/2", "insufficient material"
+    if len(hashes) >= MAX_PLIES:
+        return "1/2-1/2", "move limit"
+    return None
+
+def play(job) -> tuple:
+    ''' Plays one game from the opening, returning (score, reason, plies), where score
+    is what the first engine made of it: 1 for a win, 0.5 for a draw and 0 for a loss. '''
+    opening, engines, first_white, node_limit, time_limit, hash_size = job
+    # each engine keeps its tables between moves, as it would in a game
+    bots = [Bot(hash_size, **engine) for engine in engines]
+    if not first_white:
+        bots.reverse()
+    state, hashes = BoardState(*INITIAL_STATE), []
+    for move in opening:
+        hashes.append(state.hash)
+        state = state.move(move)
+
+    while True:
+        over = adjudicate(state, hashes)
+        if over is not None:
+            break
+        bot = bots[state.ac]
+        for _ in bot.search(state, time_limit = time_limit, node_limit = node_limit, history = hashes):
+            pass
+        move = bot.result[2] if bot.result is not None and bot.result[2] is not None else None
+        if move is None:
+            # no iteration finished in the limits
+            move = state.legal_moves()[0]
+        hashes.append(state.hash)
+        state = state.move(move)
+
+    result, reason = over
+    score = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}[result]
+    return (score if first_white else 1 - score), reason, len(hashes)
+
+def schedule(openings, engines, count, limits) -> iter:
+    ''' Yields the jobs of count games, each opening played by both engines as white. '''
+    for i in range(count):
+        opening = openings[i // 2 % len(openings)]
+        yield (opening, engines, i % 2 == 0) + limits
+
+#########################################
+
+def expected_score(elo) -> float:
+    ''' The score a player elo points stronger is expected to make. '''
+    return 1 / (1 + 10 ** (-elo / 400))
+
+def elo(score) -> float:
+    ''' The elo difference a score shows, inverse of expected_score. '''
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return 400 * math.log10(score / (1 - score))
+
+def mean_and_variance(wins, draws, losses) -> tuple:
+    ''' Returns the mean score of the games and its variance per game. '''
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    return score, variance
+
+def elo_interval(wins, draws, losses) -> tuple:
+    ''' Returns the elo difference of the games and the half width of its 95% interval. '''
+    score, variance = mean_and_variance(wins, draws, losses)
+    games = wins + draws + losses
+    margin = 1.96 * math.sqrt(variance / games)
+    return elo(score), (elo(min(score + margin, 1)) - elo(max(score - margin, 0))) / 2
+
+def sprt(wins, draws, losses, elo0, elo1) -> float:
+    ''' Log likelihood ratio of the hypothesis that the first engine is elo1 stronger
+    against that it is elo0 stronger, by the normal approximation to the results. '''
+    score, variance = mean_and_variance(wins, draws, losses)
+    if variance == 0:
+        return 0.0
+    s0, s1 = expected_score(elo0), expected_score(elo1)
+    return (wins + draws + losses) * (s1 - s0) * (2 * score - s0 - s1) / (2 * variance)
+
+def bounds(alpha, beta) -> tuple:
+    ''' The log likelihood ratios at which the SPRT accepts elo0 and elo1, given the
+    rates of false positives (alpha) and false negatives (beta). '''
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+#########################################
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description = "Plays two configurations of the bot against each other.")
+    parser.add_argument("first", help = "options of the first engine, as option=value,option=value")
+    parser.add_argument("second", help = "options of the second engine")
+    parser.add_argument("--games", type = int, default = 200, help = "most games to play")
+    parser.add_argument("--nodes", type = int, help = "nodes to search each move for")
+    parser.add_argument("--time", type = float, help = "seconds to search each move for")
+    parser.add_argument("--hash", type = int, default = 8, help = "size of the hash table of each engine in MB")
+    parser.add_argument("--workers", type = int, default = os.cpu_count())
+    parser.add_argument("--plies", type = int, default = 8, help = "plies of each opening line to play")
+    parser.add_argument("--seed", type = int, default = 1, help = "seed of the order of the openings")
+    parser.add_argument("--elo0", type = float, default = 0, help = "elo difference of the null hypothesis")
+    parser.add_argument("--elo1", type = float, default = 10, help = "elo difference of the alternative hypothesis")
+    parser.add_argument("--alpha", type = float, default = 0.05)
+    parser.add_argument("--beta", type = float, default = 0.05)
+    args = parser.parse_args()
+    if args.nodes is None and args.time is None:
+        parser.error("give at least one of --nodes and --time")
+
+    engines = (parse_engine(args.first), parse_engine(args.second))
+    openings = read_openings(args.plies, args.seed)
+    jobs = schedule(openings, engines, args.games, (args.nodes, args.time, args.hash))
+    lower, upper = bounds(args.alpha, args.beta)
+    print("%s vs %s, %d openings, SPRT elo0 %g elo1 %g, bounds %.2f %.2f" % (
+        args.first or "default", args.second or "default", len(openings), args.elo0, args.elo1, lower, upper))
+
+    wins = draws = losses = 0
+    decision = None
+    with Pool(args.workers) as pool:
+        for score, reason, plies in pool.imap_unordered(play, jobs):
+            if score == 1:
+                wins += 1
+            elif score == 0:
+                losses += 1
+            else:
+                draws += 1
+            llr = sprt(wins, draws, losses, args.elo0, args.elo1)
+            difference, margin = elo_interval(wins, draws, losses)
+            print("game %d %s (%s, %d plies) +%d =%d -%d elo %.1f +- %.1f llr %.2f" % (
+                wins + draws + losses, {1: "win", 0: "loss"}.get(score, "draw"), reason, plies,
+                wins, draws, losses, difference, margin, llr), flush = True)
+            if llr <= lower or llr >= upper:
+                decision = "elo1" if llr >= upper else "elo0"
+                # leaving the pool stops the games still being played
+                break
+
+    if decision is None:
+        print("no decision after %d games" % (wins + draws + losses))
+        return 2
+    print("SPRT accepts %s: the first engine is %g elo stronger" % (
+        decision, args.elo1 if decision == "elo1" else args.elo0))
+    return 0 if decision == "elo1" else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
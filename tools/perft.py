@@ -0,0 +1,117 @@
+''' Counts the leaf nodes of the legal move tree (perft), to verify the move generator
+against known counts and to measure its speed.
+
+    python tools/perft.py --suite
+    python tools/perft.py --fen "<fen>" --depth 4 --divide --workers 4 --hash
+'''
+import os, sys, time, argparse
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from chessboard import BoardState, STARTING_FEN, to_uci
+from bitboard import BitBoardState
+
+# standard positions with their known node counts by depth, from depth 1
+SUITE = {
+    "start": (STARTING_FEN,
+        (20, 400, 8902, 197281, 4865609)),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        (48, 2039, 97862, 4085603)),
+    # en passant that exposes the king along a rank, and checks from promoting pawns
+    "en passant": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        (14, 191, 2812, 43238, 674624)),
+    # castling out of, through and into check, and promotions with capture
+    "castling": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        (6, 264, 9467, 422333)),
+    "promotion": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        (44, 1486, 62379, 2103487)),
+    "middlegame": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        (46, 2079, 89890, 3894594)),
+}
+
+# move generators that can be checked, each built from a board state
+BACKENDS = {
+    "string":   lambda state: state,
+    "bitboard": BitBoardState.from_state,
+}
+
+def perft(state, depth, table = None) -> int:
+    ''' Counts the leaf nodes of the legal move tree to the depth. Subtrees already
+    counted are looked up by Zobrist hash in table, if a dict is given. '''
+    if depth == 0:
+        return 1
+    moves = state.legal_moves()
+    if depth == 1:
+        return len(moves)
+    if table is not None:
+        nodes = table.get((state.hash, depth))
+        if nodes is not None:
+            return nodes
+    nodes = sum(perft(state.move(move), depth - 1, table) for move in moves)
+    if table is not None:
+        table[state.hash, depth] = nodes
+    return nodes
+
+def _perft_child(args) -> int:
+    ''' Counts the nodes below one root move, in a worker process. '''
+    state, move, depth, use_table = args
+    return perft(state.move(move), depth - 1, {} if use_table else None)
+
+def divide(state, depth, workers = 1, use_table = False) -> dict:
+    ''' Counts the leaf nodes below each legal root move, in standard notation. The
+    root moves are split across a pool of worker processes if workers > 1. '''
+    moves = state.legal_moves()
+    if depth <= 1:
+        return {to_uci(move, state.ac): 1 for move in moves}
+    jobs = [(state, move, depth, use_table) for move in moves]
+    if workers > 1:
+        with Pool(workers) as pool:
+            counts = pool.map(_perft_child, jobs)
+    else:
+        # one table serves every root move
+        table = {} if use_table else None
+        counts = [perft(state.move(move), depth - 1, table) for move in moves]
+    return {to_uci(move, state.ac): nodes for move, nodes in zip(moves, counts)}
+
+def run(fen, depth, backend = "string", workers = 1, use_table = False, show_divide = False) -> int:
+    ''' Runs perft on the position, printing the node count and speed. '''
+    state = BACKENDS[backend](BoardState.from_fen(fen))
+    start_time = time.time()
+    counts = divide(state, depth, workers, use_table)
+    elapsed = max(time.time() - start_time, 1e-6)
+    if show_divide:
+        for move, nodes in sorted(counts.items()):
+            print("%s: %d" % (move, nodes))
+    nodes = sum(counts.values())
+    print("depth %d nodes %d time %.2f nps %d" % (depth, nodes, elapsed, nodes / elapsed))
+    return nodes
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description = "Counts the legal move tree of a position.")
+    parser.add_argument("--fen", default = STARTING_FEN)
+    parser.add_argument("--depth", type = int, default = 3)
+    parser.add_argument("--divide", action = "store_true", help = "print the count below each root move")
+    parser.add_argument("--suite", action = "store_true", help = "check the standard positions up to --depth")
+    parser.add_argument("--workers", type = int, default = 1, help = "processes to split the root moves across")
+    parser.add_argument("--hash", action = "store_true", help = "look up repeated subtrees in a hash table")
+    parser.add_argument("--backend", choices = BACKENDS, default = "string")
+    args = parser.parse_args()
+
+    if not args.suite:
+        run(args.fen, args.depth, args.backend, args.workers, args.hash, args.divide)
+        return 0
+
+    failures = 0
+    for name, (fen, expected) in SUITE.items():
+        for depth, count in enumerate(expected[: args.depth], 1):
+            print(name, end = " ")
+            nodes = run(fen, depth, args.backend, args.workers, args.hash)
+            if nodes != count:
+                print("FAILED %s depth %d: expected %d" % (name, depth, count))
+                failures += 1
+    print("failures:", failures)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
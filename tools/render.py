@@ -0,0 +1,49 @@
+''' Measures how long the GUI takes to redraw the board after each move of a game, and
+checks that the number of canvas items stays the same throughout. Needs a display.
+
+    python tools/render.py --plies 200
+'''
+import os, sys, time, argparse, statistics
+import tkinter as tk
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+import chessboard, GUI
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description = "Measures the redraw time of the GUI.")
+    parser.add_argument("--plies", type = int, default = 100, help = "moves to play and redraw")
+    args = parser.parse_args()
+
+    # the piece images are found relative to the top of the repository
+    os.chdir(ROOT)
+    root = tk.Tk()
+    GUI.GUI.PONDER = False
+    gui = GUI.GUI(root, chessboard.BoardState(*chessboard.INITIAL_STATE))
+    root.update()
+    items = len(gui.canvas.find_all())
+
+    times = []
+    for ply in range(args.plies):
+        # plays varied legal moves, so that pieces get captured and promoted
+        moves = gui.state.legal_moves()
+        if not moves:
+            break
+        gui.state = gui.state.move(moves[ply * 7 % len(moves)])
+        gui.active_color = 0 if gui.active_color == 1 else 1
+        start_time = time.perf_counter()
+        gui.draw_board()
+        gui.draw_pieces()
+        root.update_idletasks()
+        times.append(time.perf_counter() - start_time)
+    final_items = len(gui.canvas.find_all())
+    root.destroy()
+
+    print("plies %d redraw mean %.2f ms max %.2f ms" % (
+        len(times), statistics.mean(times) * 1000, max(times) * 1000))
+    print("canvas items %d before, %d after" % (items, final_items))
+    return 0 if final_items == items else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
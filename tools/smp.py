@@ -0,0 +1,44 @@
+''' Measures how the parallel search scales: the time to reach a depth with 1, 2, 4
+and 8 worker processes, on a few positions.
+
+    python tools/smp.py --depth 6 --workers 1 2 4 8
+'''
+import os, sys, time, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from chessboard import BoardState
+from bot import Bot
+from perft import SUITE
+
+POSITIONS = ("start", "kiwipete", "middlegame")
+
+def time_to_depth(state, depth, workers, hash_size) -> float:
+    ''' Seconds a fresh bot takes to complete an iteration of the depth. '''
+    bot = Bot(hash_size, workers = workers)
+    start_time = time.time()
+    for _ in bot.search(state):
+        if bot.result is not None and bot.result[0] >= depth:
+            break
+    return time.time() - start_time
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "Reports the time to depth of the parallel search.")
+    parser.add_argument("--depth", type = int, default = 6)
+    parser.add_argument("--workers", type = int, nargs = "+", default = [1, 2, 4, 8])
+    parser.add_argument("--hash", type = int, default = 64, help = "size of the hash table in MB")
+    args = parser.parse_args()
+
+    print("cpus", os.cpu_count())
+    print("%-12s" % "workers" + "".join("%10d" % workers for workers in args.workers))
+    totals = [0.0] * len(args.workers)
+    for name in POSITIONS:
+        state = BoardState.from_fen(SUITE[name][0])
+        times = [time_to_depth(state, args.depth, workers, args.hash) for workers in args.workers]
+        totals = [total + t for total, t in zip(totals, times)]
+        print("%-12s" % name + "".join("%10.2f" % t for t in times))
+    print("%-12s" % "total" + "".join("%10.2f" % t for t in totals))
+    print("%-12s" % "speedup" + "".join("%10.2f" % (totals[0] / t) for t in totals))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+''' Measures how long the headless engine takes to start: the time from launching
+src/uci.py until it answers uci with uciok, and the modules that take longest to import,
+as reported by python -X importtime. Exits with 1 if the start is over budget.
+
+    python tools/startup.py --runs 10 --budget 100
+'''
+import os, sys, time, argparse, statistics, subprocess
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+def time_to_uciok() -> float:
+    ''' Milliseconds from starting the engine until it is ready for commands. '''
+    start_time = time.perf_counter()
+    engine = subprocess.Popen([sys.executable, "uci.py"], cwd = SRC, text = True,
+                              stdin = subprocess.PIPE, stdout = subprocess.PIPE)
+    engine.stdin.write("uci\n")
+    engine.stdin.flush()
+    for line in engine.stdout:
+        if line.strip() == "uciok":
+            break
+    elapsed = (time.perf_counter() - start_time) * 1000
+    engine.communicate("quit\n")
+    return elapsed
+
+def time_interpreter() -> float:
+    ''' Milliseconds to start and stop the interpreter alone. '''
+    start_time = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check = True)
+    return (time.perf_counter() - start_time) * 1000
+
+def import_times() -> list:
+    ''' Returns (self, cumulative, module) in microseconds for each module imported
+    by the engine, slowest first. '''
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import uci; uci.UCI()"],
+                            cwd = SRC, capture_output = True, text = True, check = True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, module = line[len("import time:"):].split("|")
+        times.append((int(own), int(cumulative), module.rstrip()))
+    return sorted(times, reverse = True)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description = "Measures the start up time of the headless engine.")
+    parser.add_argument("--runs", type = int, default = 10)
+    parser.add_argument("--budget", type = float, default = 100, help = "milliseconds the start may take")
+    parser.add_argument("--top", type = int, default = 10, help = "slowest imports to list")
+    args = parser.parse_args()
+
+    # the first run writes the caches of bytecode and tables
+    time_to_uciok()
+    interpreter = statistics.median(time_interpreter() for _ in range(args.runs))
+    start = statistics.median(time_to_uciok() for _ in range(args.runs))
+
+    print("slowest imports (self / cumulative ms):")
+    for own, cumulative, module in import_times()[: args.top]:
+        print("%8.1f %8.1f  %s" % (own / 1000, cumulative / 1000, module))
+    print("interpreter %.1f ms" % interpreter)
+    print("engine start %.1f ms (budget %.0f ms)" % (start, args.budget))
+    if sys.dont_write_bytecode:
+        print("bytecode isn't cached (PYTHONDONTWRITEBYTECODE), so every import is compiled")
+    return 1 if start > args.budget else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
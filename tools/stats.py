@@ -0,0 +1,73 @@
+''' Searches positions and writes the counters of every iteration as JSON: nodes, speed,
+transposition table hit and cut off rates, the share of cut offs by the first move, the
+branching factor, the null window searches each depth took, the deepest ply and, with
+--time-phases, the time spent generating moves and evaluating. Kept for each build, the
+files show changes in how well the search prunes as well as in its speed. With --profile
+the search alone is profiled, without the set up and the reporting around it.
+
+    python tools/stats.py --depth 6 --output stats.json
+    python tools/stats.py --nodes 50000 --time-phases --profile 20
+'''
+import os, sys, json, time, argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from chessboard import BoardState
+from bot import Bot
+from perft import SUITE
+
+POSITIONS = ("start", "kiwipete", "en passant", "middlegame")
+
+def search(state, depth, nodes, time_phases, profiler = None) -> dict:
+    ''' Searches the state with a fresh bot to the depth or the node limit, returning the
+    counters of its iterations. '''
+    bot = Bot(time_phases = time_phases)
+    if profiler is not None:
+        bot.hooks.append((profiler.enable, profiler.disable))
+    for _ in bot.search(state, node_limit = nodes, depth_limit = depth):
+        pass
+    iterations = [stats.to_dict() for stats in bot.iterations]
+    return {
+        "fen":          state.to_fen(),
+        "nodes":        bot.nodes + bot.qnodes,
+        "time":         round(sum(stats.time for stats in bot.iterations), 4),
+        "iterations":   iterations,
+    }
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description = "Reports the counters of the search as JSON.")
+    parser.add_argument("--depth", type = int, help = "depth to search each position to")
+    parser.add_argument("--nodes", type = int, help = "nodes to search each position for")
+    parser.add_argument("--fen", action = "append", help = "position to search, instead of the standard ones")
+    parser.add_argument("--time-phases", action = "store_true", help = "time move generation and evaluation")
+    parser.add_argument("--profile", type = int, metavar = "N", help = "profile the search, listing the N slowest functions")
+    parser.add_argument("--output", help = "JSON file to write, standard output by default")
+    args = parser.parse_args()
+    if args.depth is None and args.nodes is None:
+        parser.error("give at least one of --depth and --nodes")
+
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+
+    fens = args.fen or [SUITE[name][0] for name in POSITIONS]
+    report = {
+        "created":      time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "depth":        args.depth,
+        "node_limit":   args.nodes,
+        "positions":    [search(BoardState.from_fen(fen), args.depth, args.nodes, args.time_phases, profiler) for fen in fens],
+    }
+    text = json.dumps(report, indent = 1)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+    if profiler is not None:
+        import pstats
+        pstats.Stats(profiler, stream = sys.stderr).sort_stats("tottime").print_stats(args.profile)
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,493 @@
-import unittest
\ No newline at end of file
+import os, sys
+import asyncio
+import random
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import chessboard
+import bitboard
+import transposition
+import bot
+import perft
+import evaluation
+import server
+try:
+    import batch
+except ImportError:
+    # NumPy is only needed by the batch evaluation
+    batch = None
+
+def parse_move(state, uci) -> chessboard.Move:
+    ''' Converts a move in UCI notation into a move of the board as seen by the side to move. '''
+    return chessboard.Move(chessboard.to_index(uci[0:2], state.ac), chessboard.to_index(uci[2:4], state.ac), uci[4:].upper())
+
+def play(state, *moves) -> list:
+    ''' Plays the moves, given in UCI notation, returning the states they lead through. '''
+    states = [state]
+    for uci in moves:
+        states.append(states[-1].move(parse_move(states[-1], uci)))
+    return states
+
+class TranspositionTest(unittest.TestCase):
+    ''' Checks the Zobrist hashes and the transposition tables, local and shared, the
+    search keeps by them. '''
+
+    INITIAL = chessboard.BoardState(*chessboard.INITIAL_STATE)
+    TABLES = (transposition.TranspositionTable, transposition.SharedTranspositionTable)
+    MOVE = chessboard.encode_move(chessboard.Move(85, 65, ""))
+
+    def test_hash(self):
+        # castling, a pawn taken en passant, and a promotion with capture
+        line = ["e2e4", "a7a6", "e4e5", "d7d5", "e5d6", "g8f6", "d6c7", "e7e6",
+                "c7b8q", "f8e7", "g1f3", "e8g8", "f1e2", "a8b8", "e1g1"]
+        for state in play(self.INITIAL, *line):
+            # kept up to date by every move, as it would be computed from scratch
+            self.assertEqual(state.hash, chessboard.zobrist(state.board, state.ac, state.cr, state.ep, state.kp))
+            # and the same for the board seen by either side
+            self.assertEqual(state.rotate().hash, state.hash)
+            self.assertNotEqual(state.rotate(nullmove = True).hash, state.hash)
+        # the same position reached by other moves has the same hash
+        first = play(self.INITIAL, "g1f3", "g8f6", "b1c3")[-1]
+        second = play(self.INITIAL, "b1c3", "g8f6", "g1f3")[-1]
+        self.assertEqual(first.hash, second.hash)
+        self.assertEqual(play(self.INITIAL, "g1f3", "g8f6", "f3g1", "f6g8")[-1].hash, self.INITIAL.hash)
+        # but not with the castling rights changed
+        self.assertNotEqual(play(self.INITIAL, "g1f3", "g8f6", "h1g1", "f6g8", "g1h1", "g8f6")[-1].hash,
+                            play(self.INITIAL, "g1f3", "g8f6")[-1].hash)
+
+    def test_store_and_probe(self):
+        for table_class in self.TABLES:
+            with self.subTest(table = table_class.__name__):
+                table = table_class(1)
+                key = 0x123456789ABCDEF
+                self.assertIsNone(table.probe(key))
+                table.store(key, 5, -250, transposition.EXACT, self.MOVE)
+                entry = table.probe(key)
+                self.assertEqual((entry.key, entry.depth, entry.score, entry.bound, entry.move),
+                                 (key, 5, -250, transposition.EXACT, self.MOVE))
+                # another key of the same slot doesn't match the entry
+                self.assertIsNone(table.probe(key + table.mask + 1))
+                table.clear()
+                self.assertIsNone(table.probe(key))
+
+    def test_bounds(self):
+        for table_class in self.TABLES:
+            with self.subTest(table = table_class.__name__):
+                table = table_class(1)
+                table.store(42, 6, 120, transposition.LOWER, self.MOVE)
+                self.assertEqual(table.probe(42).bound, transposition.LOWER)
+                # a shallower result for the same position of the same search, such as
+                # one of the quiescence search, doesn't replace it
+                table.store(42, 0, -80, transposition.UPPER, None)
+                entry = table.probe(42)
+                self.assertEqual((entry.depth, entry.score, entry.bound, entry.move),
+                                 (6, 120, transposition.LOWER, self.MOVE))
+                # one as deep does, keeping the best move if it found none
+                table.store(42, 6, -80, transposition.UPPER, None)
+                entry = table.probe(42)
+                self.assertEqual((entry.depth, entry.score, entry.bound, entry.move),
+                                 (6, -80, transposition.UPPER, self.MOVE))
+                # as does any result of a later search
+                table.new_search()
+                table.store(42, 2, 50, transposition.EXACT, None)
+                entry = table.probe(42)
+                self.assertEqual((entry.depth, entry.score, entry.bound, entry.move),
+                                 (2, 50, transposition.EXACT, self.MOVE))
+
+    def test_replacement(self):
+        for table_class in self.TABLES:
+            with self.subTest(table = table_class.__name__):
+                table = table_class(1)
+                key, other = 7, 7 + table.mask + 1
+                table.store(key, 6, 10, transposition.EXACT, self.MOVE)
+                # a shallower result of the same search doesn't replace a deeper one
+                table.store(other, 4, 20, transposition.EXACT, None)
+                self.assertIsNotNone(table.probe(key))
+                self.assertIsNone(table.probe(other))
+                # a deeper one does
+                table.store(other, 8, 20, transposition.EXACT, None)
+                self.assertIsNone(table.probe(key))
+                self.assertEqual(table.probe(other).depth, 8)
+                # as does any result of a later search
+                table.new_search()
+                table.store(key, 1, 10, transposition.EXACT, None)
+                self.assertIsNone(table.probe(other))
+                self.assertEqual(table.probe(key).depth, 1)
+
+    def test_resize(self):
+        for table_class in self.TABLES:
+            with self.subTest(table = table_class.__name__):
+                table = table_class(1)
+                table.store(42, 6, 120, transposition.LOWER, self.MOVE)
+                for size in (2, 1):
+                    table.resize(size)
+                    # the largest power of two of slots that fits in the size
+                    slots = table.mask + 1
+                    self.assertEqual(slots & table.mask, 0)
+                    self.assertLessEqual(slots * table.ENTRY_SIZE, size * 1024 * 1024)
+                    self.assertGreater(2 * slots * table.ENTRY_SIZE, size * 1024 * 1024)
+                    # and empty
+                    self.assertIsNone(table.probe(42))
+                    table.store(42, 6, 120, transposition.LOWER, self.MOVE)
+                    self.assertEqual(table.probe(42).score, 120)
+
+    def test_cutoffs(self):
+        # a position inside the search, as the root only searches the legal moves
+        engine = bot.Bot(1)
+        pos = bot.BACKENDS[engine.backend](self.INITIAL)
+        pos.make_move(parse_move(self.INITIAL, "e2e4"))
+        # a bound searched deep enough decides the search at once
+        engine.tt.store(pos.hash, 5, 300, transposition.LOWER, None)
+        self.assertEqual(engine.alphabeta(pos, 200, 3), 300)
+        self.assertEqual(engine.nodes, 1)
+        engine.tt.store(pos.hash, 5, -300, transposition.UPPER, None)
+        self.assertEqual(engine.alphabeta(pos, 0, 3), -300)
+        self.assertEqual(engine.nodes, 2)
+        # one that doesn't decide it, or from a shallower search, is searched again
+        for depth, g in ((5, -400), (2, 0)):
+            engine = bot.Bot(1)
+            engine.tt.store(pos.hash, depth, -300, transposition.UPPER, None)
+            self.assertNotEqual(engine.alphabeta(pos, g, 3), -300)
+            self.assertGreater(engine.nodes + engine.qnodes, 1)
+
+class MakeUnmakeTest(unittest.TestCase):
+    ''' Checks that the positions the search changes in place follow BoardState.move
+    and are restored by taking the moves back. '''
+
+    INITIAL = chessboard.BoardState(*chessboard.INITIAL_STATE)
+    PLIES = 40      # length of each random line
+    LINES = 20      # random lines played
+
+    # the search positions of each backend, built from a board state
+    POSITIONS = {
+        "mailbox":  chessboard.SearchPosition,
+        "string":   chessboard.StateStack,
+        "bitboard": lambda state: chessboard.StateStack(bitboard.BitBoardState.from_state(state)),
+    }
+
+    def check_line(self, states, moves, **names):
+        ''' Plays the moves on each backend, checking it against the states BoardState.move
+        went through, then takes them back. '''
+        for backend, make in self.POSITIONS.items():
+            with self.subTest(backend = backend, **names):
+                pos = make(states[0])
+                for move, state in zip(moves, states[1:]):
+                    pos.make_move(move)
+                    self.assertEqual(chessboard.BoardState.from_state(pos.state()), state)
+                for state in reversed(states[:-1]):
+                    pos.unmake_move()
+                    self.assertEqual(chessboard.BoardState.from_state(pos.state()), state)
+
+    def test_random_lines(self):
+        rng = random.Random(0)
+        for line in range(self.LINES):
+            states = [self.INITIAL]
+            moves = []
+            for _ in range(self.PLIES):
+                # any move the search could make, short of taking the king
+                choices = [move for move in states[-1].generate_moves() if states[-1].board[move.end] != "k"]
+                if not choices:
+                    break
+                moves.append(rng.choice(choices))
+                states.append(states[-1].move(moves[-1]))
+            self.check_line(states, moves, line = line)
+
+    def test_special_moves(self):
+        # a pawn taken en passant, a promotion with capture and castling for both sides
+        line = ["e2e4", "a7a6", "e4e5", "d7d5", "e5d6", "g8f6", "d6c7", "e7e6",
+                "c7b8q", "f8e7", "g1f3", "e8g8", "f1e2", "a8b8", "e1g1"]
+        states = play(self.INITIAL, *line)
+        self.check_line(states, [parse_move(state, uci) for state, uci in zip(states, line)])
+
+    def test_null_move(self):
+        for state in play(self.INITIAL, "e2e4", "d7d5"):
+            passed = state.rotate(nullmove = True)
+            for backend, make in self.POSITIONS.items():
+                with self.subTest(backend = backend):
+                    pos = make(state)
+                    pos.make_null()
+                    self.assertEqual(chessboard.BoardState.from_state(pos.state()), passed)
+                    pos.unmake_null()
+                    self.assertEqual(chessboard.BoardState.from_state(pos.state()), state)
+
+    def test_rotate(self):
+        # the board seen by the other side, with or without passing the turn, through
+        # en passant and king passant squares
+        line = ["e2e4", "d7d5", "g1f3", "g8f6", "f1c4", "e7e6", "e1g1"]
+        for state in play(self.INITIAL, *line):
+            for nullmove in (False, True):
+                with self.subTest(fen = state.to_fen(), nullmove = nullmove):
+                    rotated = bitboard.BitBoardState.from_state(state).rotate(nullmove = nullmove)
+                    self.assertEqual(chessboard.BoardState.from_state(rotated), state.rotate(nullmove = nullmove))
+            # and back again
+            self.assertEqual(bitboard.BitBoardState.from_state(state).rotate().rotate(),
+                             bitboard.BitBoardState.from_state(state))
+
+class FenTest(unittest.TestCase):
+    ''' Checks the FEN and EPD parsers and the FEN they write back. '''
+
+    def test_round_trip(self):
+        fens = [
+            "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq e6 0 2",
+            "rnbqkbnr/pppp1ppp/8/8/3Pp3/8/PPP1PPPP/RNBQKBNR b Kq d3 0 3",
+            "r3k2r/8/8/8/8/8/8/R3K2R b Qk - 37 61",
+            "8/8/8/8/8/8/8/K6k w - - 99 120",
+        ] + [fen for fen, _ in perft.SUITE.values()]
+        for fen in fens:
+            with self.subTest(fen = fen):
+                state = chessboard.BoardState.from_fen(fen)
+                self.assertEqual(state.to_fen(), fen)
+                self.assertEqual(chessboard.BoardState.from_fen(state.to_fen()), state)
+                # and from any backend
+                self.assertEqual(chessboard.to_fen(bitboard.BitBoardState.from_state(state)), fen)
+
+    def test_moves(self):
+        # the state a move leads to is the one its FEN is parsed into
+        state = play(chessboard.BoardState.from_fen(chessboard.STARTING_FEN), "e2e4")[-1]
+        self.assertEqual(state.to_fen(), "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1")
+        self.assertEqual(chessboard.BoardState.from_fen(state.to_fen()), state)
+        # the fullmove number goes up after the move of black
+        states = play(chessboard.BoardState.from_fen("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 5 17"), "e1g1", "e8c8")
+        self.assertEqual([state.to_fen() for state in states[1:]],
+                         ["r3k2r/8/8/8/8/8/8/R4RK1 b kq - 6 17", "2kr3r/8/8/8/8/8/8/R4RK1 w - - 7 18"])
+        # as it does on every backend
+        self.assertEqual(chessboard.to_fen(play(bitboard.BitBoardState.from_state(states[0]), "e1g1", "e8c8")[-1]),
+                         states[-1].to_fen())
+
+    def test_optional_clocks(self):
+        state = chessboard.BoardState.from_fen("4k3/8/8/8/8/8/8/4K3 b - -")
+        self.assertEqual((state.clock, state.fullmove), (0, 1))
+        self.assertEqual(state.to_fen(), "4k3/8/8/8/8/8/8/4K3 b - - 0 1")
+
+    def test_epd(self):
+        state, operations = chessboard.BoardState.from_epd(
+            "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - "
+            'bm Bb5 Bc4; am Nxe5; id "opening; 1"; hmvc 2; fmvn 3;')
+        self.assertEqual(state.to_fen(), "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3")
+        self.assertEqual(operations["bm"], [parse_move(state, "f1b5"), parse_move(state, "f1c4")])
+        self.assertEqual(operations["am"], [parse_move(state, "f3e5")])
+        # quoted operands may hold semicolons
+        self.assertEqual(operations["id"], "opening; 1")
+        self.assertEqual(operations["hmvc"], "2")
+        # a position without operations
+        state, operations = chessboard.BoardState.from_epd("4k3/8/8/8/8/8/8/4K3 w - -")
+        self.assertEqual((state.clock, state.fullmove, operations), (0, 1, {}))
+
+    def test_malformed(self):
+        fens = [
+            "",
+            "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq",
+            "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1",
+            "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP w KQkq - 0 1",
+            "rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+            "rnbqkbnr/ppppxppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+            "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQxq - 0 1",
+            "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq e5 0 1",
+            "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - x 1",
+            "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 x",
+        ]
+        for fen in fens:
+            with self.subTest(fen = fen):
+                with self.assertRaises(ValueError):
+                    chessboard.BoardState.from_fen(fen)
+        # a move the position doesn't have, and malformed clocks
+        epds = [
+            "4k3/8/8/8/8/8/8/4K3 w - - bm Qd1;",
+            "4k3/8/8/8/8/8/8/4K3 w - - hmvc x;",
+            "4k3/8/8/8/8/8/8/4K3 w - - fmvn x;",
+        ]
+        for epd in epds:
+            with self.subTest(epd = epd):
+                with self.assertRaises(ValueError):
+                    chessboard.BoardState.from_epd(epd)
+
+class PerftTest(unittest.TestCase):
+    ''' Checks the move generator against the known node counts of standard positions. '''
+
+    MAX_NODES = 10000   # deepest count checked for each position, to keep the tests quick
+
+    def test_suite(self):
+        for name, (fen, expected) in perft.SUITE.items():
+            state = perft.BoardState.from_fen(fen)
+            for depth, count in enumerate(expected, 1):
+                if count > self.MAX_NODES:
+                    break
+                with self.subTest(position = name, depth = depth):
+                    self.assertEqual(perft.perft(state, depth), count)
+
+    def test_bitboard(self):
+        for name, (fen, expected) in perft.SUITE.items():
+            state = perft.BACKENDS["bitboard"](perft.BoardState.from_fen(fen))
+            with self.subTest(position = name):
+                self.assertEqual(perft.perft(state, 2), expected[1])
+
+    def test_divide(self):
+        fen, expected = perft.SUITE["kiwipete"]
+        counts = perft.divide(perft.BoardState.from_fen(fen), 2)
+        self.assertEqual(len(counts), expected[0])
+        self.assertEqual(sum(counts.values()), expected[1])
+        # castling both ways is available
+        self.assertIn("e1g1", counts)
+        self.assertIn("e1c1", counts)
+
+    def test_hash_table(self):
+        fen, expected = perft.SUITE["en passant"]
+        state = perft.BoardState.from_fen(fen)
+        table = {}
+        self.assertEqual(perft.perft(state, 3, table), expected[2])
+        # a second count is read from the table
+        self.assertEqual(perft.perft(state, 3, table), expected[2])
+
+    def test_castling_through_check(self):
+        # the rook on f8 attacks f1, so white can only castle queenside
+        state = perft.BoardState.from_fen("5r1k/8/8/8/8/8/8/R3K2R w KQ - 0 1")
+        moves = perft.divide(state, 1)
+        self.assertIn("e1c1", moves)
+        self.assertNotIn("e1g1", moves)
+        # and not at all out of check
+        state = perft.BoardState.from_fen("4r2k/8/8/8/8/8/8/R3K2R w KQ - 0 1")
+        moves = perft.divide(state, 1)
+        self.assertNotIn("e1c1", moves)
+        self.assertNotIn("e1g1", moves)
+
+    def test_checks_and_pins(self):
+        # the bishop is pinned along the file, so only the king can move
+        state = perft.BoardState.from_fen("4k3/4r3/8/8/8/8/4B3/4K3 w - - 0 1")
+        self.assertFalse(state.in_check())
+        self.assertEqual(sorted(perft.divide(state, 1)), ["e1d1", "e1d2", "e1f1", "e1f2"])
+        # checkmate and stalemate both leave no moves, only one of them in check
+        state = perft.BoardState.from_fen("R6k/6pp/8/8/8/8/8/6K1 b - - 0 1")
+        self.assertEqual(state.legal_moves(), [])
+        self.assertTrue(state.in_check())
+        state = perft.BoardState.from_fen("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1")
+        self.assertEqual(state.legal_moves(), [])
+        self.assertFalse(state.in_check())
+
+    def test_halfmove_clock(self):
+        state = perft.BoardState.from_fen("4k3/4p3/8/8/8/8/8/4K2R w K - 12 40")
+        self.assertEqual(state.clock, 12)
+        # a rook move counts, a pawn move starts the count again
+        state = state.move(chessboard.Move(98, 88, ""))
+        self.assertEqual(state.to_fen(), "4k3/4p3/8/8/8/8/7R/4K3 b - - 13 40")
+        moves = {perft.to_uci(move, state.ac): move for move in state.legal_moves()}
+        self.assertEqual(state.move(moves["e7e5"]).clock, 0)
+
+class EvaluationTest(unittest.TestCase):
+    ''' Checks the tapered evaluation and its caches. '''
+
+    def test_evaluation(self):
+        evaluator = evaluation.Evaluator()
+        for name, (fen, _) in perft.SUITE.items():
+            state = perft.BoardState.from_fen(fen)
+            # the score for one side is minus the score for the other
+            with self.subTest(position = name):
+                self.assertEqual(evaluator.evaluate(state), -evaluator.evaluate(state.rotate(nullmove = True)))
+        # the pawns of the position were scored for the other side to move
+        self.assertEqual(evaluator.pawn_hits, len(perft.SUITE))
+        # a passed pawn is worth more the fewer pieces are left
+        passed = evaluation.pawn_structure([34], [])
+        self.assertGreater(passed[1], passed[0])
+
+class BatchTest(unittest.TestCase):
+    ''' Checks that the NumPy batch evaluation scores as the scalar one does. '''
+
+    @unittest.skipUnless(batch, "needs NumPy")
+    def test_batch(self):
+        # the positions of the suite and those a move after them
+        states = []
+        for fen, _ in perft.SUITE.values():
+            state = perft.BoardState.from_fen(fen)
+            states += [state] + [state.move(move) for move in state.legal_moves()]
+        scores = batch.evaluate([state.board for state in states])
+        for state, score in zip(states, scores):
+            self.assertEqual(score, evaluation.Evaluator().evaluate(state))
+            codes = []
+            state.generate_codes(codes)
+            expected = [state.points(chessboard.decode_move(code)) for code in codes]
+            self.assertEqual(batch.points(state.board, state.ep, state.kp, codes).tolist(), expected)
+
+class ServerTest(unittest.TestCase):
+    ''' Checks the analysis server, with a client standing in for the tools that call it. '''
+
+    def test_server(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        # one worker and room for one request in the queue
+        engine = server.Server(workers = 1, hash_size = 1, queue_size = 1)
+        await engine.start()
+        await engine.listen(port = 0)
+        client = await server.Client.connect(port = engine.servers[0].sockets[0].getsockname()[1])
+        try:
+            reply = await client.request("bestmove", moves = ["e2e4"], depth = 2, book = False)
+            self.assertEqual((reply["type"], reply["depth"]), ("result", 2))
+            self.assertIn(reply["move"], perft.divide(server.position(None, ["e2e4"])[0], 1))
+            infos = []
+            reply = await client.request("analyse", depth = 3, info = infos.append)
+            self.assertEqual([info["depth"] for info in infos], [1, 2, 3])
+            reply = await client.request("analyse", moves = ["e2e5"])
+            self.assertEqual(reply["error"], "illegal move e2e5")
+
+            # a search taking the worker, one waiting and one refused
+            started = asyncio.Event()
+            running = asyncio.create_task(client.request("analyse", id = "running", time = 30, info = lambda _: started.set()))
+            await started.wait()
+            waiting = asyncio.create_task(client.request("analyse", id = "waiting", depth = 2))
+            await asyncio.sleep(0.1)
+            reply = await client.request("analyse", depth = 2)
+            self.assertEqual(reply["error"], "busy")
+            await client.cancel("running")
+            reply = await running
+            self.assertTrue(reply["cancelled"])
+            self.assertIsNotNone(reply["move"])
+            self.assertEqual((await waiting)["depth"], 2)
+
+            metrics = await client.request("metrics")
+            self.assertEqual((metrics["completed"], metrics["rejected"], metrics["cancelled"]), (4, 1, 1))
+        finally:
+            await client.close()
+            await engine.close()
+
+class SeeTest(unittest.TestCase):
+    ''' Checks the static exchange evaluation of captures, which orders and prunes them. '''
+
+    def see(self, fen, uci_move):
+        state = perft.BoardState.from_fen(fen)
+        move = {perft.to_uci(move, state.ac): move for move in state.legal_moves()}[uci_move]
+        return chessboard.see(state.board, state.ep, move)
+
+    def test_undefended(self):
+        self.assertEqual(self.see("4k3/8/8/4n3/3P4/8/8/4K3 w - - 0 1", "d4e5"), 280)
+        self.assertEqual(self.see("1k1r4/1pp4p/p7/4p3/8/P5P1/1PP4P/2K1R3 w - - 0 1", "e1e5"), 100)
+
+    def test_en_passant(self):
+        self.assertEqual(self.see("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 1", "e5d6"), 100)
+
+    def test_defended(self):
+        self.assertEqual(self.see("4k3/8/3p4/4p3/8/8/8/4R1K1 w - - 0 1", "e1e5"), -379)
+        self.assertEqual(self.see("4k3/8/2p5/3p4/8/1B6/8/Q3K3 w - - 0 1", "b3d5"), -220)
+
+    def test_exchanges(self):
+        # the rooks trade on d5, the second rook backing the first up from behind
+        self.assertEqual(self.see("3r2k1/8/8/3p4/8/8/3R4/3RK3 w - - 0 1", "d2d5"), 100)
+        # the knight is taken by the pawn, and the exchange is over before it starts
+        self.assertEqual(self.see("1k1r3q/1ppn3p/p4b2/4p3/8/P2N2P1/1PP1R1BP/2K1Q3 w - - 0 1", "d3e5"), -180)
+
+class SearchTest(unittest.TestCase):
+    ''' Checks the scores and moves the search finds. '''
+
+    def test_pruned_moves_are_not_mate(self):
+        # in check, the only legal move loses material, so it is passed over at shallow
+        # depths and the position must not be scored as mate
+        state = perft.BoardState.from_fen("8/2p5/1q6/1K5N/8/k7/8/8 w - - 10 1")
+        for depth in (1, 2):
+            engine = bot.Bot()
+            for _ in engine.search(state, depth_limit = depth):
+                pass
+            with self.subTest(depth = depth):
+                self.assertGreater(engine.result[1], -bot.MATE_LOWER_BOUND)
+                self.assertEqual(perft.to_uci(engine.result[2], state.ac), "b5c4")
+
+if __name__ == "__main__":
+    unittest.main()